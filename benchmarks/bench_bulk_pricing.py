@@ -0,0 +1,57 @@
+"""
+Benchmark for BulkCostEngine re-pricing of historical usage
+
+Prices N synthetic usage rows with the vectorized engine and compares it
+with calling CostCalculator.calculate_cost once per row (measured on a
+sample and extrapolated). Run from the repository root:
+
+    python -m benchmarks.bench_bulk_pricing --rows 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.core.bulk_pricing import BulkCostEngine
+from src.core.cost_calculator import CostCalculator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--loop-sample", type=int, default=200_000)
+    args = parser.parse_args()
+
+    models = ["gpt-4o", "gpt-4o-mini", "gpt-4-turbo", "gpt-3.5-turbo", "claude-3-5-sonnet-20241022"]
+    rng = np.random.default_rng(0)
+    input_tokens = rng.integers(1, 8000, size=args.rows, dtype=np.int64)
+    output_tokens = rng.integers(0, 2000, size=args.rows, dtype=np.int64)
+    model_ids = rng.integers(0, len(models), size=args.rows, dtype=np.uint32)
+    engine = BulkCostEngine()
+
+    started = time.perf_counter()
+    costs = engine.price(input_tokens, output_tokens, model_ids, models)
+    totals = engine.group_totals(costs, model_ids, models)
+    vectorized = time.perf_counter() - started
+
+    started = time.perf_counter()
+    what_if = engine.price(input_tokens, output_tokens, model_ids, models, as_model="gpt-4o-mini")
+    what_if_elapsed = time.perf_counter() - started
+
+    sample = min(args.loop_sample, args.rows)
+    started = time.perf_counter()
+    for i in range(sample):
+        CostCalculator.calculate_cost("openai", int(input_tokens[i]), int(output_tokens[i]),
+                                      model=models[model_ids[i]])
+    loop = (time.perf_counter() - started) * args.rows / sample
+
+    print(f"rows:                  {args.rows:,}")
+    print(f"vectorized + group-by: {vectorized:.3f}s")
+    print(f"what-if (gpt-4o-mini): {what_if_elapsed:.3f}s  total ${what_if.sum():,.2f}")
+    print(f"per-row loop (est.):   {loop:.1f}s  ({loop / vectorized:,.0f}x slower)")
+    for model, cost in totals.items():
+        print(f"  {model:<28} ${cost:,.2f}")
+
+
+if __name__ == "__main__":
+    main()
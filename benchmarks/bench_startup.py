@@ -0,0 +1,115 @@
+"""
+Cold-start benchmark for provider imports and construction
+
+Each measurement runs in a fresh interpreter, the way a serverless worker
+starts. Import time is the median over several runs. Construction time is
+the average over many provider instances. First-use time covers the
+deferred work: building the SDK client and loading the encoding. Run from
+the repository root:
+
+    python -m benchmarks.bench_startup --runs 5 --max-import-ms 150
+
+With --max-import-ms the script exits non-zero when any import exceeds the
+budget, or when an import or constructor pulls in an SDK or tiktoken
+eagerly, so it can guard CI against regressions.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules whose eager import dominated cold starts
+HEAVY_MODULES = ("openai", "anthropic", "tiktoken")
+
+IMPORTS = [
+    "src.providers.openai",
+    "src.providers.openai.chat",
+    "src.providers.openai.embeddings",
+    "src.providers.anthropic_provider",
+    "src.providers.router"
+]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+CONSTRUCT_PROBE = """
+import json, sys, time
+from src.providers.openai.chat import ChatProvider
+from src.providers.openai.embeddings import EmbeddingProvider
+from src.providers.anthropic_provider import AnthropicProvider
+
+factories = {{
+    "ChatProvider": lambda: ChatProvider(api_key="bench", model="gpt-4o"),
+    "EmbeddingProvider": lambda: EmbeddingProvider(api_key="bench"),
+    "AnthropicProvider": lambda: AnthropicProvider(api_key="bench", model="claude-3-5-haiku-20241022")
+}}
+result = {{}}
+for name, factory in factories.items():
+    started = time.perf_counter()
+    for _ in range({instances}):
+        factory()
+    result[name] = (time.perf_counter() - started) / {instances}
+loaded = [m for m in {heavy!r} if m in sys.modules]
+
+provider = ChatProvider(api_key="bench", model="gpt-4o")
+started = time.perf_counter()
+provider.async_client
+first_client = time.perf_counter() - started
+try:
+    started = time.perf_counter()
+    provider.encoding
+    first_encoding = time.perf_counter() - started
+except Exception:
+    # Loading a BPE file may need network access
+    first_encoding = None
+print(json.dumps({{"construct": result, "loaded": loaded,
+                   "first_client": first_client, "first_encoding": first_encoding}}))
+"""
+
+
+def probe(code: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--instances", type=int, default=1000)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'import':<36} {'median':>10}  eager heavy modules")
+    for module in IMPORTS:
+        samples = [probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)) for _ in range(args.runs)]
+        median = statistics.median(sample["seconds"] for sample in samples) * 1000
+        loaded = samples[-1]["loaded"]
+        print(f"{module:<36} {median:>8.1f}ms  {', '.join(loaded) or '-'}")
+        if args.max_import_ms is not None and (median > args.max_import_ms or loaded):
+            failures.append(module)
+
+    construction = probe(CONSTRUCT_PROBE.format(instances=args.instances, heavy=HEAVY_MODULES))
+    print()
+    for name, seconds in construction["construct"].items():
+        print(f"construct {name:<26} {seconds * 1e6:>8.1f}us")
+    print(f"first async_client access            {construction['first_client'] * 1000:>8.1f}ms")
+    if construction["first_encoding"] is not None:
+        print(f"first encoding access                {construction['first_encoding'] * 1000:>8.1f}ms")
+    print(f"eager heavy modules after construction: {', '.join(construction['loaded']) or '-'}")
+    if args.max_import_ms is not None and construction["loaded"]:
+        failures.append("construction")
+
+    if failures:
+        print(f"\nregressions: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
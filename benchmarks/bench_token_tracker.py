@@ -0,0 +1,74 @@
+"""
+Stress benchmark for TokenTracker under concurrent writers
+
+Compares a plain TokenTracker guarded by one global lock against the
+sharded ConcurrentTokenTracker for an increasing number of worker threads.
+Run from the repository root:
+
+    python -m benchmarks.bench_token_tracker --calls 200000
+
+On a GIL build throughput is capped by the interpreter lock; on a
+free-threaded build the sharded tracker should scale with worker threads
+while the global-lock baseline flattens out.
+"""
+import argparse
+import os
+import threading
+import time
+
+from src.core.token_tracker import ConcurrentTokenTracker, TokenTracker
+
+
+class GlobalLockTracker:
+    def __init__(self):
+        self._tracker = TokenTracker()
+        self._lock = threading.Lock()
+
+    def track_tokens(self, provider, input_tokens, output_tokens, model=None):
+        with self._lock:
+            self._tracker.track_tokens(provider, input_tokens, output_tokens, model)
+
+    def get_total_tokens(self):
+        with self._lock:
+            return self._tracker.get_total_tokens()
+
+
+def run(tracker, workers: int, calls: int) -> float:
+    per_worker = calls // workers
+    barrier = threading.Barrier(workers + 1)
+
+    def work():
+        barrier.wait()
+        for _ in range(per_worker):
+            tracker.track_tokens("OpenAI", 120, 30, "gpt-4o-mini")
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    assert tracker.get_total_tokens() == per_worker * workers * 150
+    return per_worker * workers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'global lock ops/s':>18} {'sharded ops/s':>15} {'speedup':>8}")
+    workers = 1
+    while workers <= args.max_workers:
+        baseline = run(GlobalLockTracker(), workers, args.calls)
+        sharded = run(ConcurrentTokenTracker(num_shards=max(16, workers)), workers, args.calls)
+        print(f"{workers:>8} {baseline:>18,.0f} {sharded:>15,.0f} {sharded / baseline:>8.2f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,23 @@
 import asyncio
-from src.providers.openai_provider import OpenAIProvider
+from src.providers.openai.openai_provider import OpenAIProvider
 from src.providers.anthropic_provider import AnthropicProvider
 from src.utils.config import Config
 
-def main():
+async def main():
     # Load configuration
     config = Config()
 
     # Initialize providers
     openai_provider = OpenAIProvider(
-        api_key=config.openai_api_key, 
-        model="gpt-3.5-turbo"
+        api_key=config.openai_api_key,
+        model="gpt-3.5-turbo",
+        max_concurrency=4
     )
-    
+
     anthropic_provider = AnthropicProvider(
         api_key=config.anthropic_api_key,
-        model="claude-2"
+        model="claude-3-5-haiku-20241022",
+        max_concurrency=4
     )
 
     # Example prompts
@@ -24,23 +26,20 @@ def main():
         "Describe the future of artificial intelligence"
     ]
 
-    # Demonstrate provider usage
-    for prompt in prompts:
-        print(f"\nPrompt: {prompt}\n")
-        
-        # OpenAI Response
-        openai_response = openai_provider.generate(prompt)
-        print("OpenAI Response:")
-        print(f"Generated Text: {openai_response.response}")
-        print(f"Total Cost: ${openai_response.cost}")
-        print(f"Total Tokens: {openai_response.total_tokens}")
+    # Fan out to both providers concurrently
+    responses = await asyncio.gather(*(
+        provider.generate(prompt)
+        for prompt in prompts
+        for provider in (openai_provider, anthropic_provider)
+    ))
 
-        # Anthropic Response
-        anthropic_response = anthropic_provider.generate(prompt)
-        print("\nAnthropic Response:")
-        print(f"Generated Text: {anthropic_response.response}")
-        print(f"Total Cost: ${anthropic_response.cost}")
-        print(f"Total Tokens: {anthropic_response.total_tokens}")
+    # Demonstrate provider usage
+    for response in responses:
+        print(f"\nPrompt: {response.prompt}\n")
+        print(f"{response.provider} Response:")
+        print(f"Generated Text: {response.response}")
+        print(f"Total Cost: ${response.cost}")
+        print(f"Total Tokens: {response.total_tokens}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
@@ -11,6 +11,10 @@ setup(
         'python-dotenv',
         'tiktoken'
     ],
+    extras_require={
+        'bulk': ['numpy'],
+        'embeddings': ['numpy']
+    },
     author="coTe",
     description="AI Model Gateway and Usage Tracking Platform",
     long_description=open('README.md').read() if open('README.md').read() else '',
@@ -0,0 +1,293 @@
+"""
+Resumable batch runner for JSONL request files
+
+Each input line is a JSON object with an optional "id", the request body
+("messages" or "prompt" for chat/Anthropic, "input" for embeddings) and
+optional "params" passed to generate. Results are appended to the output
+file as JSONL in completion order, one record per attempted input line.
+
+Progress is checkpointed as a watermark (every line below it is finished)
+plus the set of finished lines above it and the output size at save time,
+so a crashed run picks up where it stopped without re-sending finished
+lines or re-reading the results already covered. Failed lines are checkpointed
+separately and retried by the next run, which appends a fresh record:
+
+    python -m src.batch_runner requests.jsonl results.jsonl --provider chat --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from src.providers.base_provider import BaseProvider
+from src.providers.batch import BatchRun, BatchSummary
+from src.utils.config import Config
+
+class Checkpoint:
+    def __init__(self, path: str):
+        """
+        Watermark plus done-set record of finished input lines
+
+        Failed lines count as finished for the watermark but are kept in a
+        failed set, and are not done until a later attempt succeeds.
+        output_offset is the fsynced output size the checkpoint covers.
+
+        :param path: Checkpoint file path (created on first save)
+        """
+        self.path = path
+        self.watermark = 0
+        self.done: Set[int] = set()
+        self.failed: Set[int] = set()
+        self.output_offset = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as checkpoint_file:
+                state = json.load(checkpoint_file)
+            self.watermark = state["watermark"]
+            self.done = set(state["done"])
+            self.failed = set(state.get("failed", []))
+            # Checkpoints written without an offset recover from the start
+            self.output_offset = state.get("output_offset", 0)
+
+    def is_done(self, line: int) -> bool:
+        return (line < self.watermark or line in self.done) and line not in self.failed
+
+    def mark(self, line: int, failed: bool = False):
+        """
+        Record a finished line, advancing the watermark over contiguous lines
+
+        :param line: Zero-based input line number
+        :param failed: Whether the line failed (it is retried on the next run)
+        """
+        if failed:
+            self.failed.add(line)
+        else:
+            self.failed.discard(line)
+        if line < self.watermark:
+            # A retried line the watermark already passed
+            return
+        self.done.add(line)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def recover(self, output_path: str):
+        """
+        Mark lines whose records already reached the output file
+
+        Covers a crash between writing results and saving the checkpoint,
+        which would otherwise re-run those lines and append duplicates.
+        Only records after output_offset are read, so a resume costs the
+        results written since the last save, not the whole output. Error
+        records mark their line failed, so it is still retried. A torn
+        final record is cut off so the next append starts on a fresh line
+        (its request is re-run).
+
+        :param output_path: Output JSONL path
+        """
+        if not os.path.exists(output_path):
+            return
+        valid_end = self.output_offset
+        if os.path.getsize(output_path) < valid_end:
+            # Output shrank behind the checkpoint's back; rescan all of it
+            valid_end = 0
+        with open(output_path, "rb+") as output_file:
+            output_file.seek(valid_end)
+            for raw in output_file:
+                if not raw.endswith(b"\n"):
+                    break
+                valid_end += len(raw)
+                try:
+                    record = json.loads(raw)
+                    line = record.get("line")
+                except (ValueError, AttributeError):
+                    continue
+                if isinstance(line, int) and not self.is_done(line):
+                    self.mark(line, failed="error" in record)
+            output_file.truncate(valid_end)
+        self.output_offset = valid_end
+
+    def save(self, output_offset: Optional[int] = None):
+        """
+        Atomically persist the checkpoint
+
+        :param output_offset: Output size fsynced before this save (unchanged if None)
+        """
+        if output_offset is not None:
+            self.output_offset = output_offset
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as checkpoint_file:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done),
+                       "failed": sorted(self.failed), "output_offset": self.output_offset},
+                      checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary, self.path)
+
+def iter_requests(path: str, checkpoint: Checkpoint) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Stream unfinished requests from a JSONL file
+
+    Blank and already finished lines are marked done and skipped; lines
+    that are not a JSON object are yielded with a None request.
+
+    :param path: Input JSONL path
+    :param checkpoint: Checkpoint used to skip finished lines
+    :return: Iterator of (line number, request)
+    """
+    with open(path, encoding="utf-8") as input_file:
+        for line_number, line in enumerate(input_file):
+            if checkpoint.is_done(line_number):
+                continue
+            if not line.strip():
+                checkpoint.mark(line_number)
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                request = None
+            # Reported as a failed line rather than aborting the run
+            yield line_number, request if isinstance(request, dict) else None
+
+class BatchRunner:
+    def __init__(self,
+                 provider: BaseProvider,
+                 concurrency: int = 16,
+                 checkpoint_every: int = 100,
+                 params: Optional[Dict[str, Any]] = None):
+        """
+        Run a JSONL request file through a provider
+
+        :param provider: Provider whose generate handles each request
+        :param concurrency: Maximum requests in flight
+        :param checkpoint_every: Completed lines between checkpoint saves
+        :param params: Default generation parameters (per-line params take precedence)
+        """
+        self.provider = provider
+        self.params = dict(params or {})
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+
+    async def _dispatch(self, item: Tuple[int, Dict[str, Any]]):
+        _, request = item
+        if request is None:
+            raise ValueError("Line is not a JSON object")
+        body = request.get("messages", request.get("prompt", request.get("input")))
+        if body is None:
+            raise ValueError("Request needs one of 'messages', 'prompt' or 'input'")
+        return await self.provider.generate(body, **{**self.params, **request.get("params", {})})
+
+    async def run(self,
+                  input_path: str,
+                  output_path: str,
+                  checkpoint_path: Optional[str] = None) -> BatchSummary:
+        """
+        Process every unfinished line of input_path
+
+        Results are fsynced before each checkpoint save; lines written after
+        the last save are recovered from the output file, so a resume
+        neither re-sends nor duplicates them. Lines that failed in an
+        earlier run are sent again.
+
+        :param input_path: Input JSONL path
+        :param output_path: Output JSONL path (appended to)
+        :param checkpoint_path: Checkpoint path (defaults to output_path + ".checkpoint")
+        :return: Summary of this run
+        """
+        checkpoint = Checkpoint(checkpoint_path or output_path + ".checkpoint")
+        checkpoint.recover(output_path)
+        batch = BatchRun(self._dispatch, iter_requests(input_path, checkpoint), self.concurrency)
+
+        pending = 0
+        with open(output_path, "a", encoding="utf-8") as output_file:
+            try:
+                async for result in batch:
+                    line_number, request = result.prompt
+                    record = {"id": (request or {}).get("id", line_number), "line": line_number}
+                    if result.ok:
+                        response = result.response
+                        record.update(
+                            response=response.response,
+                            model=response.model,
+                            input_tokens=response.input_tokens,
+                            output_tokens=response.output_tokens,
+                            cost=response.cost
+                        )
+                    else:
+                        record["error"] = {"type": type(result.error).__name__, "message": str(result.error)}
+                    output_file.write(json.dumps(record, default=_to_json) + "\n")
+                    checkpoint.mark(line_number, failed=not result.ok)
+
+                    pending += 1
+                    if pending >= self.checkpoint_every:
+                        checkpoint.save(_sync(output_file))
+                        pending = 0
+            finally:
+                checkpoint.save(_sync(output_file))
+        return batch.summary
+
+def _sync(output_file) -> int:
+    # Returns the durable output size, recorded in the checkpoint
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    return os.fstat(output_file.fileno()).st_size
+
+def _to_json(value: Any) -> Any:
+    # NumPy embedding matrices and scalars
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def build_provider(name: str,
+                   model: Optional[str] = None,
+                   base_url: Optional[str] = None,
+                   concurrency: Optional[int] = None) -> BaseProvider:
+    """
+    Construct a provider from command-line options (API keys come from the environment)
+
+    :param name: "chat", "embedding" or "anthropic"
+    :param model: Model name (provider default if None)
+    :param base_url: API base URL override
+    :param concurrency: Provider-level concurrency limit
+    :return: Provider instance
+    """
+    config = Config()
+    if name == "chat":
+        from src.providers.openai.chat import ChatProvider
+        return ChatProvider(config.openai_api_key, model=model, base_url=base_url, max_concurrency=concurrency)
+    if name == "embedding":
+        from src.providers.openai.embeddings import EmbeddingProvider
+        # The embedding model is a per-request parameter (see main)
+        return EmbeddingProvider(config.openai_api_key, base_url=base_url, max_concurrency=concurrency)
+    if name == "anthropic":
+        from src.providers.anthropic_provider import AnthropicProvider
+        options = {"model": model} if model else {}
+        return AnthropicProvider(config.anthropic_api_key, base_url=base_url,
+                                 max_concurrency=concurrency, **options)
+    raise ValueError(f"Unsupported provider: {name}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL request file through a provider")
+    parser.add_argument("input", help="Input JSONL file")
+    parser.add_argument("output", help="Output JSONL file (appended to)")
+    parser.add_argument("--provider", choices=["chat", "embedding", "anthropic"], default="chat")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--base-url", default=None)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--checkpoint-every", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    provider = build_provider(args.provider, args.model, args.base_url, args.concurrency)
+    params = {"model": args.model} if args.provider == "embedding" and args.model else {}
+    runner = BatchRunner(provider, args.concurrency, args.checkpoint_every, params)
+    started = time.perf_counter()
+    summary = asyncio.run(runner.run(args.input, args.output, args.checkpoint))
+    print(
+        f"{summary.completed} lines ({summary.failed} failed) in {time.perf_counter() - started:.1f}s, "
+        f"{summary.total_tokens} tokens, ${summary.cost:.4f}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pricing import PricingCatalog, pricing_catalog
+
+class BulkCostEngine:
+    def __init__(self,
+                 catalog: Optional[PricingCatalog] = None,
+                 overrides: Optional[Mapping[str, Tuple[float, float]]] = None):
+        """
+        Vectorized cost engine for re-pricing large volumes of historical usage
+
+        Usage is passed as columns (input tokens, output tokens and an integer
+        model id per row, plus the list of model names the ids refer to), and
+        every row is priced with one gathered multiply-add in NumPy.
+
+        :param catalog: Price table to use (defaults to the process-wide catalog)
+        :param overrides: What-if prices as {model: (input_cost_per_1k, output_cost_per_1k)}
+        """
+        self.catalog = catalog or pricing_catalog
+        self.overrides = dict(overrides or {})
+
+    def rate_arrays(self, model_names: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per-token input and output rates for each model id
+
+        :param model_names: Model name for each id (unknown or None models cost nothing)
+        :return: Tuple of (input_rates, output_rates) indexed by model id
+        """
+        input_rates = np.zeros(len(model_names), dtype=np.float64)
+        output_rates = np.zeros(len(model_names), dtype=np.float64)
+        for model_id, model in enumerate(model_names):
+            if model in self.overrides:
+                input_cost, output_cost = self.overrides[model]
+                input_rates[model_id] = input_cost / 1000
+                output_rates[model_id] = output_cost / 1000
+            elif model is not None:
+                price = self.catalog.resolve(model)
+                input_rates[model_id] = price.input_cost_per_token
+                output_rates[model_id] = price.output_cost_per_token
+        return input_rates, output_rates
+
+    def price(self,
+              input_tokens: np.ndarray,
+              output_tokens: np.ndarray,
+              model_ids: np.ndarray,
+              model_names: Sequence[Optional[str]],
+              as_model: Optional[str] = None) -> np.ndarray:
+        """
+        Cost of every row in USD
+
+        :param input_tokens: Input tokens per row
+        :param output_tokens: Output tokens per row
+        :param model_ids: Index into model_names per row
+        :param model_names: Model name for each id
+        :param as_model: Price every row as if it had used this model instead
+        :return: Float64 array of costs per row
+        """
+        input_tokens = np.asarray(input_tokens)
+        output_tokens = np.asarray(output_tokens)
+        if as_model is not None:
+            input_rates, output_rates = self.rate_arrays([as_model])
+            return input_tokens * input_rates[0] + output_tokens * output_rates[0]
+
+        input_rates, output_rates = self.rate_arrays(model_names)
+        model_ids = np.asarray(model_ids)
+        return input_tokens * input_rates[model_ids] + output_tokens * output_rates[model_ids]
+
+    @staticmethod
+    def group_totals(costs: np.ndarray,
+                     group_ids: np.ndarray,
+                     group_names: Sequence[Optional[str]]) -> Dict[Optional[str], float]:
+        """
+        Sum costs per group id
+
+        :param costs: Cost per row
+        :param group_ids: Group id per row (e.g. model or provider id)
+        :param group_names: Name for each group id
+        :return: Total cost per group name, for groups that have rows
+        """
+        totals = np.bincount(np.asarray(group_ids), weights=costs, minlength=len(group_names))
+        counts = np.bincount(np.asarray(group_ids), minlength=len(group_names))
+        return {
+            group_names[group_id]: float(totals[group_id])
+            for group_id in np.flatnonzero(counts)
+        }
+
+    def price_tracker(self, tracker, as_model: Optional[str] = None) -> Dict[Optional[str], float]:
+        """
+        Re-price every usage entry retained by a TokenTracker, grouped by model
+
+        The tracker's usage log columns are copied as raw arrays and viewed with
+        numpy.frombuffer rather than materialised as Python objects.
+
+        :param tracker: TokenTracker (or ConcurrentTokenTracker) to re-price
+        :param as_model: Price every entry as if it had used this model
+        :return: Total cost per recorded model name
+        """
+        totals: Dict[Optional[str], float] = {}
+        for columns in tracker.usage_columns():
+            model_ids = _as_numpy(columns["model_ids"])
+            costs = self.price(
+                _as_numpy(columns["input_tokens"]),
+                _as_numpy(columns["output_tokens"]),
+                model_ids,
+                columns["names"],
+                as_model=as_model
+            )
+            for model, cost in self.group_totals(costs, model_ids, columns["names"]).items():
+                totals[model] = totals.get(model, 0.0) + cost
+        return totals
+
+def _as_numpy(column) -> np.ndarray:
+    # View a copy of the array.array column: a live column exporting its
+    # buffer cannot grow, so a concurrent track_tokens would raise BufferError
+    return np.frombuffer(column[:], dtype=np.dtype(column.typecode))
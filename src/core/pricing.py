@@ -0,0 +1,478 @@
+import json
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Built-in price table. Costs are USD per 1000 tokens (or per image), in the
+# same schema as the JSON files accepted by PricingCatalog.load.
+DEFAULT_PRICING: Dict[str, Any] = {
+    "version": "2024-12-10",
+    "providers": {
+        "openai": {
+            # Batch API jobs are billed at half the synchronous rate
+            "batch_discount": 0.5,
+            "default": {
+                "input_token_cost": 0.0015,
+                "output_token_cost": 0.002
+            },
+            "models": {
+                "dall-e-3": {
+                    "type": "image",
+                    "resolution_pricing": {
+                        "1024x1024": 0.04,   # Cost per image
+                        "1024x1792": 0.08,   # Rectangular image cost
+                        "1792x1024": 0.08    # Rectangular image cost
+                    },
+                    "status": "active",
+                    "release_date": "2023-11-06",
+                    "recommended_for": ["high-quality image generation"]
+                },
+                "dall-e-2": {
+                    "type": "image",
+                    "resolution_pricing": {
+                        "256x256": 0.016,    # Cost per image
+                        "512x512": 0.018,    # Cost per image
+                        "1024x1024": 0.020   # Cost per image
+                    },
+                    "status": "active",
+                    "release_date": "2022-07-15",
+                    "recommended_for": ["standard image generation"]
+                },
+                # GPT-3.5 Models
+                "gpt-3.5-turbo": {
+                    "input_token_cost": 0.0015,
+                    "output_token_cost": 0.002,
+                    "context_window": 4096,
+                    "status": "active",
+                    "release_date": "2023-03-01",
+                    "type": "chat",
+                    "recommended_for": ["general purpose", "cost-effective"]
+                },
+                "gpt-3.5-turbo-16k": {
+                    "input_token_cost": 0.003,
+                    "output_token_cost": 0.004,
+                    "context_window": 16384,
+                    "status": "active",
+                    "release_date": "2023-06-15",
+                    "type": "chat",
+                    "recommended_for": ["longer context", "detailed analysis"]
+                },
+                "gpt-3.5-turbo-instruct": {
+                    "input_token_cost": 0.0015,
+                    "output_token_cost": 0.002,
+                    "context_window": 4096,
+                    "status": "active",
+                    "release_date": "2023-09-18",
+                    "type": "completion",
+                    "recommended_for": ["legacy completions"]
+                },
+                # GPT-4 Models
+                "gpt-4": {
+                    "input_token_cost": 0.03,
+                    "output_token_cost": 0.06,
+                    "context_window": 8192,
+                    "status": "active",
+                    "release_date": "2023-03-14",
+                    "type": "chat",
+                    "recommended_for": ["complex tasks", "high-quality output"]
+                },
+                "gpt-4-32k": {
+                    "input_token_cost": 0.06,
+                    "output_token_cost": 0.12,
+                    "context_window": 32768,
+                    "status": "active",
+                    "release_date": "2023-03-14",
+                    "type": "chat",
+                    "recommended_for": ["very long context", "detailed analysis"]
+                },
+                "gpt-4-turbo": {
+                    "input_token_cost": 0.01,
+                    "output_token_cost": 0.03,
+                    "context_window": 128000,
+                    "status": "active",
+                    "release_date": "2024-02-15",
+                    "type": "chat",
+                    "recommended_for": ["advanced reasoning", "large context"]
+                },
+                # Latest Models
+                "gpt-4o": {
+                    "input_token_cost": 0.0025,
+                    "output_token_cost": 0.01,
+                    "context_window": 128000,
+                    "status": "active",
+                    "release_date": "2024-05-13",
+                    "type": "chat",
+                    "recommended_for": ["multimodal", "high performance", "cost-effective"]
+                },
+                "gpt-4o-mini": {
+                    "input_token_cost": 0.00015,
+                    "output_token_cost": 0.0006,
+                    "context_window": 128000,
+                    "status": "active",
+                    "release_date": "2024-07-01",
+                    "type": "chat",
+                    "recommended_for": ["lightweight tasks", "cost optimization"]
+                },
+                # Embedding Models
+                "text-embedding-ada-002": {
+                    "input_token_cost": 0.0001,
+                    "output_token_cost": 0,
+                    "context_window": 8191,
+                    "status": "active",
+                    "release_date": "2022-12-15",
+                    "type": "embedding",
+                    "recommended_for": ["legacy embeddings"]
+                },
+                "text-embedding-3-small": {
+                    "input_token_cost": 0.00002,
+                    "output_token_cost": 0,
+                    "context_window": 8191,
+                    "status": "active",
+                    "release_date": "2024-01-25",
+                    "type": "embedding",
+                    "recommended_for": ["search", "cost optimization"]
+                },
+                "text-embedding-3-large": {
+                    "input_token_cost": 0.00013,
+                    "output_token_cost": 0,
+                    "context_window": 8191,
+                    "status": "active",
+                    "release_date": "2024-01-25",
+                    "type": "embedding",
+                    "recommended_for": ["high-accuracy retrieval"]
+                }
+            }
+        },
+        "anthropic": {
+            "batch_discount": 0.5,
+            "default": {
+                "input_token_cost": 0.003,
+                "output_token_cost": 0.004
+            },
+            "models": {
+                "claude-2": {
+                    "input_token_cost": 0.008,
+                    "output_token_cost": 0.024,
+                    "context_window": 100000,
+                    "type": "chat"
+                },
+                "claude-3-opus-20240229": {
+                    "input_token_cost": 0.015,
+                    "output_token_cost": 0.075,
+                    "context_window": 200000,
+                    "type": "chat"
+                },
+                "claude-3-5-sonnet-20241022": {
+                    "input_token_cost": 0.003,
+                    "output_token_cost": 0.015,
+                    "context_window": 200000,
+                    "type": "chat"
+                },
+                "claude-3-5-haiku-20241022": {
+                    "input_token_cost": 0.0008,
+                    "output_token_cost": 0.004,
+                    "context_window": 200000,
+                    "type": "chat"
+                }
+            }
+        }
+    }
+}
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """
+    Compiled, immutable price record with per-token rates
+    """
+    __slots__ = (
+        "provider",
+        "model",
+        "input_cost_per_token",
+        "output_cost_per_token",
+        "context_window",
+        "model_type",
+        "image_prices",
+        "batch_input_cost_per_token",
+        "batch_output_cost_per_token"
+    )
+    provider: str
+    model: Optional[str]
+    input_cost_per_token: float
+    output_cost_per_token: float
+    context_window: int
+    model_type: Optional[str]
+    image_prices: Mapping
+    batch_input_cost_per_token: float
+    batch_output_cost_per_token: float
+
+    def cost(self, input_tokens: int, output_tokens: int = 0) -> float:
+        """
+        Cost of a request in USD (unrounded)
+
+        :param input_tokens: Number of input tokens
+        :param output_tokens: Number of output tokens
+        :return: Cost in USD
+        """
+        return input_tokens * self.input_cost_per_token + output_tokens * self.output_cost_per_token
+
+    def batch_cost(self, input_tokens: int, output_tokens: int = 0) -> float:
+        """
+        Cost of a request submitted through the provider's batch API in USD (unrounded)
+
+        :param input_tokens: Number of input tokens
+        :param output_tokens: Number of output tokens
+        :return: Cost in USD
+        """
+        return (input_tokens * self.batch_input_cost_per_token
+                + output_tokens * self.batch_output_cost_per_token)
+
+    def image_cost(self, size: str, count: int = 1) -> float:
+        """
+        Cost of generating images in USD
+
+        :param size: Image resolution (e.g. "1024x1024")
+        :param count: Number of images
+        :return: Cost in USD
+        """
+        return self.image_prices.get(size, 0) * count
+
+def _compile_price(provider: str,
+                   model: Optional[str],
+                   entry: Mapping,
+                   batch_discount: float = 0.0) -> ModelPrice:
+    input_cost = entry.get("input_token_cost", 0)
+    output_cost = entry.get("output_token_cost", 0)
+    # Explicit batch prices win over the provider-wide discount
+    batch_input_cost = entry.get("batch_input_token_cost", input_cost * (1 - batch_discount))
+    batch_output_cost = entry.get("batch_output_token_cost", output_cost * (1 - batch_discount))
+    return ModelPrice(
+        provider=provider,
+        model=model,
+        input_cost_per_token=input_cost / 1000,
+        output_cost_per_token=output_cost / 1000,
+        context_window=entry.get("context_window", 0),
+        model_type=entry.get("type"),
+        image_prices=MappingProxyType(dict(entry.get("resolution_pricing", {}))),
+        batch_input_cost_per_token=batch_input_cost / 1000,
+        batch_output_cost_per_token=batch_output_cost / 1000
+    )
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class _CatalogState:
+    """
+    One compiled, immutable version of the price table
+    """
+    __slots__ = ("version", "raw", "prices", "provider_prices", "defaults")
+
+    def __init__(self, table: Mapping):
+        if "version" not in table or "providers" not in table:
+            raise ValueError("Pricing table must define 'version' and 'providers'")
+
+        self.version = str(table["version"])
+        self.raw = _freeze(table)
+        self.prices: Dict[str, ModelPrice] = {}
+        self.provider_prices: Dict[Tuple[str, str], ModelPrice] = {}
+        self.defaults: Dict[str, ModelPrice] = {}
+
+        for provider, provider_table in table["providers"].items():
+            provider = provider.lower()
+            batch_discount = provider_table.get("batch_discount", 0.0)
+            self.defaults[provider] = _compile_price(
+                provider, None, provider_table.get("default", {}), batch_discount
+            )
+            for model, entry in provider_table.get("models", {}).items():
+                price = _compile_price(provider, model, entry, batch_discount)
+                self.prices.setdefault(model, price)
+                self.provider_prices[(provider, model)] = price
+
+class PricingCatalog:
+    def __init__(self, table: Optional[Mapping] = None):
+        """
+        Single source of truth for model and provider prices
+
+        Entries are compiled into per-token ModelPrice records once per
+        version; reloading builds a complete new version and swaps it in with
+        a single assignment, so readers never observe a half-updated table.
+
+        :param table: Versioned pricing table (defaults to DEFAULT_PRICING)
+        """
+        self._state = _CatalogState(table or DEFAULT_PRICING)
+        self._generation = 0
+        self._write_lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return self._state.version
+
+    @property
+    def generation(self) -> int:
+        """Bumped whenever a table is installed, even one with the same version"""
+        return self._generation
+
+    def get(self, model: str, provider: Optional[str] = None) -> Optional[ModelPrice]:
+        """
+        Look up the compiled price for a model
+
+        :param model: Model name
+        :param provider: Restrict the lookup to this provider
+        :return: Model price, or None if the model is unknown
+        """
+        state = self._state
+        if provider is None:
+            return state.prices.get(model)
+        return state.provider_prices.get((provider.lower(), model))
+
+    def resolve(self, model: str, provider: Optional[str] = None) -> ModelPrice:
+        """
+        Look up the compiled price for a model, treating unknown models as free
+
+        :param model: Model name
+        :param provider: Restrict the lookup to this provider
+        :return: Model price (zero rates if the model is unknown)
+        """
+        price = self.get(model, provider)
+        if price is None:
+            price = _compile_price((provider or "").lower(), model, {})
+        return price
+
+    def provider_default(self, provider: str) -> Optional[ModelPrice]:
+        """
+        Flat fallback price for a provider
+
+        :param provider: Provider name
+        :return: Provider price, or None if the provider is unknown
+        """
+        return self._state.defaults.get(provider.lower())
+
+    def raw_models(self, provider: str) -> Mapping:
+        """
+        Read-only raw (per 1000 tokens) model table for a provider
+
+        :param provider: Provider name
+        :return: Mapping of model name to raw entry
+        """
+        providers = self._state.raw["providers"]
+        provider_table = providers.get(provider.lower())
+        return provider_table["models"] if provider_table and "models" in provider_table else {}
+
+    def raw_defaults(self) -> Mapping:
+        """
+        Read-only raw (per 1000 tokens) provider default prices
+
+        :return: Mapping of provider name to raw default entry
+        """
+        return MappingProxyType({
+            provider: table.get("default", {})
+            for provider, table in self._state.raw["providers"].items()
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Plain-dict copy of the current table, suitable for json.dump
+
+        :return: Versioned pricing table
+        """
+        def thaw(value):
+            if isinstance(value, Mapping):
+                return {key: thaw(item) for key, item in value.items()}
+            if isinstance(value, tuple):
+                return [thaw(item) for item in value]
+            return value
+        return thaw(self._state.raw)
+
+    def swap(self, table: Mapping) -> str:
+        """
+        Compile a new table and atomically replace the current one
+
+        Compiling runs outside the write lock; the lock only orders the
+        replacement against set_provider_default's read-modify-write, so a
+        concurrent update cannot reinstate a table this swap replaced.
+
+        :param table: Versioned pricing table
+        :return: Version now in effect
+        """
+        state = _CatalogState(table)
+        with self._write_lock:
+            self._state = state
+            self._generation += 1
+        return state.version
+
+    def load(self, path: str) -> str:
+        """
+        Load a versioned pricing JSON file and swap it in
+
+        :param path: Path to the JSON file
+        :return: Version now in effect
+        """
+        with open(path, encoding="utf-8") as pricing_file:
+            return self.swap(json.load(pricing_file))
+
+    def set_provider_default(self, provider: str, input_cost: float, output_cost: float):
+        """
+        Add or update a provider's flat per-1000-token prices
+
+        :param provider: Provider name
+        :param input_cost: Cost per 1000 input tokens
+        :param output_cost: Cost per 1000 output tokens
+        """
+        with self._write_lock:
+            table = self.to_dict()
+            provider_table = table["providers"].setdefault(provider.lower(), {"models": {}})
+            provider_table["default"] = {
+                "input_token_cost": input_cost,
+                "output_token_cost": output_cost
+            }
+            # Already holding the write lock, so install directly rather than via swap
+            self._state = _CatalogState(table)
+            self._generation += 1
+
+class PricingView(Mapping):
+    def __init__(self,
+                 provider: Optional[str] = None,
+                 model_type: Optional[str] = None,
+                 catalog: Optional[PricingCatalog] = None):
+        """
+        Live, read-only dict-style view of a raw table in the catalog
+
+        Keeps the legacy PRICING / PROVIDER_PRICING attributes working while
+        the catalog stays the only place prices are defined.
+
+        :param provider: Provider whose model table to expose (None for provider defaults)
+        :param model_type: Only expose models of this type
+        :param catalog: Catalog to read (defaults to the process-wide catalog)
+        """
+        self._provider = provider
+        self._model_type = model_type
+        self._catalog = catalog
+
+    def _table(self) -> Mapping:
+        catalog = self._catalog or pricing_catalog
+        if self._provider is None:
+            return catalog.raw_defaults()
+        return catalog.raw_models(self._provider)
+
+    def _visible(self, entry: Mapping) -> bool:
+        return self._model_type is None or entry.get("type") == self._model_type
+
+    def __getitem__(self, key: str) -> Mapping:
+        entry = self._table()[key]
+        if not self._visible(entry):
+            raise KeyError(key)
+        return entry
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key, entry in self._table().items() if self._visible(entry))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+# Process-wide catalog shared by every provider and CostCalculator
+pricing_catalog = PricingCatalog()
@@ -0,0 +1,238 @@
+import math
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+# Bucket width and number of buckets retained per granularity
+GRANULARITIES: Dict[str, Tuple[int, int]] = {
+    "minute": (60, 24 * 60),       # one day of minutes
+    "hour": (3600, 31 * 24),       # one month of hours
+    "day": (86400, 400)            # a bit over a year of days
+}
+
+RollupKey = Tuple[str, Optional[str]]
+
+@dataclass
+class RollupTotals:
+    """
+    Aggregated usage for one time bucket
+    """
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other: "RollupTotals"):
+        self.requests += other.requests
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cost += other.cost
+
+class TimeRollups:
+    def __init__(self):
+        """
+        Per-minute, per-hour and per-day usage rollups keyed by (provider, model)
+
+        Buckets are updated incrementally as usage is recorded and only a fixed
+        number of buckets is kept per granularity, so queries touch a bounded
+        amount of data no matter how much history has been tracked.
+        """
+        self._buckets: Dict[str, Dict[int, Dict[RollupKey, RollupTotals]]] = {
+            granularity: {} for granularity in GRANULARITIES
+        }
+
+    def record(self,
+               timestamp: float,
+               provider: str,
+               model: Optional[str],
+               input_tokens: int,
+               output_tokens: int,
+               cost: float = 0.0):
+        """
+        Add one request to every granularity
+
+        :param timestamp: POSIX timestamp of the request
+        :param provider: Provider name
+        :param model: Model name
+        :param input_tokens: Number of input tokens
+        :param output_tokens: Number of output tokens
+        :param cost: Request cost in USD
+        """
+        key = (provider, model)
+        for granularity, (width, retention) in GRANULARITIES.items():
+            buckets = self._buckets[granularity]
+            start = int(timestamp // width) * width
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = {}
+                if len(buckets) > retention:
+                    del buckets[min(buckets)]
+            totals = bucket.get(key)
+            if totals is None:
+                totals = bucket[key] = RollupTotals()
+            totals.requests += 1
+            totals.input_tokens += input_tokens
+            totals.output_tokens += output_tokens
+            totals.cost += cost
+
+    def series(self,
+               granularity: str = "minute",
+               provider: Optional[str] = None,
+               model: Optional[str] = None,
+               since: Optional[float] = None) -> List[Tuple[int, RollupTotals]]:
+        """
+        Time series of bucket totals, oldest first
+
+        :param granularity: "minute", "hour" or "day"
+        :param provider: Only include this provider
+        :param model: Only include this model
+        :param since: Only include buckets covering this timestamp or later
+        :return: List of (bucket_start, totals)
+        """
+        width, _ = GRANULARITIES[granularity]
+        result = []
+        for start in sorted(self._buckets[granularity]):
+            if since is not None and start + width <= since:
+                continue
+            totals = RollupTotals()
+            for (bucket_provider, bucket_model), bucket_totals in self._buckets[granularity][start].items():
+                if provider is not None and bucket_provider != provider:
+                    continue
+                if model is not None and bucket_model != model:
+                    continue
+                totals.add(bucket_totals)
+            result.append((start, totals))
+        return result
+
+    def totals(self,
+               since: float,
+               granularity: str = "minute") -> Dict[RollupKey, RollupTotals]:
+        """
+        Usage per (provider, model) over every bucket covering since or later
+
+        :param since: Window start as a POSIX timestamp
+        :param granularity: "minute", "hour" or "day"
+        :return: Totals keyed by (provider, model)
+        """
+        width, _ = GRANULARITIES[granularity]
+        result: Dict[RollupKey, RollupTotals] = {}
+        for start, bucket in self._buckets[granularity].items():
+            if start + width <= since:
+                continue
+            for key, bucket_totals in bucket.items():
+                totals = result.get(key)
+                if totals is None:
+                    totals = result[key] = RollupTotals()
+                totals.add(bucket_totals)
+        return result
+
+    def copy(self) -> "TimeRollups":
+        """
+        Independent copy of these rollups
+
+        :return: Copied rollups
+        """
+        copied = TimeRollups()
+        for granularity, buckets in self._buckets.items():
+            copied._buckets[granularity] = {
+                start: {key: replace(totals) for key, totals in bucket.items()}
+                for start, bucket in buckets.items()
+            }
+        return copied
+
+    def merge(self, other: "TimeRollups"):
+        """
+        Fold another rollup set into this one
+
+        :param other: Rollups to merge
+        """
+        for granularity, (_, retention) in GRANULARITIES.items():
+            buckets = self._buckets[granularity]
+            for start, other_bucket in other._buckets[granularity].items():
+                bucket = buckets.setdefault(start, {})
+                for key, other_totals in other_bucket.items():
+                    bucket.setdefault(key, RollupTotals()).add(other_totals)
+            for start in sorted(buckets)[:max(0, len(buckets) - retention)]:
+                del buckets[start]
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.01):
+        """
+        Streaming quantile sketch with bounded relative error (DDSketch-style)
+
+        Values are counted in logarithmically sized buckets, so memory grows
+        with the spread of values rather than with the number of values, and
+        any quantile is answered within relative_accuracy of the true value.
+
+        :param relative_accuracy: Maximum relative error of reported quantiles
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._bins: Dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        """
+        Record a non-negative value
+
+        :param value: Value to record
+        """
+        self.count += 1
+        if value <= 0:
+            self._zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._bins[index] = self._bins.get(index, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile of the recorded values
+
+        :param q: Quantile in [0, 1]
+        :return: Estimated value, or None if nothing was recorded
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._bins):
+            seen += self._bins[index]
+            if rank < seen:
+                # Midpoint of the bucket in relative terms
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._bins) / (self._gamma + 1)
+
+    def copy(self) -> "QuantileSketch":
+        """
+        Independent copy of this sketch
+
+        :return: Copied sketch
+        """
+        copied = QuantileSketch(self.relative_accuracy)
+        copied._bins = dict(self._bins)
+        copied._zero_count = self._zero_count
+        copied.count = self.count
+        return copied
+
+    def merge(self, other: "QuantileSketch"):
+        """
+        Fold another sketch with the same accuracy into this one
+
+        :param other: Sketch to merge
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        self.count += other.count
+        self._zero_count += other._zero_count
+        for index, count in other._bins.items():
+            self._bins[index] = self._bins.get(index, 0) + count
@@ -1,6 +1,13 @@
-from typing import Dict
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime
 from dataclasses import dataclass, field
+from .rollups import QuantileSketch, RollupKey, RollupTotals, TimeRollups
+from .usage_store import UsageLogStore, UsageRow
 
 @dataclass
 class TokenUsageEntry:
@@ -9,30 +16,77 @@ class TokenUsageEntry:
     output_tokens: int
     total_tokens: int
     timestamp: datetime = field(default_factory=datetime.now)
+    model: Optional[str] = None
+
+@dataclass
+class TokenUsageSnapshot:
+    """
+    Point-in-time copy of a tracker's aggregates
+    """
+    total_tokens: int
+    provider_tokens: Dict[str, int]
+    model_tokens: Dict[str, int]
+    total_cost: float = 0.0
+    provider_cost: Dict[str, float] = field(default_factory=dict)
+    model_cost: Dict[str, float] = field(default_factory=dict)
+
+def _merge_counts(target: Dict[str, Any], source: Dict[str, Any]):
+    # Add per-key token or cost totals from source into target
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
 
 class TokenTracker:
-    def __init__(self):
+    def __init__(self, max_entries: int = 100000, sink: Optional[Any] = None):
+        """
+        Token usage tracker with bounded-memory usage log
+
+        :param max_entries: Number of most recent usage entries to retain
+        :param sink: Optional durable sink (see src.models.user_log) fed every entry
+        """
         self._total_tokens: int = 0
         self._provider_tokens: Dict[str, int] = {}
-        self._usage_log: Dict[str, TokenUsageEntry] = {}
+        self._model_tokens: Dict[str, int] = {}
+        self._total_cost: float = 0.0
+        self._provider_cost: Dict[str, float] = {}
+        self._model_cost: Dict[str, float] = {}
+        self._usage_log = UsageLogStore(max_entries)
+        self._sink = sink
+        self._rollups = TimeRollups()
+        self._tokens_sketch = QuantileSketch()
+        self._cost_sketch = QuantileSketch()
 
-    def track_tokens(self, provider: str, input_tokens: int, output_tokens: int):
+    def track_tokens(self,
+                     provider: str,
+                     input_tokens: int,
+                     output_tokens: int,
+                     model: Optional[str] = None,
+                     cost: float = 0.0):
         total_tokens = input_tokens + output_tokens
-        
-        # Update total tokens
+
+        # Update total tokens and cost
         self._total_tokens += total_tokens
-        
-        # Update provider-specific tokens
+        self._total_cost += cost
+
+        # Update provider-specific tokens and cost
         self._provider_tokens[provider] = self._provider_tokens.get(provider, 0) + total_tokens
-        
+        self._provider_cost[provider] = self._provider_cost.get(provider, 0.0) + cost
+
+        # Update model-specific tokens and cost
+        if model is not None:
+            self._model_tokens[model] = self._model_tokens.get(model, 0) + total_tokens
+            self._model_cost[model] = self._model_cost.get(model, 0.0) + cost
+
         # Log usage
-        entry = TokenUsageEntry(
-            provider=provider,
-            input_tokens=input_tokens,
-            output_tokens=output_tokens,
-            total_tokens=total_tokens
-        )
-        self._usage_log[str(entry.timestamp)] = entry
+        timestamp = time.time()
+        self._usage_log.append(timestamp, provider, model, input_tokens, output_tokens)
+
+        # Update time rollups and per-request distributions
+        self._rollups.record(timestamp, provider, model, input_tokens, output_tokens, cost)
+        self._tokens_sketch.add(total_tokens)
+        self._cost_sketch.add(cost)
+
+        if self._sink is not None:
+            self._sink.submit((timestamp, provider, model, input_tokens, output_tokens, cost))
 
     def get_total_tokens(self) -> int:
         return self._total_tokens
@@ -40,5 +94,300 @@ class TokenTracker:
     def get_provider_tokens(self, provider: str = None) -> Dict[str, int]:
         return self._provider_tokens.get(provider, 0) if provider else self._provider_tokens
 
+    def get_model_tokens(self, model: str = None) -> Dict[str, int]:
+        return self._model_tokens.get(model, 0) if model else self._model_tokens
+
+    def get_total_cost(self) -> float:
+        return self._total_cost
+
+    def get_provider_cost(self, provider: str = None) -> Dict[str, float]:
+        return self._provider_cost.get(provider, 0.0) if provider else self._provider_cost
+
+    def get_model_cost(self, model: str = None) -> Dict[str, float]:
+        return self._model_cost.get(model, 0.0) if model else self._model_cost
+
+    def snapshot(self) -> TokenUsageSnapshot:
+        """
+        Copy of the current aggregates
+
+        :return: Usage snapshot
+        """
+        return TokenUsageSnapshot(
+            total_tokens=self._total_tokens,
+            provider_tokens=dict(self._provider_tokens),
+            model_tokens=dict(self._model_tokens),
+            total_cost=self._total_cost,
+            provider_cost=dict(self._provider_cost),
+            model_cost=dict(self._model_cost)
+        )
+
+    def _rollup_view(self) -> Tuple[TimeRollups, QuantileSketch, QuantileSketch]:
+        return self._rollups, self._tokens_sketch, self._cost_sketch
+
+    def get_usage_since(self,
+                        seconds: float,
+                        granularity: str = "minute") -> Dict[RollupKey, RollupTotals]:
+        """
+        Usage per (provider, model) over a trailing window, from the rollups
+
+        The window is rounded out to whole buckets of the chosen granularity.
+
+        :param seconds: Window length in seconds (e.g. 3600 for the last hour)
+        :param granularity: "minute", "hour" or "day"
+        :return: Totals keyed by (provider, model)
+        """
+        rollups, _, _ = self._rollup_view()
+        return rollups.totals(time.time() - seconds, granularity)
+
+    def get_usage_series(self,
+                         granularity: str = "minute",
+                         provider: Optional[str] = None,
+                         model: Optional[str] = None,
+                         since: Optional[float] = None) -> List[Tuple[int, RollupTotals]]:
+        """
+        Time series of usage buckets, oldest first
+
+        :param granularity: "minute", "hour" or "day"
+        :param provider: Only include this provider
+        :param model: Only include this model
+        :param since: Only include buckets from this POSIX timestamp on
+        :return: List of (bucket_start, totals)
+        """
+        rollups, _, _ = self._rollup_view()
+        return rollups.series(granularity, provider, model, since)
+
+    def get_percentiles(self,
+                        quantiles: Sequence[float] = (0.5, 0.9, 0.99)) -> Dict[str, Dict[float, Optional[float]]]:
+        """
+        Estimated percentiles of tokens and cost per request
+
+        :param quantiles: Quantiles in [0, 1]
+        :return: {"tokens_per_request": {q: value}, "cost_per_request": {q: value}}
+        """
+        _, tokens_sketch, cost_sketch = self._rollup_view()
+        return {
+            "tokens_per_request": {q: tokens_sketch.quantile(q) for q in quantiles},
+            "cost_per_request": {q: cost_sketch.quantile(q) for q in quantiles}
+        }
+
+    def restore(self, snapshot: TokenUsageSnapshot):
+        """
+        Add previously persisted aggregates (e.g. at startup) to this tracker
+
+        :param snapshot: Aggregates to add
+        """
+        self._total_tokens += snapshot.total_tokens
+        self._total_cost += snapshot.total_cost
+        _merge_counts(self._provider_tokens, snapshot.provider_tokens)
+        _merge_counts(self._model_tokens, snapshot.model_tokens)
+        _merge_counts(self._provider_cost, snapshot.provider_cost)
+        _merge_counts(self._model_cost, snapshot.model_cost)
+
+    def _usage_rows(self) -> Iterator[UsageRow]:
+        return iter(self._usage_log)
+
+    def usage_columns(self) -> List[Dict[str, Any]]:
+        """
+        Columnar view(s) of the retained usage log for bulk processing
+
+        :return: List of column dictionaries (see UsageLogStore.columns)
+        """
+        return [self._usage_log.columns()]
+
+    def iter_usage(self) -> Iterator[TokenUsageEntry]:
+        """
+        Iterate retained usage entries from oldest to newest
+
+        :return: Iterator of usage entries
+        """
+        for timestamp, provider, model, input_tokens, output_tokens in self._usage_rows():
+            yield TokenUsageEntry(
+                provider=provider,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                total_tokens=input_tokens + output_tokens,
+                timestamp=datetime.fromtimestamp(timestamp),
+                model=model
+            )
+
+    def get_usage_rows(self) -> List[TokenUsageEntry]:
+        """
+        Retained usage entries from oldest to newest
+
+        :return: List of usage entries
+        """
+        return list(self.iter_usage())
+
     def get_usage_log(self) -> Dict[str, TokenUsageEntry]:
-        return self._usage_log
\ No newline at end of file
+        """
+        Retained usage entries keyed by timestamp string (the original log shape)
+
+        Entries recorded in the same microsecond get a "#n" suffix instead of
+        overwriting each other.
+
+        :return: Dictionary of usage entries, oldest first
+        """
+        log: Dict[str, TokenUsageEntry] = {}
+        previous, repeat = None, 0
+        for entry in self.iter_usage():
+            key = str(entry.timestamp)
+            # Entries come out in timestamp order, so duplicates are adjacent
+            if key == previous:
+                repeat += 1
+                log[f"{key}#{repeat}"] = entry
+            else:
+                previous, repeat = key, 0
+                log[key] = entry
+        return log
+
+class ConcurrentTokenTracker(TokenTracker):
+    def __init__(self,
+                 max_entries: int = 100000,
+                 num_shards: int = 16,
+                 sink: Optional[Any] = None):
+        """
+        Thread-safe token tracker with sharded counters
+
+        Each thread is pinned to one of num_shards shards and only takes that
+        shard's lock when tracking, so writers rarely contend. Counter reads
+        take every shard lock in order and return a consistent snapshot;
+        rollup and percentile reads copy one shard at a time. track_tokens
+        never awaits, so coroutines can share a tracker too.
+
+        The usage log retention is split evenly over the shards, so memory
+        stays bounded by max_entries overall; a thread that writes much more
+        than the others only keeps its shard's share of recent entries.
+
+        :param max_entries: Number of most recent usage entries to retain (across all shards)
+        :param num_shards: Number of independent counter shards
+        :param sink: Optional durable sink (see src.models.user_log) fed every entry
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be a positive integer")
+
+        # The base state stays empty; every read and write goes through the shards
+        super().__init__(max_entries, sink)
+        self.max_entries = max_entries
+        shard_entries = math.ceil(max_entries / num_shards)
+        self._shards = [TokenTracker(shard_entries, sink) for _ in range(num_shards)]
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+
+    def _shard_index(self) -> int:
+        index = getattr(self._local, "shard", None)
+        if index is None:
+            # Round-robin assignment spreads threads evenly over the shards
+            index = self._local.shard = next(self._next_shard) % len(self._shards)
+        return index
+
+    def track_tokens(self,
+                     provider: str,
+                     input_tokens: int,
+                     output_tokens: int,
+                     model: Optional[str] = None,
+                     cost: float = 0.0):
+        index = self._shard_index()
+        with self._locks[index]:
+            self._shards[index].track_tokens(provider, input_tokens, output_tokens, model, cost)
+
+    def _acquire_all(self):
+        for lock in self._locks:
+            lock.acquire()
+
+    def _release_all(self):
+        for lock in reversed(self._locks):
+            lock.release()
+
+    def snapshot(self) -> TokenUsageSnapshot:
+        """
+        Consistent merge of all shard aggregates
+
+        :return: Usage snapshot
+        """
+        snapshot = TokenUsageSnapshot(0, {}, {})
+
+        self._acquire_all()
+        try:
+            for shard in self._shards:
+                snapshot.total_tokens += shard._total_tokens
+                snapshot.total_cost += shard._total_cost
+                _merge_counts(snapshot.provider_tokens, shard._provider_tokens)
+                _merge_counts(snapshot.model_tokens, shard._model_tokens)
+                _merge_counts(snapshot.provider_cost, shard._provider_cost)
+                _merge_counts(snapshot.model_cost, shard._model_cost)
+        finally:
+            self._release_all()
+
+        return snapshot
+
+    def restore(self, snapshot: TokenUsageSnapshot):
+        """
+        Add previously persisted aggregates (e.g. at startup) to this tracker
+
+        :param snapshot: Aggregates to add
+        """
+        with self._locks[0]:
+            self._shards[0].restore(snapshot)
+
+    def get_total_tokens(self) -> int:
+        return self.snapshot().total_tokens
+
+    def get_provider_tokens(self, provider: str = None) -> Dict[str, int]:
+        provider_tokens = self.snapshot().provider_tokens
+        return provider_tokens.get(provider, 0) if provider else provider_tokens
+
+    def get_model_tokens(self, model: str = None) -> Dict[str, int]:
+        model_tokens = self.snapshot().model_tokens
+        return model_tokens.get(model, 0) if model else model_tokens
+
+    def get_total_cost(self) -> float:
+        return self.snapshot().total_cost
+
+    def get_provider_cost(self, provider: str = None) -> Dict[str, float]:
+        provider_cost = self.snapshot().provider_cost
+        return provider_cost.get(provider, 0.0) if provider else provider_cost
+
+    def get_model_cost(self, model: str = None) -> Dict[str, float]:
+        model_cost = self.snapshot().model_cost
+        return model_cost.get(model, 0.0) if model else model_cost
+
+    def _rollup_view(self) -> Tuple[TimeRollups, QuantileSketch, QuantileSketch]:
+        # Copy each shard under its own lock only, then merge with no lock held,
+        # so a rollup query stalls at most one shard's writers at a time
+        copies = []
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                copies.append((shard._rollups.copy(), shard._tokens_sketch.copy(), shard._cost_sketch.copy()))
+
+        rollups, tokens_sketch, cost_sketch = copies[0]
+        for shard_rollups, shard_tokens, shard_cost in copies[1:]:
+            rollups.merge(shard_rollups)
+            tokens_sketch.merge(shard_tokens)
+            cost_sketch.merge(shard_cost)
+        return rollups, tokens_sketch, cost_sketch
+
+    def usage_columns(self) -> List[Dict[str, Any]]:
+        # Copy the columns under the locks so writers cannot resize them mid-read
+        self._acquire_all()
+        try:
+            return [
+                {
+                    name: column[:] if name != "names" else column
+                    for name, column in shard._usage_log.columns().items()
+                }
+                for shard in self._shards
+            ]
+        finally:
+            self._release_all()
+
+    def _usage_rows(self) -> Iterator[UsageRow]:
+        # Copy every shard's log under the locks, then merge by timestamp
+        self._acquire_all()
+        try:
+            shard_rows = [list(shard._usage_log) for shard in self._shards]
+        finally:
+            self._release_all()
+        merged = heapq.merge(*shard_rows, key=lambda row: row[0])
+        retained = sum(len(rows) for rows in shard_rows)
+        return itertools.islice(merged, max(0, retained - self.max_entries), None)
@@ -0,0 +1,232 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+# Below this many uncached texts a serial loop beats dispatching to threads
+MIN_PARALLEL_BATCH = 16
+
+class TokenCountCache:
+    def __init__(self, max_entries: int = 10000):
+        """
+        Bounded, thread-safe LRU cache of token counts keyed by content hash
+
+        :param max_entries: Maximum number of cached counts
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(encoding_name: str, text: str) -> Tuple[str, bytes]:
+        """
+        Build a cache key from the encoding name and a digest of the text
+
+        :param encoding_name: Name of the tiktoken encoding
+        :param text: Text being counted
+        :return: Cache key
+        """
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return encoding_name, digest
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[int]:
+        """
+        Look up a cached count, marking it as recently used
+
+        :param key: Cache key from make_key
+        :return: Token count, or None on a miss
+        """
+        with self._lock:
+            count = self._counts.get(key)
+            if count is None:
+                self._misses += 1
+                return None
+            self._counts.move_to_end(key)
+            self._hits += 1
+            return count
+
+    def put(self, key: Tuple[str, bytes], count: int):
+        """
+        Store a count, evicting the least recently used entry when full
+
+        :param key: Cache key from make_key
+        :param count: Token count
+        """
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+                self._evictions += 1
+
+    def count(self, encoding: "tiktoken.Encoding", text: str) -> int:
+        """
+        Count tokens for text, encoding it only on a cache miss
+
+        :param encoding: tiktoken encoding
+        :param text: Text to count
+        :return: Number of tokens
+        """
+        key = self.make_key(encoding.name, text)
+        count = self.get(key)
+        if count is None:
+            count = len(encoding.encode_ordinary(text))
+            self.put(key, count)
+        return count
+
+    def clear(self):
+        """
+        Drop all cached counts and reset statistics
+        """
+        with self._lock:
+            self._counts.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache hit/miss statistics
+
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._counts),
+                "max_entries": self.max_entries,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
+
+class TokenizerRegistry:
+    """
+    Process-wide registry of tiktoken encodings keyed by model or encoding name
+    """
+    _encodings: Dict[str, "tiktoken.Encoding"] = {}
+    _lock = threading.Lock()
+    token_cache = TokenCountCache()
+
+    @classmethod
+    def get_encoding(cls, name: str) -> "tiktoken.Encoding":
+        """
+        Resolve (and memoize) the encoding for a model or encoding name
+
+        :param name: Model name (e.g. "gpt-4o") or encoding name (e.g. "cl100k_base")
+        :return: tiktoken encoding
+        """
+        encoding = cls._encodings.get(name)
+        if encoding is not None:
+            return encoding
+
+        with cls._lock:
+            # Another thread may have resolved it while we waited
+            encoding = cls._encodings.get(name)
+            if encoding is None:
+                encoding = cls._load_encoding(name)
+                cls._encodings[name] = encoding
+            return encoding
+
+    @staticmethod
+    def _load_encoding(name: str) -> "tiktoken.Encoding":
+        # Imported here so importing the registry does not load tiktoken
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(name)
+        except Exception:
+            pass
+        try:
+            return tiktoken.get_encoding(name)
+        except Exception:
+            # Fallback to default encoding
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+    @classmethod
+    def register(cls, name: str, encoding: "tiktoken.Encoding"):
+        """
+        Register an encoding under a model or encoding name
+
+        :param name: Model or encoding name
+        :param encoding: tiktoken encoding
+        """
+        with cls._lock:
+            cls._encodings[name] = encoding
+
+    @classmethod
+    def count_tokens(cls, encoding: "tiktoken.Encoding", text: str) -> int:
+        """
+        Count tokens through the shared token-count cache
+
+        :param encoding: tiktoken encoding
+        :param text: Text to count
+        :return: Number of tokens
+        """
+        return cls.token_cache.count(encoding, text)
+
+    @classmethod
+    def count_tokens_batch(cls,
+                           encoding: "tiktoken.Encoding",
+                           texts: List[str],
+                           num_threads: int = 1) -> List[int]:
+        """
+        Count tokens for many texts, encoding cache misses in parallel
+
+        tiktoken releases the GIL while encoding, so uncached texts are handed
+        to its batch encoder and spread across num_threads worker threads.
+
+        :param encoding: tiktoken encoding
+        :param texts: Texts to count
+        :param num_threads: Worker threads used for the batch encoder
+        :return: Token count per text, in input order
+        """
+        cache = cls.token_cache
+        counts: List[Optional[int]] = [None] * len(texts)
+        missing: Dict[Tuple[str, bytes], List[int]] = {}
+        missing_texts: List[str] = []
+
+        for index, text in enumerate(texts):
+            key = cache.make_key(encoding.name, text)
+            positions = missing.get(key)
+            if positions is not None:
+                # Duplicate of a text already queued for encoding
+                positions.append(index)
+                continue
+            count = cache.get(key)
+            if count is None:
+                missing[key] = [index]
+                missing_texts.append(text)
+            else:
+                counts[index] = count
+
+        if missing_texts:
+            if num_threads > 1 and len(missing_texts) >= MIN_PARALLEL_BATCH:
+                encoded = encoding.encode_ordinary_batch(missing_texts, num_threads=num_threads)
+                new_counts = [len(tokens) for tokens in encoded]
+            else:
+                new_counts = [len(encoding.encode_ordinary(text)) for text in missing_texts]
+
+            for (key, positions), count in zip(missing.items(), new_counts):
+                cache.put(key, count)
+                for index in positions:
+                    counts[index] = count
+
+        return counts
+
+    @classmethod
+    def clear(cls):
+        """
+        Forget all registered encodings and cached token counts
+        """
+        with cls._lock:
+            cls._encodings.clear()
+        cls.token_cache.clear()
@@ -0,0 +1,140 @@
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+UsageRow = Tuple[float, Optional[str], Optional[str], int, int]
+
+class UsageLogStore:
+    def __init__(self, max_entries: int = 100000):
+        """
+        Fixed-capacity ring buffer of usage entries stored in typed columns
+
+        Provider and model names are interned to small integer ids, so each
+        entry costs 32 bytes regardless of how long the names are. Columns
+        grow up to the retention cap, after which the oldest entry is
+        overwritten.
+
+        :param max_entries: Retention cap (number of most recent entries kept)
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+
+        self.max_entries = max_entries
+        self._reset_columns()
+        # Id 0 is reserved for "no name" (e.g. untracked model)
+        self._names: List[Optional[str]] = [None]
+        self._name_ids: Dict[Optional[str], int] = {None: 0}
+
+    def _reset_columns(self):
+        self._timestamps = array("d")
+        self._provider_ids = array("I")
+        self._model_ids = array("I")
+        self._input_tokens = array("q")
+        self._output_tokens = array("q")
+        self._next = 0
+        self._size = 0
+
+    def intern(self, name: Optional[str]) -> int:
+        """
+        Map a provider or model name to its interned id
+
+        :param name: Provider or model name
+        :return: Interned id
+        """
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def name(self, name_id: int) -> Optional[str]:
+        """
+        Resolve an interned id back to its name
+
+        :param name_id: Interned id
+        :return: Provider or model name
+        """
+        return self._names[name_id]
+
+    def append(self,
+               timestamp: float,
+               provider: str,
+               model: Optional[str],
+               input_tokens: int,
+               output_tokens: int):
+        """
+        Append an entry, overwriting the oldest one when the buffer is full
+
+        :param timestamp: POSIX timestamp of the request
+        :param provider: Provider name
+        :param model: Model name
+        :param input_tokens: Number of input tokens
+        :param output_tokens: Number of output tokens
+        """
+        provider_id = self.intern(provider)
+        model_id = self.intern(model)
+
+        if self._size < self.max_entries:
+            self._timestamps.append(timestamp)
+            self._provider_ids.append(provider_id)
+            self._model_ids.append(model_id)
+            self._input_tokens.append(input_tokens)
+            self._output_tokens.append(output_tokens)
+            self._size += 1
+            self._next = self._size % self.max_entries
+            return
+
+        slot = self._next
+        self._timestamps[slot] = timestamp
+        self._provider_ids[slot] = provider_id
+        self._model_ids[slot] = model_id
+        self._input_tokens[slot] = input_tokens
+        self._output_tokens[slot] = output_tokens
+        self._next = (slot + 1) % self.max_entries
+
+    def _slots(self) -> Iterator[int]:
+        start = (self._next - self._size) % self.max_entries
+        for offset in range(self._size):
+            yield (start + offset) % self.max_entries
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[UsageRow]:
+        """
+        Iterate retained entries from oldest to newest
+
+        :return: Iterator of (timestamp, provider, model, input_tokens, output_tokens)
+        """
+        names = self._names
+        for slot in self._slots():
+            yield (
+                self._timestamps[slot],
+                names[self._provider_ids[slot]],
+                names[self._model_ids[slot]],
+                self._input_tokens[slot],
+                self._output_tokens[slot]
+            )
+
+    def columns(self) -> Dict[str, Any]:
+        """
+        Raw column arrays (in slot order, not time order) and the interned names
+
+        Useful for zero-copy bulk processing, e.g. numpy.frombuffer.
+
+        :return: Dictionary of column arrays plus "names" (id -> name)
+        """
+        return {
+            "timestamps": self._timestamps,
+            "provider_ids": self._provider_ids,
+            "model_ids": self._model_ids,
+            "input_tokens": self._input_tokens,
+            "output_tokens": self._output_tokens,
+            "names": list(self._names)
+        }
+
+    def clear(self):
+        """
+        Drop all retained entries (interned names are kept)
+        """
+        self._reset_columns()
@@ -0,0 +1,374 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Tuple
+
+from src.core.token_tracker import TokenTracker, TokenUsageSnapshot
+
+# (timestamp, provider, model, input_tokens, output_tokens, cost)
+LoggedUsageRow = Tuple[float, Optional[str], Optional[str], int, int, float]
+
+_STOP = object()
+
+def _add_usage(snapshot: TokenUsageSnapshot, provider: str, model: Optional[str], tokens: int, cost: float):
+    snapshot.total_tokens += tokens
+    snapshot.total_cost += cost
+    snapshot.provider_tokens[provider] = snapshot.provider_tokens.get(provider, 0) + tokens
+    snapshot.provider_cost[provider] = snapshot.provider_cost.get(provider, 0.0) + cost
+    if model is not None:
+        snapshot.model_tokens[model] = snapshot.model_tokens.get(model, 0) + tokens
+        snapshot.model_cost[model] = snapshot.model_cost.get(model, 0.0) + cost
+
+logger = logging.getLogger(__name__)
+
+class UsageLogSink(ABC):
+    def __init__(self,
+                 batch_size: int = 500,
+                 flush_interval: float = 1.0,
+                 max_queue: Optional[int] = None,
+                 block: bool = True):
+        """
+        Durable usage log fed by a background writer thread
+
+        submit() only enqueues, so the request path does no disk I/O itself.
+        The writer groups entries into batches and persists a batch once it
+        reaches batch_size entries or has been open for flush_interval
+        seconds. At most max_queue entries (one batch by default) are
+        submitted but not yet written, so a crash loses at most one batch.
+        When that many are outstanding, submit() waits for the writer to
+        catch up, or with block=False drops the entry and counts it in
+        dropped. A failed write is logged and its rows counted in dropped;
+        the writer keeps running. Failing to open the log (e.g. a missing
+        directory) raises from the constructor.
+
+        :param batch_size: Entries per write
+        :param flush_interval: Maximum seconds an entry waits before being written
+        :param max_queue: Maximum unwritten entries (defaults to batch_size)
+        :param block: Wait for the writer when max_queue entries are outstanding instead of dropping
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue if max_queue is not None else batch_size
+        self.block = block
+        # Rows never persisted (no room, writer stopped or write failed)
+        self.dropped = 0
+        self.write_errors = 0
+        # One slot per unwritten row; the writer frees them once a batch is written
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._ready = threading.Event()
+        self._open_error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        # Fail fast rather than leave a dead writer behind a working-looking sink
+        self._ready.wait()
+        if self._open_error is not None:
+            self._closed = True
+            raise self._open_error
+        atexit.register(self.close)
+
+    def submit(self, row: LoggedUsageRow):
+        """
+        Queue a usage row for persistence
+
+        Returns at once unless max_queue rows are still unwritten (see
+        block). Cost is stored as charged, so totals restored later do not depend
+        on the pricing catalog at that time.
+
+        :param row: (timestamp, provider, model, input_tokens, output_tokens, cost)
+        """
+        if not self._thread.is_alive() or not self._reserve_slot():
+            # Closed, writer died or no room: nothing will write the row
+            self.dropped += 1
+            return
+        self._queue.put(row)
+
+    def _reserve_slot(self) -> bool:
+        if self._slots.acquire(blocking=False):
+            return True
+        if not self.block:
+            return False
+        # Wait in slices so a writer that dies meanwhile cannot block us forever
+        while self._thread.is_alive():
+            if self._slots.acquire(timeout=0.1):
+                return True
+        return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until everything submitted so far has been written
+
+        :param timeout: Maximum seconds to wait
+        :return: Whether the flush completed in time (False if the writer is not running)
+        """
+        if not self._thread.is_alive():
+            return self._closed and self._queue.empty()
+        expires = time.monotonic() + timeout if timeout is not None else None
+        done = threading.Event()
+        self._queue.put(done)
+        # Wait in slices so a writer that dies meanwhile cannot block us forever
+        while not done.is_set():
+            if not self._thread.is_alive():
+                return done.is_set()
+            remaining = expires - time.monotonic() if expires is not None else 0.1
+            if remaining <= 0:
+                return False
+            done.wait(min(remaining, 0.1))
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """
+        Write any pending entries and stop the writer thread
+
+        Also registered as an atexit hook, so it never waits longer than
+        timeout for the writer.
+
+        :param timeout: Maximum seconds to wait for pending entries (None waits forever)
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("%s: writer still busy after %ss, abandoning pending entries",
+                           type(self).__name__, timeout)
+
+    def rehydrate(self, tracker: TokenTracker):
+        """
+        Restore a tracker's aggregates from the persisted log
+
+        :param tracker: Tracker to restore into
+        """
+        tracker.restore(self.load_aggregates())
+
+    def _run(self):
+        try:
+            self._open()
+        except Exception as e:
+            self._open_error = e
+            self._close()
+            return
+        finally:
+            self._ready.set()
+        try:
+            batch: List[LoggedUsageRow] = []
+            deadline = 0.0
+            while True:
+                timeout = max(0.0, deadline - time.monotonic()) if batch else None
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if isinstance(item, tuple):
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(item)
+                    if len(batch) < self.batch_size and time.monotonic() < deadline:
+                        continue
+
+                # Batch full, interval elapsed, explicit flush or shutdown
+                if batch:
+                    try:
+                        self._write_batch(batch)
+                    except Exception:
+                        # Keep the writer alive; later batches may still succeed
+                        logger.exception("%s: failed to write %d usage rows", type(self).__name__, len(batch))
+                        self.write_errors += 1
+                        self.dropped += len(batch)
+                    for _ in batch:
+                        self._slots.release()
+                    batch = []
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is _STOP:
+                    break
+        finally:
+            self._close()
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        # Also called after a failed _open, so it must tolerate partial state
+        pass
+
+    @abstractmethod
+    def _write_batch(self, batch: List[LoggedUsageRow]):
+        """
+        Persist one batch of usage rows (called on the writer thread)
+
+        :param batch: Usage rows
+        """
+        pass
+
+    @abstractmethod
+    def iter_rows(self) -> Iterator[LoggedUsageRow]:
+        """
+        Iterate persisted usage rows in write order
+
+        :return: Iterator of usage rows
+        """
+        pass
+
+    def load_aggregates(self) -> TokenUsageSnapshot:
+        """
+        Aggregate the persisted log into tracker totals
+
+        :return: Usage snapshot
+        """
+        snapshot = TokenUsageSnapshot(0, {}, {})
+        for _, provider, model, input_tokens, output_tokens, cost in self.iter_rows():
+            _add_usage(snapshot, provider, model, input_tokens + output_tokens, cost)
+        return snapshot
+
+class JSONLUsageSink(UsageLogSink):
+    def __init__(self, path: str, **kwargs):
+        """
+        Append-only JSON Lines usage log
+
+        :param path: Log file path
+        :param kwargs: Batching options (see UsageLogSink)
+        """
+        self.path = path
+        super().__init__(**kwargs)
+
+    def _open(self):
+        self._drop_torn_tail()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _drop_torn_tail(self):
+        # A crash mid-write leaves a partial last line; appending to it would
+        # glue the next record onto the fragment, so cut back to the last newline
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as log_file:
+            end = log_file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 4096)
+                log_file.seek(start)
+                chunk = log_file.read(position - start)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                log_file.truncate(position)
+
+    def _close(self):
+        if getattr(self, "_file", None) is not None:
+            self._file.close()
+
+    def _write_batch(self, batch: List[LoggedUsageRow]):
+        self._file.write("".join(
+            json.dumps({
+                "timestamp": timestamp,
+                "provider": provider,
+                "model": model,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cost": cost
+            }) + "\n"
+            for timestamp, provider, model, input_tokens, output_tokens, cost in batch
+        ))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def iter_rows(self) -> Iterator[LoggedUsageRow]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final line from a crash mid-write
+                    continue
+                yield (
+                    record["timestamp"],
+                    record["provider"],
+                    record["model"],
+                    record["input_tokens"],
+                    record["output_tokens"],
+                    # Logs written before cost was persisted
+                    record.get("cost", 0.0)
+                )
+
+class SQLiteUsageSink(UsageLogSink):
+    def __init__(self, path: str, **kwargs):
+        """
+        SQLite usage log in WAL mode
+
+        :param path: Database file path
+        :param kwargs: Batching options (see UsageLogSink)
+        """
+        self.path = path
+        super().__init__(**kwargs)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS usage_log ("
+            " timestamp REAL NOT NULL,"
+            " provider TEXT NOT NULL,"
+            " model TEXT,"
+            " input_tokens INTEGER NOT NULL,"
+            " output_tokens INTEGER NOT NULL,"
+            " cost REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(usage_log)")]
+        if "cost" not in columns:
+            # Databases written before cost was persisted
+            connection.execute("ALTER TABLE usage_log ADD COLUMN cost REAL NOT NULL DEFAULT 0")
+        return connection
+
+    def _open(self):
+        # sqlite3 connections belong to the thread that created them
+        self._connection = self._connect()
+
+    def _close(self):
+        if getattr(self, "_connection", None) is not None:
+            self._connection.close()
+
+    def _write_batch(self, batch: List[LoggedUsageRow]):
+        with self._connection:
+            self._connection.executemany("INSERT INTO usage_log VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+    def iter_rows(self) -> Iterator[LoggedUsageRow]:
+        connection = self._connect()
+        try:
+            yield from connection.execute(
+                "SELECT timestamp, provider, model, input_tokens, output_tokens, cost"
+                " FROM usage_log ORDER BY rowid"
+            )
+        finally:
+            connection.close()
+
+    def load_aggregates(self) -> TokenUsageSnapshot:
+        # Let SQLite do the grouping instead of replaying every row
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT provider, model, SUM(input_tokens + output_tokens), SUM(cost)"
+                " FROM usage_log GROUP BY provider, model"
+            ).fetchall()
+        finally:
+            connection.close()
+
+        snapshot = TokenUsageSnapshot(0, {}, {})
+        for provider, model, tokens, cost in rows:
+            _add_usage(snapshot, provider, model, tokens, cost)
+        return snapshot
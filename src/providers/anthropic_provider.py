@@ -1,72 +1,278 @@
-import anthropic
-from .base_provider import BaseProvider, ModelResponse
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Union, List, Dict, Optional, AsyncIterator, Tuple
+from src.core.pricing import PricingView
+from .base_provider import BaseProvider, ModelResponse, StreamChunk, TokenAccounting
+from .context_window import message_text
+from .rate_limiter import RateLimitScheduler
+from src.utils.error_handler import RetryPolicy, classify_error
+
+if TYPE_CHECKING:
+    import anthropic
 
 class AnthropicProvider(BaseProvider):
-    PRICING = {
-        "claude-2": {
-            "input_token_cost": 0.008,    # per 1000 tokens
-            "output_token_cost": 0.024    # per 1000 tokens
-        }
-    }
-
-    def __init__(self, 
-                 api_key: str, 
-                 model: str = "claude-2"):
+    # Live view of the Anthropic table in the shared pricing catalog
+    PRICING = PricingView("anthropic")
+    PRICING_PROVIDER = "anthropic"
+
+    def __init__(self,
+                 api_key: str,
+                 model: str = "claude-2",
+                 base_url: Optional[str] = None,
+                 max_concurrency: Optional[int] = None,
+                 token_accounting: str = TokenAccounting.USAGE.value,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None):
         """
         Anthropic Provider with Claude models
-        
+
         :param api_key: Anthropic API key
         :param model: Specific Anthropic model
+        :param base_url: Override for the Anthropic API base URL
+        :param max_concurrency: Maximum number of in-flight requests (unbounded if None)
+        :param token_accounting: Token counting mode ("usage" trusts API usage, "local" re-tokenizes)
+        :param retry_policy: Retry/backoff/hedging policy for API calls (no retries if None)
+        :param rate_limiter: Scheduler enforcing per-model RPM/TPM limits (may be shared)
+        """
+        super().__init__(api_key, model, max_concurrency, token_accounting, retry_policy, rate_limiter)
+        self.base_url = base_url
+        self._client: Optional["anthropic.AsyncAnthropic"] = None
+
+    @property
+    def client(self) -> "anthropic.AsyncAnthropic":
+        """
+        Async Anthropic client, created (and the SDK imported) on first use
+        """
+        if self._client is None:
+            import anthropic
+            self._client = anthropic.AsyncAnthropic(api_key=self.api_key, base_url=self.base_url,
+                                                    **self._client_options())
+        return self._client
+
+    @client.setter
+    def client(self, client: "anthropic.AsyncAnthropic"):
+        self._client = client
+
+    def _prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """
+        Local estimate of the prompt tokens of a message list
+
+        :param messages: Chat messages
+        :return: Number of tokens
+        """
+        return sum(self._calculate_tokens(message_text(msg.get("content"))) for msg in messages)
+
+    @staticmethod
+    def _split_system(messages: List[Dict[str, Any]], system: Any = None) -> Tuple[List[Dict[str, Any]], Any]:
         """
-        super().__init__(api_key, model)
-        self.client = anthropic.Anthropic(api_key=api_key)
+        Move OpenAI-style system messages into the Messages API system parameter
 
-    def generate(self, 
-                 prompt: str, 
-                 **kwargs) -> ModelResponse:
+        :param messages: Chat messages
+        :param system: System prompt passed explicitly, if any
+        :return: Tuple of (messages without system entries, system prompt or None)
         """
-        Generate response using Anthropic's API
-        
-        :param prompt: Input text prompt
+        chat = [msg for msg in messages if msg.get("role") != "system"]
+        if len(chat) == len(messages):
+            return messages, system
+        parts = [message_text(system)] if system else []
+        parts += [message_text(msg.get("content")) for msg in messages if msg.get("role") == "system"]
+        return chat, "\n\n".join(parts)
+
+    def accepts_prompt(self, prompt: Any) -> bool:
+        """
+        Whether generate takes a prompt of this shape
+
+        Tool calls and tool replies use a different format in the Messages
+        API, so message lists carrying them are not accepted.
+
+        :param prompt: Text or list of chat messages
+        :return: True for text and system/user/assistant message lists
+        """
+        if isinstance(prompt, list):
+            return all(
+                isinstance(msg, dict) and msg.get("role") in ("system", "user", "assistant")
+                and not msg.get("tool_calls")
+                for msg in prompt
+            )
+        return isinstance(prompt, str)
+
+    async def generate(self,
+                       prompt: Union[str, List[Dict[str, str]]],
+                       **kwargs) -> ModelResponse:
+        """
+        Generate response using Anthropic's Messages API
+
+        :param prompt: User prompt (string or message list)
         :param kwargs: Additional Anthropic generation parameters
         :return: Comprehensive model response
         """
         try:
-            # Prepare generation parameters
+            admission = self._pop_admission(kwargs)
+            deadline = kwargs.pop('deadline', None)
+            if isinstance(prompt, str):
+                messages = [{"role": "user", "content": prompt}]
+            else:
+                messages = prompt
+
+            # Prepare generation parameters (the Messages API requires max_tokens)
             generation_params = {
                 "model": self.model,
-                "prompt": prompt,
+                "messages": messages,
+                "max_tokens": kwargs.get("max_tokens", 1024),
                 **kwargs
             }
+            generation_params["messages"], system = self._split_system(messages, kwargs.get("system"))
+            if system:
+                generation_params["system"] = system
 
-            # Generate response
-            raw_response = self.client.completions.create(**generation_params)
-            generated_text = raw_response.completion
+            async with self._reservation(
+                self.model,
+                lambda: self._prompt_tokens(messages),
+                self._output_budget(generation_params),
+                admission
+            ) as reservation:
+                # Generate response
+                raw_response = await self._send(
+                    lambda: self.client.messages.create(**generation_params), deadline, reservation
+                )
+                generated_text = "".join(
+                    block.text for block in raw_response.content
+                    if block.type == "text"
+                )
 
-            # Calculate tokens
-            input_tokens = self.client.count_tokens(prompt)
-            output_tokens = self.client.count_tokens(generated_text)
+                # Resolve tokens (server-reported usage unless accounting is local)
+                input_tokens, output_tokens, token_source = self._resolve_usage(
+                    raw_response,
+                    lambda: self._prompt_tokens(messages),
+                    lambda: self._calculate_tokens(generated_text)
+                )
+                reservation.used = input_tokens + output_tokens
             total_tokens = input_tokens + output_tokens
 
             # Calculate cost
-            pricing = self.PRICING.get(self.model, {})
-            input_cost = (input_tokens / 1000) * pricing.get("input_token_cost", 0)
-            output_cost = (output_tokens / 1000) * pricing.get("output_token_cost", 0)
-            total_cost = round(input_cost + output_cost, 4)
+            total_cost = round(self.get_model_price().cost(input_tokens, output_tokens), 4)
 
             # Create response object
             return ModelResponse(
                 provider="Anthropic",
                 model=self.model,
-                prompt=prompt,
+                prompt=str(prompt),
                 response=generated_text,
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
                 total_tokens=total_tokens,
                 cost=total_cost,
                 raw_response=raw_response,
-                metadata=kwargs
+                metadata={**kwargs, "token_source": token_source}
+            )
+
+        except Exception as e:
+            raise classify_error(e, "Anthropic generation error", "Anthropic") from e
+
+    async def generate_stream(self,
+                              prompt: Union[str, List[Dict[str, str]]],
+                              **kwargs) -> AsyncIterator[StreamChunk]:
+        """
+        Stream a Messages API response, yielding text deltas as they arrive
+
+        Each chunk carries a running output token and cost estimate; the final
+        chunk has an empty delta and the complete ModelResponse, whose metadata
+        records time_to_first_token and latency in seconds.
+
+        :param prompt: User prompt (string or message list)
+        :param kwargs: Additional Anthropic generation parameters
+        :return: Async iterator of stream chunks
+        """
+        try:
+            admission = self._pop_admission(kwargs)
+            deadline = kwargs.pop('deadline', None)
+            if isinstance(prompt, str):
+                messages = [{"role": "user", "content": prompt}]
+            else:
+                messages = prompt
+
+            generation_params = {
+                "model": self.model,
+                "messages": messages,
+                "max_tokens": kwargs.get("max_tokens", 1024),
+                **kwargs,
+                "stream": True
+            }
+            generation_params["messages"], system = self._split_system(messages, kwargs.get("system"))
+            if system:
+                generation_params["system"] = system
+
+            price = self.get_model_price()
+            output_rate = price.output_cost_per_token
+            parts = []
+            output_estimate = 0
+            usage = SimpleNamespace(input_tokens=None, output_tokens=None)
+            time_to_first_token = None
+
+            async with self._reservation(
+                self.model,
+                lambda: self._prompt_tokens(messages),
+                self._output_budget(generation_params),
+                admission
+            ) as reservation:
+                started = time.perf_counter()
+                async with self._request_slot():
+                    stream = await self._open_stream(
+                        lambda: self.client.messages.create(**generation_params), deadline, reservation
+                    )
+                    async for event in stream:
+                        if event.type == "message_start":
+                            usage.input_tokens = event.message.usage.input_tokens
+                        elif event.type == "message_delta":
+                            # Cumulative output token count for the message
+                            usage.output_tokens = event.usage.output_tokens
+                        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                            if time_to_first_token is None:
+                                time_to_first_token = time.perf_counter() - started
+                            parts.append(event.delta.text)
+                            output_estimate += self._calculate_tokens(event.delta.text)
+                            reservation.output_streamed = output_estimate
+                            yield StreamChunk(
+                                delta=event.delta.text,
+                                output_tokens=output_estimate,
+                                cost=round(output_estimate * output_rate, 6)
+                            )
+                latency = time.perf_counter() - started
+                generated_text = "".join(parts)
+
+                # Resolve tokens from the usage reported by the stream events
+                input_tokens, output_tokens, token_source = self._resolve_usage(
+                    SimpleNamespace(usage=usage),
+                    lambda: self._prompt_tokens(messages),
+                    lambda: output_estimate
+                )
+                reservation.used = input_tokens + output_tokens
+            total_tokens = input_tokens + output_tokens
+            total_cost = round(price.cost(input_tokens, output_tokens), 4)
+
+            response = ModelResponse(
+                provider="Anthropic",
+                model=self.model,
+                prompt=str(prompt),
+                response=generated_text,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                total_tokens=total_tokens,
+                cost=total_cost,
+                metadata={
+                    **kwargs,
+                    "token_source": token_source,
+                    "stream": True,
+                    "time_to_first_token": time_to_first_token,
+                    "latency": latency
+                }
+            )
+            yield StreamChunk(
+                delta="",
+                output_tokens=output_tokens,
+                cost=total_cost,
+                response=response
             )
 
         except Exception as e:
-            raise RuntimeError(f"Anthropic generation error: {str(e)}")
\ No newline at end of file
+            raise classify_error(e, "Anthropic streaming error", "Anthropic") from e
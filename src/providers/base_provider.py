@@ -1,7 +1,20 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Callable, Tuple, Awaitable, Iterable, AsyncIterator
 from dataclasses import dataclass, field
 from datetime import datetime
+from enum import Enum
+from src.core.pricing import ModelPrice, pricing_catalog
+from src.utils.error_handler import DeadlineExceededError, ProviderTimeoutError, RetryPolicy, classify_error
+from src.providers.batch import BatchRun, ProgressCallback
+from src.providers.rate_limiter import Priority, RateLimitScheduler
+
+class TokenAccounting(Enum):
+    # Trust the usage block returned by the API, count locally only if missing
+    USAGE = "usage"
+    # Always re-tokenize prompt and response locally
+    LOCAL = "local"
 
 @dataclass
 class ModelResponse:
@@ -20,18 +33,93 @@ class ModelResponse:
     raw_response: Any = None
     metadata: Dict[str, Any] = field(default_factory=dict)
 
+@dataclass
+class StreamChunk:
+    """
+    Incremental piece of a streamed generation
+    
+    output_tokens and cost are running estimates over the text streamed so
+    far (cost covers output tokens only until the final chunk). The final
+    chunk carries an empty delta and the complete ModelResponse.
+    """
+    delta: str
+    output_tokens: int = 0
+    cost: float = 0.0
+    response: Optional[ModelResponse] = None
+
+@dataclass
+class _Reservation:
+    """
+    Rate-limit tokens held by one request; set used once usage is known
+
+    Attempts that reach the server without reporting usage (timed out,
+    cancelled or hedged) add their input estimate to spent. Streams set
+    accepted once open and keep output_streamed current.
+    """
+    model: str
+    admission: Tuple[int, Any]
+    limited: bool = False
+    input_estimate: int = 0
+    output_budget: int = 0
+    reserved: int = 0
+    spent: int = 0
+    accepted: bool = False
+    output_streamed: int = 0
+    used: Optional[int] = None
+
+    def actual_tokens(self) -> int:
+        """
+        Tokens to settle the reservation at
+
+        :return: Usage if known, otherwise what the server may have consumed
+        """
+        if self.used is not None:
+            return self.spent + self.used
+        if self.accepted:
+            return self.spent + self.input_estimate + self.output_streamed
+        return self.spent
+
+class _Unbounded:
+    """
+    No-op async context manager used when concurrency is not limited
+    """
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
 class BaseProvider(ABC):
+    # Provider key used for price lookups in the pricing catalog
+    PRICING_PROVIDER: Optional[str] = None
+
     def __init__(self, 
                  api_key: str, 
-                 model: str = "default_model"):
+                 model: str = "default_model",
+                 max_concurrency: Optional[int] = None,
+                 token_accounting: str = TokenAccounting.USAGE.value,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None):
         """
         Base AI Provider with standardized interface
         
         :param api_key: Authentication key for the provider
         :param model: Specific model to use
+        :param max_concurrency: Maximum number of in-flight requests (unbounded if None)
+        :param token_accounting: Token counting mode ("usage" or "local")
+        :param retry_policy: Retry/backoff/hedging policy for API calls (no retries if None)
+        :param rate_limiter: Scheduler enforcing per-model RPM/TPM limits (may be shared)
         """
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be a positive integer")
+
         self.api_key = api_key
         self.model = model
+        self.max_concurrency = max_concurrency
+        self.token_accounting = TokenAccounting(token_accounting).value
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self._semaphore: Optional[asyncio.Semaphore] = None
 
     @abstractmethod
     async def generate(self, 
@@ -46,6 +134,250 @@ class BaseProvider(ABC):
         """
         pass
 
+    def accepts_prompt(self, prompt: Any) -> bool:
+        """
+        Whether generate takes a prompt of this shape
+        
+        Providers that also take chat message lists override this.
+        
+        :param prompt: Text or list of chat messages
+        :return: True for plain text prompts
+        """
+        return isinstance(prompt, str)
+
+    def generate_many(self,
+                      prompts: Iterable[Any],
+                      concurrency: int = 8,
+                      on_progress: Optional[ProgressCallback] = None,
+                      **kwargs) -> BatchRun:
+        """
+        Run generate over many prompts with bounded concurrency
+        
+        Iterate the returned run with ``async for`` to receive BatchResult
+        objects as they complete (or await ``run.collect()`` for all of them in
+        prompt order). Failures are captured per prompt; ``run.summary`` holds
+        the aggregated tokens and cost.
+        
+        :param prompts: Prompts to generate for
+        :param concurrency: Maximum prompts in flight
+        :param on_progress: Called with (summary, result) after each completion
+        :param kwargs: Generation parameters passed to every call
+        :return: Batch run
+        """
+        return BatchRun(self.generate, prompts, concurrency, on_progress, **kwargs)
+
+    def _request_slot(self):
+        """
+        Async context manager that bounds in-flight requests to max_concurrency
+        
+        :return: Semaphore (or no-op context manager when unbounded)
+        """
+        if self.max_concurrency is None:
+            return _Unbounded()
+        # Created lazily so the semaphore binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _client_options(self) -> Dict[str, Any]:
+        """
+        Extra keyword arguments for the SDK client constructor
+        
+        :return: Client options
+        """
+        # Let the retry policy own retries rather than stacking them on the SDK's
+        return {"max_retries": 0} if self.retry_policy is not None else {}
+
+    async def _send(self,
+                    request: Callable[[], Awaitable[Any]],
+                    deadline: Optional[float] = None,
+                    reservation: Optional[_Reservation] = None) -> Any:
+        """
+        Send an API request through the concurrency limit and retry policy
+        
+        Each attempt (including hedged duplicates) takes its own request slot,
+        and attempts after the first take their own rate-limit admission.
+        
+        :param request: Coroutine function issuing the SDK call
+        :param deadline: Time budget in seconds for this call, across retries
+        :param reservation: Rate-limit reservation of the call, if any
+        :return: SDK response
+        """
+        attempts = 0
+
+        async def attempt():
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1 and reservation is not None and reservation.limited:
+                # Retries and hedges resend the whole prompt
+                tokens = reservation.input_estimate + reservation.output_budget
+                await self.rate_limiter.acquire(reservation.model, tokens, *reservation.admission)
+                reservation.reserved += tokens
+            async with self._request_slot():
+                try:
+                    return await request()
+                except BaseException as e:
+                    self._charge_unreported(reservation, e)
+                    raise
+
+        policy = self.retry_policy
+        if policy is None:
+            if deadline is None:
+                return await attempt()
+            policy = RetryPolicy(max_attempts=1)
+        return await policy.run(attempt, deadline, type(self).__name__)
+
+    @staticmethod
+    def _charge_unreported(reservation: Optional[_Reservation], error: BaseException):
+        """
+        Charge an attempt's input to the reservation if the server may have processed it
+        
+        Cancelled and timed-out attempts were in flight, so their prompt
+        counts; rejected requests and connection failures did not reach the model.
+        
+        :param reservation: Rate-limit reservation of the call, if any
+        :param error: Exception that ended the attempt
+        """
+        if reservation is None or not reservation.limited:
+            return
+        if isinstance(error, (asyncio.CancelledError, asyncio.TimeoutError)) \
+                or isinstance(classify_error(error, "Request failed"), ProviderTimeoutError):
+            reservation.spent += reservation.input_estimate
+
+    async def _open_stream(self,
+                           request: Callable[[], Awaitable[Any]],
+                           deadline: Optional[float] = None,
+                           reservation: Optional[_Reservation] = None) -> Any:
+        """
+        Open a streaming response within the call's deadline
+        
+        The deadline (or the retry policy's default) covers stream setup, up
+        to the response headers; reading the stream is not bounded. Setup is
+        not retried. Call this while holding the request slot.
+        
+        :param request: Coroutine function issuing the streaming SDK call
+        :param deadline: Time budget in seconds for stream setup
+        :param reservation: Rate-limit reservation of the call, if any
+        :return: SDK stream
+        """
+        if deadline is None and self.retry_policy is not None:
+            deadline = self.retry_policy.deadline
+        try:
+            if deadline is None:
+                stream = await request()
+            else:
+                stream = await asyncio.wait_for(request(), deadline)
+        except asyncio.TimeoutError as e:
+            self._charge_unreported(reservation, e)
+            raise DeadlineExceededError(f"Deadline of {deadline}s exceeded", type(self).__name__) from e
+        except BaseException as e:
+            self._charge_unreported(reservation, e)
+            raise
+        if reservation is not None:
+            # From here on the prompt and any streamed output are consumed
+            reservation.accepted = True
+        return stream
+
+    @staticmethod
+    def _pop_admission(kwargs: Dict[str, Any]) -> Tuple[int, Any]:
+        """
+        Remove the per-call rate-limit options so they are not sent to the API
+        
+        :param kwargs: Call keyword arguments (modified in place)
+        :return: Tuple of (priority, tenant)
+        """
+        return kwargs.pop('priority', Priority.NORMAL), kwargs.pop('tenant', None)
+
+    @asynccontextmanager
+    async def _reservation(self,
+                           model: str,
+                           estimate_input: Callable[[], int],
+                           output_budget: int,
+                           admission: Tuple[int, Any]) -> AsyncIterator[_Reservation]:
+        """
+        Hold rate-limit admission for the duration of a request
+        
+        Waits for admission on entry and settles with the rate limiter on
+        exit. The caller sets reservation.used once usage is known. A request
+        that fails before then is refunded only if it never reached the
+        server; a timed-out attempt or an abandoned stream is settled at its
+        input estimate plus the output streamed so far.
+        
+        :param model: Model the request is for
+        :param estimate_input: Pre-flight input token estimate (only called when rate limited)
+        :param output_budget: Output tokens the request may use
+        :param admission: (priority, tenant) from _pop_admission
+        :return: Async context manager yielding the reservation
+        """
+        reservation = _Reservation(model, admission)
+        if self.rate_limiter is not None:
+            reservation.input_estimate = estimate_input()
+            reservation.output_budget = output_budget
+            tokens = reservation.input_estimate + output_budget
+            await self.rate_limiter.acquire(model, tokens, *admission)
+            reservation.reserved = tokens
+            reservation.limited = True
+        try:
+            yield reservation
+        finally:
+            if reservation.limited:
+                actual = reservation.actual_tokens()
+                if actual != reservation.reserved:
+                    self.rate_limiter.settle(model, reservation.reserved, actual)
+
+    @staticmethod
+    def _output_budget(params: Dict[str, Any]) -> int:
+        """
+        Output tokens a request may use, for pre-flight estimates
+        
+        :param params: Generation parameters
+        :return: max_tokens (or max_completion_tokens), 0 if unset
+        """
+        return params.get('max_tokens') or params.get('max_completion_tokens') or 0
+
+    def _resolve_usage(self,
+                       raw_response: Any,
+                       count_input: Callable[[], int],
+                       count_output: Optional[Callable[[], int]] = None) -> Tuple[int, int, str]:
+        """
+        Resolve input/output token counts for a response
+        
+        In "usage" mode the counts reported by the API are used as-is and the
+        local counters are only invoked when the usage block is missing.
+        
+        :param raw_response: Raw API response
+        :param count_input: Local fallback counter for input tokens
+        :param count_output: Local fallback counter for output tokens (None if no output tokens)
+        :return: Tuple of (input_tokens, output_tokens, token_source)
+        """
+        usage = getattr(raw_response, "usage", None)
+        if self.token_accounting == TokenAccounting.USAGE.value and usage is not None:
+            # OpenAI reports prompt/completion tokens, Anthropic input/output tokens
+            input_tokens = getattr(usage, "prompt_tokens", None)
+            if input_tokens is None:
+                input_tokens = getattr(usage, "input_tokens", None)
+            output_tokens = getattr(usage, "completion_tokens", None)
+            if output_tokens is None:
+                output_tokens = getattr(usage, "output_tokens", None)
+            if output_tokens is None and count_output is None:
+                output_tokens = 0
+
+            if input_tokens is not None and output_tokens is not None:
+                return input_tokens, output_tokens, TokenAccounting.USAGE.value
+
+        input_tokens = count_input()
+        output_tokens = count_output() if count_output is not None else 0
+        return input_tokens, output_tokens, TokenAccounting.LOCAL.value
+
+    def get_model_price(self, model: Optional[str] = None) -> ModelPrice:
+        """
+        Compiled per-token price for a model from the pricing catalog
+        
+        :param model: Model name (defaults to current model)
+        :return: Model price (zero rates for unknown models)
+        """
+        return pricing_catalog.resolve(model or self.model, self.PRICING_PROVIDER)
+
     def validate_api_key(self) -> bool:
         """
         Validate the provider's API key
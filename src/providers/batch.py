@@ -0,0 +1,151 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Iterable, List, Optional
+)
+
+if TYPE_CHECKING:
+    from src.providers.base_provider import ModelResponse
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of one prompt in a batch run
+    """
+    index: int
+    prompt: Any
+    response: Optional["ModelResponse"] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+@dataclass
+class BatchSummary:
+    """
+    Aggregated usage and cost of a batch run
+    """
+    total: Optional[int] = None
+    completed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    cost: float = 0.0
+    elapsed: float = 0.0
+
+ProgressCallback = Callable[[BatchSummary, BatchResult], None]
+
+class BatchRun:
+    def __init__(self,
+                 generate: Callable[..., Awaitable["ModelResponse"]],
+                 prompts: Iterable[Any],
+                 concurrency: int = 8,
+                 on_progress: Optional[ProgressCallback] = None,
+                 **kwargs):
+        """
+        Run many prompts through a provider with bounded concurrency
+
+        A fixed pool of concurrency workers pulls prompts lazily, so large
+        inputs never create one task per prompt. Iterating the run (async for)
+        yields BatchResult objects as they complete; a failing prompt becomes
+        a result with .error set and does not cancel its siblings. At most
+        concurrency finished results are buffered, so a slow consumer holds
+        the workers back instead of piling up responses in memory. Leaving
+        the loop early cancels the outstanding work.
+
+        :param generate: Provider generate coroutine function
+        :param prompts: Prompts to run (any iterable)
+        :param concurrency: Maximum prompts in flight
+        :param on_progress: Called with (summary, result) after each completion
+        :param kwargs: Generation parameters passed to every call
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive integer")
+
+        self._generate = generate
+        self._prompts = prompts
+        self.concurrency = concurrency
+        self.on_progress = on_progress
+        self.kwargs = kwargs
+        self._summary = BatchSummary(total=len(prompts) if hasattr(prompts, "__len__") else None)
+        self._started: Optional[float] = None
+
+    @property
+    def summary(self) -> BatchSummary:
+        """
+        Usage and cost so far (final once iteration has finished)
+
+        :return: Batch summary
+        """
+        return self._summary
+
+    async def _worker(self, prompts, results: "asyncio.Queue"):
+        for index, prompt in prompts:
+            try:
+                response = await self._generate(prompt, **self.kwargs)
+                result = BatchResult(index, prompt, response=response)
+            except Exception as e:
+                result = BatchResult(index, prompt, error=e)
+            await results.put(result)
+
+    def _record(self, result: BatchResult):
+        summary = self._summary
+        summary.completed += 1
+        if result.ok:
+            summary.succeeded += 1
+            response = result.response
+            summary.input_tokens += response.input_tokens
+            summary.output_tokens += response.output_tokens
+            summary.total_tokens += response.total_tokens
+            summary.cost += response.cost
+        else:
+            summary.failed += 1
+        summary.elapsed = time.perf_counter() - self._started
+        if self.on_progress is not None:
+            self.on_progress(summary, result)
+
+    async def __aiter__(self) -> AsyncIterator[BatchResult]:
+        if self._started is not None:
+            raise RuntimeError("A batch run can only be iterated once")
+        self._started = time.perf_counter()
+
+        # Workers share one iterator, so each prompt is taken exactly once
+        prompts = enumerate(self._prompts)
+        # Bounded, so workers block on put (and stop pulling prompts) when the consumer lags
+        results: "asyncio.Queue" = asyncio.Queue(maxsize=self.concurrency)
+        workers = [
+            asyncio.ensure_future(self._worker(prompts, results))
+            for _ in range(self.concurrency)
+        ]
+        finished = asyncio.ensure_future(asyncio.gather(*workers))
+        try:
+            while True:
+                if results.empty() and finished.done():
+                    break
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                result = getter.result()
+                self._record(result)
+                yield result
+            # Surface unexpected worker failures (e.g. the prompt iterable raising)
+            finished.result()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            finished.cancel()
+
+    async def collect(self) -> List[BatchResult]:
+        """
+        Run to completion and return every result in prompt order
+
+        :return: Results sorted by prompt index
+        """
+        results = [result async for result in self]
+        return sorted(results, key=lambda result: result.index)
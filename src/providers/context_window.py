@@ -0,0 +1,209 @@
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from src.core.tokenizer_registry import TokenizerRegistry
+from src.utils.error_handler import ContextWindowExceededError
+
+if TYPE_CHECKING:
+    import tiktoken
+
+# Chat formatting overhead, per the OpenAI token counting guide
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+TRUNCATION_MARKER = "\n[...]\n"
+
+Messages = List[Dict[str, Any]]
+
+def message_text(content: Any) -> str:
+    """
+    Countable text of a chat message's content
+
+    Assistant tool-call turns have None content and multipart content is a
+    list of parts; only the text parts are counted (image and audio parts
+    are priced by the provider separately).
+
+    :param content: Message content (string, None or list of parts)
+    :return: Text to tokenize
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            (part.get("text") or "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return ""
+
+class ContextPolicy(Enum):
+    # Raise ContextWindowExceededError without sending the request
+    REJECT = "reject"
+    # Drop the oldest non-system turns (with their tool replies), keeping the latest one
+    DROP_OLDEST = "drop_oldest"
+    # Cut tokens from the middle of the longest message
+    TRUNCATE_MIDDLE = "truncate_middle"
+    # Split the longest message into chunks that each fit (map-reduce)
+    CHUNK = "chunk"
+
+class ContextFitter:
+    def __init__(self, encoding: "tiktoken.Encoding", context_window: int, model: Optional[str] = None):
+        """
+        Pre-flight check of chat messages against a model's context window
+
+        Tokens are counted locally (through the shared token-count cache), so
+        requests that cannot fit are handled before any network round-trip.
+        Prompts whose byte length already fits are passed through untokenized.
+
+        :param encoding: tiktoken encoding of the model
+        :param context_window: Context window in tokens (0 disables the check)
+        :param model: Model name used in error messages
+        """
+        self.encoding = encoding
+        self.context_window = context_window
+        self.model = model
+
+    def count(self, messages: Messages) -> int:
+        """
+        Prompt tokens of a message list, including chat formatting overhead
+
+        :param messages: Chat messages
+        :return: Estimated prompt tokens
+        """
+        counts = TokenizerRegistry.count_tokens_batch(
+            self.encoding, [message_text(msg.get("content")) for msg in messages]
+        )
+        return sum(counts) + TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_REPLY
+
+    def upper_bound(self, messages: Messages) -> int:
+        """
+        Cheap upper bound on the prompt tokens of a message list
+
+        Every BPE token covers at least one UTF-8 byte, so the byte length
+        bounds the token count without tokenizing.
+
+        :param messages: Chat messages
+        :return: Prompt tokens the messages can at most use
+        """
+        size = sum(len(message_text(msg.get("content")).encode("utf-8")) for msg in messages)
+        return size + TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_REPLY
+
+    def fit(self, messages: Messages, output_tokens: int = 0, policy: str = ContextPolicy.REJECT.value) -> List[Messages]:
+        """
+        Make messages fit the window minus the output budget
+
+        :param messages: Chat messages
+        :param output_tokens: Tokens reserved for the completion (max_tokens)
+        :param policy: Context policy applied when the messages do not fit
+        :return: Message lists to send (more than one only for the chunk policy)
+        """
+        policy = ContextPolicy(policy)
+        if not self.context_window:
+            return [messages]
+
+        budget = self.context_window - output_tokens
+        if self.upper_bound(messages) <= budget:
+            # Clearly fits: skip tokenizing the prompt
+            return [messages]
+        total = self.count(messages)
+        if total <= budget:
+            return [messages]
+
+        if policy is ContextPolicy.DROP_OLDEST:
+            return [self._drop_oldest(messages, total, budget)]
+        if policy is ContextPolicy.TRUNCATE_MIDDLE:
+            return [self._truncate_middle(messages, total, budget)]
+        if policy is ContextPolicy.CHUNK:
+            return self._chunk(messages, total, budget)
+        raise self._exceeded(total, budget)
+
+    def _exceeded(self, total: int, budget: int) -> ContextWindowExceededError:
+        return ContextWindowExceededError(
+            f"Prompt needs {total} tokens but {self.model or 'the model'} has room for {budget} "
+            f"({self.context_window} context window minus the output budget)"
+        )
+
+    @staticmethod
+    def _turns(messages: Messages) -> List[List[int]]:
+        """
+        Group non-system messages into turns that must be dropped together
+
+        A user message goes with the assistant reply to it, and an assistant
+        message with the tool replies that follow it, so tool calls are never
+        separated from their results.
+
+        :param messages: Chat messages
+        :return: Message indices of each turn, oldest first
+        """
+        turns = []
+        index = 0
+        while index < len(messages):
+            role = messages[index].get("role")
+            index += 1
+            if role == "system":
+                continue
+            turn = [index - 1]
+            if role == "user" and index < len(messages) and messages[index].get("role") == "assistant":
+                turn.append(index)
+                index += 1
+            while index < len(messages) and messages[index].get("role") == "tool":
+                turn.append(index)
+                index += 1
+            turns.append(turn)
+        return turns
+
+    def _drop_oldest(self, messages: Messages, total: int, budget: int) -> Messages:
+        counts = TokenizerRegistry.count_tokens_batch(
+            self.encoding, [message_text(msg.get("content")) for msg in messages]
+        )
+        keep = [True] * len(messages)
+        # System messages and the turn holding the latest message are never dropped
+        for turn in self._turns(messages)[:-1]:
+            if total <= budget:
+                break
+            for index in turn:
+                keep[index] = False
+                total -= counts[index] + TOKENS_PER_MESSAGE
+        if total > budget:
+            raise self._exceeded(total, budget)
+        return [msg for msg, kept in zip(messages, keep) if kept]
+
+    def _longest(self, messages: Messages, total: int, budget: int) -> int:
+        # Only plain-text messages can be cut or split
+        candidates = [index for index, msg in enumerate(messages) if isinstance(msg.get("content"), str)]
+        if not candidates:
+            raise self._exceeded(total, budget)
+        return max(candidates, key=lambda index: len(messages[index]["content"]))
+
+    def _truncate_middle(self, messages: Messages, total: int, budget: int) -> Messages:
+        index = self._longest(messages, total, budget)
+        tokens = self.encoding.encode_ordinary(messages[index]["content"])
+        marker = len(self.encoding.encode_ordinary(TRUNCATION_MARKER))
+        keep = len(tokens) - (total - budget) - marker
+        fitted = list(messages)
+        while keep > 0:
+            head = (keep + 1) // 2
+            tail = keep - head
+            content = self.encoding.decode(tokens[:head]) + TRUNCATION_MARKER
+            content += self.encoding.decode(tokens[-tail:]) if tail else ""
+            fitted[index] = {**messages[index], "content": content}
+            total = self.count(fitted)
+            if total <= budget:
+                return fitted
+            # Decoding at token boundaries can re-encode slightly longer
+            keep -= total - budget
+        raise self._exceeded(self.count(messages), budget)
+
+    def _chunk(self, messages: Messages, total: int, budget: int) -> List[Messages]:
+        index = self._longest(messages, total, budget)
+        tokens = self.encoding.encode_ordinary(messages[index]["content"])
+        room = budget - (total - len(tokens))
+        while room > 0:
+            chunks = [
+                messages[:index] + [{**messages[index], "content": self.encoding.decode(tokens[start:start + room])}]
+                + messages[index + 1:]
+                for start in range(0, len(tokens), room)
+            ]
+            overshoot = max(self.count(chunk) for chunk in chunks) - budget
+            if overshoot <= 0:
+                return chunks
+            room -= overshoot
+        raise self._exceeded(total, budget)
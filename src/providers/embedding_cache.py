@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+EmbeddingKey = Tuple[str, bytes]
+
+class EmbeddingCache:
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100000):
+        """
+        Per-text embedding cache keyed by model and content hash
+
+        Vectors are held as float32 arrays (4 bytes per dimension) in a
+        bounded in-memory LRU. With path set they are also persisted to a
+        SQLite file, so re-embedding an unchanged corpus is served from disk.
+
+        :param path: Optional SQLite file for persistent storage
+        :param max_entries: Maximum number of vectors kept in memory
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+
+        self.path = path
+        self.max_entries = max_entries
+        self._vectors: "OrderedDict[EmbeddingKey, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes the SQLite connection; never held together with _lock
+        self._disk_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                " namespace TEXT NOT NULL,"
+                " digest BLOB NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (namespace, digest))"
+            )
+
+    @staticmethod
+    def namespace(model: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Cache namespace for a model and the parameters that change its output
+
+        :param model: Embedding model name
+        :param params: Extra request parameters (e.g. dimensions)
+        :return: Namespace string
+        """
+        if not params:
+            return model
+        return model + json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        """
+        Content hash of a text
+
+        :param text: Input text
+        :return: 16-byte blake2b digest
+        """
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def get_many(self, namespace: str, texts: Sequence[str], as_arrays: bool = False) -> Dict[str, Any]:
+        """
+        Look up vectors for many texts
+
+        Blocks on disk I/O when the persistent store is consulted; async
+        code should use aget_many.
+
+        :param namespace: Namespace from namespace()
+        :param texts: Texts to look up (should be unique)
+        :param as_arrays: Return the cached float32 arrays (shared, do not modify) instead of float lists
+        :return: Vectors for the texts that were cached
+        """
+        found, missing = self._get_memory(namespace, texts, as_arrays)
+        self._get_disk(namespace, found, missing, as_arrays)
+        return found
+
+    async def aget_many(self, namespace: str, texts: Sequence[str], as_arrays: bool = False) -> Dict[str, Any]:
+        """
+        Look up vectors for many texts, reading the store in the default executor
+
+        :param namespace: Namespace from namespace()
+        :param texts: Texts to look up (should be unique)
+        :param as_arrays: Return the cached float32 arrays (shared, do not modify) instead of float lists
+        :return: Vectors for the texts that were cached
+        """
+        found, missing = self._get_memory(namespace, texts, as_arrays)
+        if missing and self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._get_disk, namespace, found, missing, as_arrays
+            )
+        else:
+            self._get_disk(namespace, found, missing, as_arrays)
+        return found
+
+    def _get_memory(self,
+                    namespace: str,
+                    texts: Sequence[str],
+                    as_arrays: bool) -> Tuple[Dict[str, Any], Dict[bytes, str]]:
+        found: Dict[str, Any] = {}
+        missing: Dict[bytes, str] = {}
+        with self._lock:
+            for text in texts:
+                key = (namespace, self.digest(text))
+                vector = self._vectors.get(key)
+                if vector is None:
+                    missing[key[1]] = text
+                    continue
+                self._vectors.move_to_end(key)
+                found[text] = vector if as_arrays else vector.tolist()
+            self._hits += len(found)
+        return found, missing
+
+    def _get_disk(self, namespace: str, found: Dict[str, Any], missing: Dict[bytes, str], as_arrays: bool):
+        # Fills found from the store and removes the hits from missing
+        loaded: List[Tuple[bytes, array]] = []
+        with self._disk_lock:
+            if missing and self._connection is not None:
+                digests = list(missing)
+                # Stay well under SQLite's bound-parameter limit
+                for start in range(0, len(digests), 500):
+                    chunk = digests[start:start + 500]
+                    rows = self._connection.execute(
+                        "SELECT digest, vector FROM embedding_cache"
+                        f" WHERE namespace = ? AND digest IN ({','.join('?' * len(chunk))})",
+                        [namespace, *chunk]
+                    )
+                    for digest, blob in rows:
+                        vector = array("f")
+                        vector.frombytes(blob)
+                        loaded.append((digest, vector))
+
+        with self._lock:
+            for digest, vector in loaded:
+                self._store((namespace, digest), vector)
+                found[missing.pop(digest)] = vector if as_arrays else vector.tolist()
+            self._hits += len(loaded)
+            self._misses += len(missing)
+
+    def put_many(self, namespace: str, vectors: Dict[str, Sequence[float]]):
+        """
+        Store vectors for many texts
+
+        Blocks on the disk write when the persistent store is enabled; async
+        code should use aput_many.
+
+        :param namespace: Namespace from namespace()
+        :param vectors: Vector per text
+        """
+        self._put_disk(self._put_memory(namespace, vectors))
+
+    async def aput_many(self, namespace: str, vectors: Dict[str, Sequence[float]]):
+        """
+        Store vectors for many texts, writing the store in the default executor
+
+        :param namespace: Namespace from namespace()
+        :param vectors: Vector per text
+        """
+        rows = self._put_memory(namespace, vectors)
+        if rows and self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._put_disk, rows)
+
+    def _put_memory(self, namespace: str, vectors: Dict[str, Sequence[float]]) -> List[Tuple[str, bytes, bytes]]:
+        rows = []
+        with self._lock:
+            for text, values in vectors.items():
+                digest = self.digest(text)
+                vector = array("f", values)
+                self._store((namespace, digest), vector)
+                rows.append((namespace, digest, vector.tobytes()))
+        return rows
+
+    def _put_disk(self, rows: List[Tuple[str, bytes, bytes]]):
+        with self._disk_lock:
+            if self._connection is not None and rows:
+                with self._connection:
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO embedding_cache VALUES (?, ?, ?)", rows
+                    )
+
+    def _store(self, key: EmbeddingKey, vector: array):
+        self._vectors[key] = vector
+        self._vectors.move_to_end(key)
+        if len(self._vectors) > self.max_entries:
+            self._vectors.popitem(last=False)
+            self._evictions += 1
+
+    def close(self):
+        """
+        Close the persistent store
+        """
+        with self._disk_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache hit/miss statistics (counted per text)
+
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._vectors),
+                "max_entries": self.max_entries,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
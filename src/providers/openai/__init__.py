@@ -0,0 +1,50 @@
+"""
+OpenAI providers
+
+Submodules are imported on first attribute access (PEP 562), so importing
+the package does not load the provider modules or the openai SDK:
+
+    from src.providers.openai import ChatProvider
+"""
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    "BaseOpenAIProvider": ".base",
+    "OpenAIModelType": ".base",
+    "OpenAIRequestType": ".base",
+    "OpenAIBatchJob": ".batch_api",
+    "ChatProvider": ".chat",
+    "CompletionProvider": ".completions",
+    "EmbeddingBatcher": ".embedding_batcher",
+    "EmbeddingProvider": ".embeddings",
+    "ImageProvider": ".images",
+    "ModelManager": ".models",
+    "OpenAIProvider": ".openai_provider"
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .base import BaseOpenAIProvider, OpenAIModelType, OpenAIRequestType
+    from .batch_api import OpenAIBatchJob
+    from .chat import ChatProvider
+    from .completions import CompletionProvider
+    from .embedding_batcher import EmbeddingBatcher
+    from .embeddings import EmbeddingProvider
+    from .images import ImageProvider
+    from .models import ModelManager
+    from .openai_provider import OpenAIProvider
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    # Cache on the package so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,7 +1,16 @@
-from openai import OpenAI
-import tiktoken
-from typing import Dict, Any, Literal, Optional
+import os
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
 from enum import Enum
+from src.providers.base_provider import BaseProvider, ModelResponse, TokenAccounting
+from src.utils.error_handler import RetryPolicy
+from src.providers.rate_limiter import RateLimitScheduler
+from src.providers.response_cache import ResponseCache
+from src.core.pricing import PricingView
+from src.core.tokenizer_registry import TokenizerRegistry
+
+if TYPE_CHECKING:
+    import tiktoken
+    from openai import AsyncOpenAI, OpenAI
 
 class OpenAIModelType(Enum):
     CHAT = "chat"
@@ -14,124 +23,59 @@ class OpenAIRequestType(Enum):
     COMPLETION = "completion"
     IMAGE = "image"
 
-class BaseOpenAIProvider:
-    
-    PRICING = {
-        
-    "dall-e-3": {
-        "type": "image",
-        "resolution_pricing": {
-            "1024x1024": 0.04,   # Cost per image
-            "1024x1792": 0.08,   # Rectangular image cost
-            "1792x1024": 0.08    # Rectangular image cost
-        },
-        "status": "active",
-        "release_date": "2023-11-06",
-        "recommended_for": ["high-quality image generation"]
-    },
-    "dall-e-2": {
-        "type": "image",
-        "resolution_pricing": {
-            "256x256": 0.016,    # Cost per image
-            "512x512": 0.018,    # Cost per image
-            "1024x1024": 0.020   # Cost per image
-        },
-        "status": "active",
-        "release_date": "2022-07-15",
-        "recommended_for": ["standard image generation"]
-    },
-    # GPT-3.5 Models
-    "gpt-3.5-turbo": {
-        "input_token_cost": 0.0015,   # per 1000 tokens
-        "output_token_cost": 0.002,   # per 1000 tokens
-        "context_window": 4096,
-        "status": "active",
-        "release_date": "2023-03-01",
-        "type": "chat",
-        "recommended_for": ["general purpose", "cost-effective"]
-    },
-    "gpt-3.5-turbo-16k": {
-        "input_token_cost": 0.003,    # per 1000 tokens
-        "output_token_cost": 0.004,   # per 1000 tokens
-        "context_window": 16384,
-        "status": "active",
-        "release_date": "2023-06-15",
-        "type": "chat",
-        "recommended_for": ["longer context", "detailed analysis"]
-    },
-    
-    # GPT-4 Models
-    "gpt-4": {
-        "input_token_cost": 0.03,     # per 1000 tokens
-        "output_token_cost": 0.06,    # per 1000 tokens
-        "context_window": 8192,
-        "status": "active",
-        "release_date": "2023-03-14",
-        "type": "chat",
-        "recommended_for": ["complex tasks", "high-quality output"]
-    },
-    "gpt-4-32k": {
-        "input_token_cost": 0.06,     # per 1000 tokens
-        "output_token_cost": 0.12,    # per 1000 tokens
-        "context_window": 32768,
-        "status": "active",
-        "release_date": "2023-03-14",
-        "type": "chat",
-        "recommended_for": ["very long context", "detailed analysis"]
-    },
-    "gpt-4-turbo": {
-        "input_token_cost": 0.01,     # per 1000 tokens
-        "output_token_cost": 0.03,    # per 1000 tokens
-        "context_window": 128000,
-        "status": "active",
-        "release_date": "2024-02-15",
-        "type": "chat",
-        "recommended_for": ["advanced reasoning", "large context"]
-    },
-    # Latest Models
-    "gpt-4o": {
-        "input_token_cost": 0.0025,    # per 1000 tokens
-        "output_token_cost": 0.01,     # per 1000 tokens
-        "context_window": 128000,
-        "status": "active",
-        "release_date": "2024-05-13",
-        "type": "chat",
-        "recommended_for": ["multimodal", "high performance", "cost-effective"]
-    },
-    "gpt-4o-mini": {
-        "input_token_cost": 0.00015,   # per 1000 tokens
-        "output_token_cost": 0.0006,   # per 1000 tokens
-        "context_window": 128000,
-        "status": "active",
-        "release_date": "2024-07-01",
-        "type": "chat",
-        "recommended_for": ["lightweight tasks", "cost optimization"]
-    }
-    }
+class OpenAIClientMixin:
+    """
+    Lazily built OpenAI SDK clients and tiktoken encoding, plus model lookups
 
-    def __init__(self, 
-                 api_key: str, 
-                 model: Optional[str] = None,
-                 request_type: Optional[str] = None):
+    Shared by the OpenAI providers and ModelManager: constructing one imports
+    neither the SDK nor tiktoken, and both are loaded on first use. Expects
+    the class to define PRICING and _client_options (see BaseProvider) and
+    to set api_key, base_url and model.
+    """
+    _client: Optional["OpenAI"] = None
+    _async_client: Optional["AsyncOpenAI"] = None
+    _encoding: Optional["tiktoken.Encoding"] = None
+
+    @property
+    def client(self) -> "OpenAI":
         """
-        Initialize OpenAI Provider with request type selection
-        
-        :param api_key: OpenAI API key
-        :param model: Specific model
-        :param request_type: Type of request (chat or completion)
+        Synchronous OpenAI client, created (and the SDK imported) on first use
         """
-        self.api_key = api_key
-        self.model = model or self.get_latest_model()
-        self.client = OpenAI(api_key=api_key)
-        
-        # Set default request type if not provided
-        self.request_type = request_type or OpenAIRequestType.CHAT.value
-        
-        # Initialize encoding
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.model)
-        except Exception:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, **self._client_options())
+        return self._client
+
+    @client.setter
+    def client(self, client: "OpenAI"):
+        self._client = client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """
+        Non-blocking client used by the async generate methods, created on first use
+        """
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, **self._client_options())
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, client: "AsyncOpenAI"):
+        self._async_client = client
+
+    @property
+    def encoding(self) -> "tiktoken.Encoding":
+        """
+        Shared encoding for the model, resolved on first use
+        """
+        if self._encoding is None:
+            self._encoding = TokenizerRegistry.get_encoding(self.model)
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, encoding: "tiktoken.Encoding"):
+        self._encoding = encoding
 
     def _calculate_tokens(self, text: str) -> int:
         """
@@ -140,7 +84,7 @@ class BaseOpenAIProvider:
         :param text: Input text
         :return: Number of tokens
         """
-        return len(self.encoding.encode(text))
+        return TokenizerRegistry.count_tokens(self.encoding, text)
 
     @classmethod
     def get_latest_model(cls) -> str:
@@ -172,4 +116,69 @@ class BaseOpenAIProvider:
             "input_token_cost": 0,
             "output_token_cost": 0,
             "context_window": 0
-        })
\ No newline at end of file
+        })
+
+class BaseOpenAIProvider(OpenAIClientMixin, BaseProvider):
+    
+    # Live view of the OpenAI table in the shared pricing catalog
+    PRICING = PricingView("openai")
+    PRICING_PROVIDER = "openai"
+
+    def __init__(self, 
+                 api_key: str, 
+                 model: Optional[str] = None,
+                 request_type: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 max_concurrency: Optional[int] = None,
+                 token_accounting: str = TokenAccounting.USAGE.value,
+                 token_count_threads: Optional[int] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        """
+        Initialize OpenAI Provider with request type selection
+        
+        :param api_key: OpenAI API key
+        :param model: Specific model
+        :param request_type: Type of request (chat or completion)
+        :param base_url: Override for the OpenAI API base URL
+        :param max_concurrency: Maximum number of in-flight requests (unbounded if None)
+        :param token_accounting: Token counting mode ("usage" trusts API usage, "local" re-tokenizes)
+        :param token_count_threads: Threads used by count_tokens_batch (defaults to CPU count, max 8)
+        :param response_cache: Opt-in exact-match cache for chat and completion responses
+        :param rate_limiter: Scheduler enforcing per-model RPM/TPM limits (may be shared)
+        :param retry_policy: Retry/backoff/hedging policy for API calls (no retries if None)
+        """
+        super().__init__(api_key, model or self.get_latest_model(), max_concurrency, token_accounting,
+                         retry_policy, rate_limiter)
+        # SDK clients and the encoding are built on first use (see OpenAIClientMixin)
+        self.base_url = base_url
+        
+        # Set default request type if not provided
+        self.request_type = request_type or OpenAIRequestType.CHAT.value
+        
+        self.token_count_threads = token_count_threads or min(8, os.cpu_count() or 1)
+        self.response_cache = response_cache
+
+    async def _cache_lookup(self, generation_params: Dict[str, Any]) -> Tuple[Optional[str], Optional[ModelResponse]]:
+        """
+        Look up a request in the response cache
+        
+        :param generation_params: Parameters that would be sent to the API
+        :return: Tuple of (cache key, cached response); both None without a cache
+        """
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.make_key(self.PRICING_PROVIDER, generation_params)
+        return key, await self.response_cache.aget(key)
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Calculate tokens for many texts in parallel
+        
+        :param texts: Input texts
+        :return: Number of tokens per text, in input order
+        """
+        return TokenizerRegistry.count_tokens_batch(
+            self.encoding, texts, num_threads=self.token_count_threads
+        )
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from src.providers.base_provider import ModelResponse
+from src.providers.batch import BatchResult
+from src.utils.error_handler import ProviderError, classify_error
+
+# Batch states after which the batch will not change any more
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+ResponseBuilder = Callable[[Any, Dict[str, Any], str], ModelResponse]
+
+class OpenAIBatchJob:
+    def __init__(self,
+                 provider,
+                 endpoint: str,
+                 prompts: Sequence[Any],
+                 bodies: Sequence[Dict[str, Any]],
+                 build_response: ResponseBuilder,
+                 poll_interval: float = 5.0,
+                 max_poll_interval: float = 60.0,
+                 completion_window: str = "24h"):
+        """
+        One job on OpenAI's asynchronous Batch API
+
+        Requests are packed into the JSONL upload format (one line per
+        request with a custom_id, method, url and body), uploaded with
+        purpose "batch" and submitted. wait() polls with exponential backoff
+        until the batch settles, and results() streams the output and error
+        files line by line, turning each into a BatchResult priced at the
+        batch rate.
+
+        :param provider: OpenAI provider whose async client is used
+        :param endpoint: API path every request targets (e.g. "/v1/chat/completions")
+        :param prompts: Original prompts, in request order
+        :param bodies: Request bodies, in the same order
+        :param build_response: Builds a ModelResponse from (prompt, response body, batch id)
+        :param poll_interval: Initial seconds between status checks
+        :param max_poll_interval: Maximum seconds between status checks
+        :param completion_window: Batch completion window
+        """
+        self.provider = provider
+        self.endpoint = endpoint
+        self.prompts = list(prompts)
+        self.bodies = list(bodies)
+        self.build_response = build_response
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.completion_window = completion_window
+        self.batch = None
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.batch.id if self.batch is not None else None
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.batch.status if self.batch is not None else None
+
+    @staticmethod
+    def custom_id(index: int) -> str:
+        return f"request-{index}"
+
+    def pack(self) -> bytes:
+        """
+        Serialize the requests in the Batch API upload format
+
+        :return: JSONL file contents
+        """
+        return "".join(
+            json.dumps({
+                "custom_id": self.custom_id(index),
+                "method": "POST",
+                "url": self.endpoint,
+                "body": body
+            }) + "\n"
+            for index, body in enumerate(self.bodies)
+        ).encode("utf-8")
+
+    async def submit(self, metadata: Optional[Dict[str, str]] = None) -> Any:
+        """
+        Upload the request file and create the batch
+
+        :param metadata: Optional batch metadata
+        :return: Batch object
+        """
+        client = self.provider.async_client
+        try:
+            input_file = await client.files.create(file=("batch.jsonl", self.pack()), purpose="batch")
+            options = {"metadata": metadata} if metadata else {}
+            self.batch = await client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=self.endpoint,
+                completion_window=self.completion_window,
+                **options
+            )
+        except Exception as e:
+            raise classify_error(e, "OpenAI batch submission error", "OpenAI") from e
+        return self.batch
+
+    async def wait(self, timeout: Optional[float] = None) -> Any:
+        """
+        Poll until the batch reaches a terminal state
+
+        The interval doubles after every check, up to max_poll_interval.
+
+        :param timeout: Maximum seconds to wait (None for no limit)
+        :return: Final batch object
+        """
+        if self.batch is None:
+            raise RuntimeError("Batch has not been submitted")
+
+        expires = time.monotonic() + timeout if timeout is not None else None
+        interval = self.poll_interval
+        while self.batch.status not in TERMINAL_STATUSES:
+            if expires is not None and time.monotonic() + interval > expires:
+                raise ProviderError(f"Batch {self.batch.id} still {self.batch.status} after {timeout}s", "OpenAI")
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+            try:
+                self.batch = await self.provider.async_client.batches.retrieve(self.batch.id)
+            except Exception as e:
+                raise classify_error(e, "OpenAI batch polling error", "OpenAI") from e
+
+        if self.batch.status == "failed" and not self.batch.output_file_id:
+            errors = getattr(self.batch, "errors", None)
+            details = [error.message for error in getattr(errors, "data", None) or []]
+            raise ProviderError(f"Batch {self.batch.id} failed: {'; '.join(details) or 'unknown error'}", "OpenAI")
+        return self.batch
+
+    async def _iter_lines(self, file_id: str) -> AsyncIterator[Dict[str, Any]]:
+        client = self.provider.async_client
+        async with client.files.with_streaming_response.content(file_id) as response:
+            async for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    async def results(self) -> AsyncIterator[BatchResult]:
+        """
+        Stream results from the output and error files
+
+        Requests that appear in neither file (e.g. after the batch expired)
+        are reported as failed results at the end.
+
+        :return: Async iterator of BatchResult, in file order
+        """
+        if self.batch is None or self.batch.status not in TERMINAL_STATUSES:
+            raise RuntimeError("Batch has not finished")
+
+        seen: List[bool] = [False] * len(self.prompts)
+        for file_id in (self.batch.output_file_id, getattr(self.batch, "error_file_id", None)):
+            if not file_id:
+                continue
+            async for record in self._iter_lines(file_id):
+                index = int(record["custom_id"].rsplit("-", 1)[1])
+                seen[index] = True
+                yield self._result(index, record)
+
+        for index, done in enumerate(seen):
+            if not done:
+                yield BatchResult(index, self.prompts[index], error=ProviderError(
+                    f"Request {self.custom_id(index)} not processed (batch {self.batch.status})", "OpenAI"
+                ))
+
+    def _result(self, index: int, record: Dict[str, Any]) -> BatchResult:
+        prompt = self.prompts[index]
+        response = record.get("response") or {}
+        status_code = response.get("status_code")
+        error = record.get("error")
+        if error or (status_code is not None and status_code >= 400):
+            body_error = (response.get("body") or {}).get("error") or error or {}
+            return BatchResult(index, prompt, error=_status_error(
+                status_code, body_error.get("message", "batch request failed")
+            ))
+        try:
+            return BatchResult(index, prompt, response=self.build_response(prompt, response["body"], self.batch.id))
+        except Exception as e:
+            return BatchResult(index, prompt, error=e)
+
+    async def run(self, timeout: Optional[float] = None) -> AsyncIterator[BatchResult]:
+        """
+        Wait for the batch and stream its results
+
+        :param timeout: Maximum seconds to wait for completion
+        :return: Async iterator of BatchResult
+        """
+        await self.wait(timeout)
+        async for result in self.results():
+            yield result
+
+class _BatchLineError(Exception):
+    def __init__(self, status_code: Optional[int], message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _status_error(status_code: Optional[int], message: str) -> ProviderError:
+    # Reuse the HTTP status mapping used for synchronous calls
+    return classify_error(_BatchLineError(status_code, message), "OpenAI batch request error", "OpenAI")
@@ -1,44 +1,178 @@
+import asyncio
+import time
+from dataclasses import replace
+from types import SimpleNamespace
 from .base import BaseOpenAIProvider, OpenAIRequestType
-from src.providers.base_provider import ModelResponse
-from typing import Union, List, Dict, Any
+from .batch_api import OpenAIBatchJob
+from src.providers.context_window import ContextFitter, ContextPolicy, message_text
+from src.providers.base_provider import ModelResponse, StreamChunk
+from src.providers.response_cache import ResponseCache
+from src.providers.single_flight import SingleFlight
+from src.utils.error_handler import classify_error
+from typing import Union, List, Dict, Any, AsyncIterator, Iterable, Optional
 
 class ChatProvider(BaseOpenAIProvider):
+    def __init__(self,
+                 api_key: str,
+                 *args,
+                 single_flight: bool = False,
+                 context_policy: Optional[str] = ContextPolicy.REJECT.value,
+                 **kwargs):
+        """
+        Initialize OpenAI Chat Provider
+        
+        :param api_key: OpenAI API key
+        :param args: Positional provider options (model, request_type, ...; see BaseOpenAIProvider)
+        :param single_flight: Share one upstream request among identical concurrent calls
+        :param context_policy: Pre-flight handling of prompts that overflow the context window
+            ("reject", "drop_oldest", "truncate_middle" or "chunk"; None skips the check)
+        :param kwargs: Provider options (see BaseOpenAIProvider)
+        """
+        super().__init__(api_key, *args, **kwargs)
+        self.single_flight = SingleFlight() if single_flight else None
+        self.context_policy = ContextPolicy(context_policy).value if context_policy is not None else None
+
+    def accepts_prompt(self, prompt: Any) -> bool:
+        """
+        Whether generate takes a prompt of this shape
+        
+        :param prompt: Text or list of chat messages
+        :return: True for text, and for message lists in chat mode
+        """
+        if isinstance(prompt, list):
+            return self.request_type == OpenAIRequestType.CHAT.value
+        return isinstance(prompt, str)
+
+    def fit_prompt(self,
+                   prompt: Union[str, List[Dict[str, str]]],
+                   output_tokens: int = 0,
+                   policy: Optional[str] = None) -> List[List[Dict[str, str]]]:
+        """
+        Fit a prompt into the model's context window minus the output budget
+        
+        :param prompt: User prompt (string or message list)
+        :param output_tokens: Tokens reserved for the completion
+        :param policy: Context policy (defaults to the provider's; None skips the check)
+        :return: Message lists to send, more than one only with the chunk policy
+        """
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        if policy is None:
+            return [messages]
+        fitter = ContextFitter(self.encoding, self.get_model_price().context_window, self.model)
+        return fitter.fit(messages, output_tokens, policy)
+
+    async def _generate_chunks(self,
+                               prompt: Union[str, List[Dict[str, str]]],
+                               chunks: List[List[Dict[str, str]]],
+                               **kwargs) -> ModelResponse:
+        """
+        Map step of the chunk policy: run every chunk and merge the responses
+        
+        Chunk outputs are joined in order; the individual responses are kept
+        in metadata["chunk_responses"] for a caller-defined reduce step.
+        
+        :param prompt: Original prompt
+        :param chunks: Message lists from fit_prompt
+        :param kwargs: Generation parameters
+        :return: Merged model response
+        """
+        responses = await asyncio.gather(*(
+            self._generate(chunk, context_policy=None, **kwargs) for chunk in chunks
+        ))
+        input_tokens = sum(response.input_tokens for response in responses)
+        output_tokens = sum(response.output_tokens for response in responses)
+        return ModelResponse(
+            provider="OpenAI",
+            model=self.model,
+            prompt=str(prompt),
+            response="\n\n".join(response.response for response in responses),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+            cost=round(sum(response.cost for response in responses), 4),
+            metadata={**kwargs, "chunks": len(responses), "chunk_responses": list(responses)}
+        )
+
     async def generate(self, 
                        prompt: Union[str, List[Dict[str, str]]], 
                        **kwargs) -> ModelResponse:
         """
         Generate response using either Chat or Completion API
         
+        With single-flight enabled, a call identical (model, prompt and
+        params) to one already in flight waits for that request instead of
+        sending its own. Only the caller that issued the request is charged;
+        the others get zero cost and token counts (so trackers count the
+        request once) and metadata["coalesced"] = True. Pass
+        single_flight=False to opt out, e.g. when sampling with temperature.
+        
         :param prompt: User prompt (string or message list)
         :param kwargs: Additional generation parameters
         :return: Model response
         """
+        coalesce = kwargs.pop('single_flight', True)
+        if self.single_flight is None or not coalesce:
+            return await self._generate(prompt, **kwargs)
+
+        key = ResponseCache.make_key(self.PRICING_PROVIDER, {"model": self.model, "prompt": prompt, **kwargs})
+        response, shared = await self.single_flight.do(key, lambda: self._generate(prompt, **kwargs))
+        if not shared:
+            return response
+        return replace(response, input_tokens=0, output_tokens=0, total_tokens=0, cost=0.0,
+                       metadata={**response.metadata, "coalesced": True})
+
+    async def _generate(self,
+                        prompt: Union[str, List[Dict[str, str]]],
+                        **kwargs) -> ModelResponse:
         try:
+            context_policy = kwargs.pop('context_policy', self.context_policy)
             # Ensure request_type is set, defaulting to chat if not specified
             request_type = kwargs.get('request_type', self.request_type)
+
+            if request_type == OpenAIRequestType.CHAT.value:
+                # Fit the prompt before anything is reserved or sent
+                fitted = self.fit_prompt(prompt, self._output_budget(kwargs), context_policy)
+                if len(fitted) > 1:
+                    return await self._generate_chunks(prompt, fitted, **kwargs)
+
+            admission = self._pop_admission(kwargs)
+            deadline = kwargs.pop('deadline', None)
             
             # Prepare generation parameters based on request type
             if request_type == OpenAIRequestType.CHAT.value:
                 # Chat Completions API
-                if isinstance(prompt, str):
-                    messages = [{"role": "user", "content": prompt}]
-                else:
-                    messages = prompt
+                messages = fitted[0]
 
                 generation_params = {
                     "model": self.model,
                     "messages": messages,
                     **kwargs
                 }
-                raw_response = self.client.chat.completions.create(**generation_params)
-                generated_text = raw_response.choices[0].message.content
+                cache_key, cached = await self._cache_lookup(generation_params)
+                if cached is not None:
+                    return cached
+                async with self._reservation(
+                    self.model,
+                    lambda: sum(self.count_tokens_batch(
+                        [message_text(msg.get('content')) for msg in messages]
+                    )),
+                    self._output_budget(generation_params),
+                    admission
+                ) as reservation:
+                    raw_response = await self._send(
+                        lambda: self.async_client.chat.completions.create(**generation_params), deadline, reservation
+                    )
+                    generated_text = raw_response.choices[0].message.content
                 
-                # Calculate tokens for chat
-                input_tokens = sum(
-                    self._calculate_tokens(msg.get('content', '')) 
-                    for msg in messages
-                )
-                output_tokens = self._calculate_tokens(generated_text)
+                    # Resolve tokens for chat
+                    input_tokens, output_tokens, token_source = self._resolve_usage(
+                        raw_response,
+                        lambda: sum(self.count_tokens_batch(
+                            [message_text(msg.get('content')) for msg in messages]
+                        )),
+                        lambda: self._calculate_tokens(generated_text)
+                    )
+                    reservation.used = input_tokens + output_tokens
 
             elif request_type == OpenAIRequestType.COMPLETION.value:
                 # Traditional Completions API
@@ -47,25 +181,37 @@ class ChatProvider(BaseOpenAIProvider):
                     "prompt": prompt if isinstance(prompt, str) else str(prompt),
                     **kwargs
                 }
-                raw_response = self.client.completions.create(**generation_params)
-                generated_text = raw_response.choices[0].text.strip()
+                cache_key, cached = await self._cache_lookup(generation_params)
+                if cached is not None:
+                    return cached
+                async with self._reservation(
+                    self.model,
+                    lambda: self._calculate_tokens(generation_params["prompt"]),
+                    self._output_budget(generation_params),
+                    admission
+                ) as reservation:
+                    raw_response = await self._send(
+                        lambda: self.async_client.completions.create(**generation_params), deadline, reservation
+                    )
+                    generated_text = raw_response.choices[0].text.strip()
                 
-                # Calculate tokens for completion
-                input_tokens = self._calculate_tokens(generation_params["prompt"])
-                output_tokens = self._calculate_tokens(generated_text)
+                    # Resolve tokens for completion
+                    input_tokens, output_tokens, token_source = self._resolve_usage(
+                        raw_response,
+                        lambda: self._calculate_tokens(generation_params["prompt"]),
+                        lambda: self._calculate_tokens(generated_text)
+                    )
+                    reservation.used = input_tokens + output_tokens
 
             else:
                 raise ValueError(f"Unsupported request type: {request_type}")
 
             # Calculate total tokens and cost
             total_tokens = input_tokens + output_tokens
-            pricing = self.get_model_pricing(self.model)
-            input_cost = (input_tokens / 1000) * pricing.get("input_token_cost", 0)
-            output_cost = (output_tokens / 1000) * pricing.get("output_token_cost", 0)
-            total_cost = round(input_cost + output_cost, 4)
+            total_cost = round(self.get_model_price().cost(input_tokens, output_tokens), 4)
 
             # Create response object
-            return ModelResponse(
+            response = ModelResponse(
                 provider="OpenAI",
                 model=self.model,
                 prompt=str(prompt),
@@ -75,8 +221,195 @@ class ChatProvider(BaseOpenAIProvider):
                 total_tokens=total_tokens,
                 cost=total_cost,
                 raw_response=raw_response,
-                metadata=kwargs
+                metadata={**kwargs, "token_source": token_source}
+            )
+            if cache_key is not None:
+                await self.response_cache.aput(cache_key, response)
+            return response
+
+        except Exception as e:
+            raise classify_error(e, "OpenAI generation error", "OpenAI") from e
+
+    async def generate_stream(self,
+                              prompt: Union[str, List[Dict[str, str]]],
+                              **kwargs) -> AsyncIterator[StreamChunk]:
+        """
+        Stream a chat completion, yielding text deltas as they arrive
+        
+        Each chunk carries a running output token and cost estimate; the final
+        chunk has an empty delta and the complete ModelResponse, whose metadata
+        records time_to_first_token and latency in seconds.
+        
+        :param prompt: User prompt (string or message list)
+        :param kwargs: Additional generation parameters
+        :return: Async iterator of stream chunks
+        """
+        try:
+            context_policy = kwargs.pop('context_policy', self.context_policy)
+            if context_policy == ContextPolicy.CHUNK.value:
+                raise ValueError("The chunk context policy is not supported for streaming")
+            messages = self.fit_prompt(prompt, self._output_budget(kwargs), context_policy)[0]
+            admission = self._pop_admission(kwargs)
+            deadline = kwargs.pop('deadline', None)
+
+            generation_params = {
+                "model": self.model,
+                "messages": messages,
+                **kwargs,
+                "stream": True,
+                # Ask for a trailing usage chunk so billing matches the server
+                "stream_options": {"include_usage": True}
+            }
+
+            price = self.get_model_price()
+            output_rate = price.output_cost_per_token
+            parts = []
+            output_estimate = 0
+            last_event = None
+            time_to_first_token = None
+
+            async with self._reservation(
+                self.model,
+                lambda: sum(self.count_tokens_batch(
+                    [message_text(msg.get('content')) for msg in messages]
+                )),
+                self._output_budget(generation_params),
+                admission
+            ) as reservation:
+                started = time.perf_counter()
+                async with self._request_slot():
+                    stream = await self._open_stream(
+                        lambda: self.async_client.chat.completions.create(**generation_params), deadline, reservation
+                    )
+                    async for event in stream:
+                        last_event = event
+                        if not event.choices:
+                            continue
+                        delta = event.choices[0].delta.content
+                        if not delta:
+                            continue
+
+                        if time_to_first_token is None:
+                            time_to_first_token = time.perf_counter() - started
+                        parts.append(delta)
+                        output_estimate += len(self.encoding.encode_ordinary(delta))
+                        reservation.output_streamed = output_estimate
+                        yield StreamChunk(
+                            delta=delta,
+                            output_tokens=output_estimate,
+                            cost=round(output_estimate * output_rate, 6)
+                        )
+                latency = time.perf_counter() - started
+                generated_text = "".join(parts)
+
+                # Resolve tokens from the trailing usage chunk when present
+                input_tokens, output_tokens, token_source = self._resolve_usage(
+                    last_event,
+                    lambda: sum(self.count_tokens_batch(
+                        [message_text(msg.get('content')) for msg in messages]
+                    )),
+                    lambda: output_estimate
+                )
+                reservation.used = input_tokens + output_tokens
+            total_tokens = input_tokens + output_tokens
+            total_cost = round(price.cost(input_tokens, output_tokens), 4)
+
+            response = ModelResponse(
+                provider="OpenAI",
+                model=self.model,
+                prompt=str(prompt),
+                response=generated_text,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                total_tokens=total_tokens,
+                cost=total_cost,
+                metadata={
+                    **kwargs,
+                    "token_source": token_source,
+                    "stream": True,
+                    "time_to_first_token": time_to_first_token,
+                    "latency": latency
+                }
+            )
+            yield StreamChunk(
+                delta="",
+                output_tokens=output_tokens,
+                cost=total_cost,
+                response=response
             )
 
         except Exception as e:
-            raise RuntimeError(f"OpenAI generation error: {str(e)}")
\ No newline at end of file
+            raise classify_error(e, "OpenAI streaming error", "OpenAI") from e
+
+    async def submit_batch(self,
+                           prompts: Iterable[Union[str, List[Dict[str, str]]]],
+                           poll_interval: float = 5.0,
+                           metadata: Optional[Dict[str, str]] = None,
+                           **kwargs) -> OpenAIBatchJob:
+        """
+        Submit prompts as one job on the asynchronous Batch API
+        
+        Results arrive within the completion window at the batch rate from
+        the pricing catalog. Use ``async for result in job.run()`` to wait for
+        the job and stream its BatchResults.
+        
+        :param prompts: Prompts (strings or message lists)
+        :param poll_interval: Initial seconds between status checks
+        :param metadata: Optional batch metadata
+        :param kwargs: Generation parameters applied to every request
+        :return: Submitted batch job
+        """
+        prompts = list(prompts)
+        model = kwargs.pop('model', self.model)
+        bodies = [
+            {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt,
+                **kwargs
+            }
+            for prompt in prompts
+        ]
+        job = OpenAIBatchJob(
+            self, "/v1/chat/completions", prompts, bodies,
+            lambda prompt, body, batch_id: self._batch_response(model, prompt, body, batch_id),
+            poll_interval=poll_interval
+        )
+        await job.submit(metadata)
+        return job
+
+    def _batch_response(self,
+                        model: str,
+                        prompt: Union[str, List[Dict[str, str]]],
+                        body: Dict[str, Any],
+                        batch_id: str) -> ModelResponse:
+        """
+        Build a ModelResponse from one Batch API chat completion body
+        
+        :param model: Requested chat model
+        :param prompt: Original prompt
+        :param body: Chat completion JSON from the batch output file
+        :param batch_id: Batch the response belongs to
+        :return: Model response priced at the batch rate
+        """
+        generated_text = body["choices"][0]["message"]["content"]
+        usage = body.get("usage")
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        input_tokens, output_tokens, token_source = self._resolve_usage(
+            SimpleNamespace(usage=SimpleNamespace(**usage) if usage else None),
+            lambda: sum(self.count_tokens_batch([message_text(msg.get('content')) for msg in messages])),
+            lambda: self._calculate_tokens(generated_text)
+        )
+        total_cost = round(self.get_model_price(model).batch_cost(input_tokens, output_tokens), 4)
+
+        return ModelResponse(
+            provider="OpenAI",
+            model=model,
+            prompt=str(prompt),
+            response=generated_text,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+            cost=total_cost,
+            raw_response=body,
+            metadata={"token_source": token_source, "batch_id": batch_id}
+        )
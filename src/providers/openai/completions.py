@@ -1,6 +1,6 @@
 from .base import BaseOpenAIProvider
 from src.providers.base_provider import ModelResponse
-from typing import Union, Optional
+from src.utils.error_handler import classify_error
 
 class CompletionProvider(BaseOpenAIProvider):
     async def generate(self, 
@@ -13,9 +13,11 @@ class CompletionProvider(BaseOpenAIProvider):
         :param kwargs: Additional generation parameters
         :return: Comprehensive model response
         """
+        # Use specific completions model
+        model = kwargs.get('model', 'gpt-3.5-turbo-instruct')
         try:
-            # Use specific completions model
-            model = kwargs.get('model', 'gpt-3.5-turbo-instruct')
+            admission = self._pop_admission(kwargs)
+            deadline = kwargs.pop('deadline', None)
             
             # Prepare generation parameters
             generation_params = {
@@ -25,23 +27,36 @@ class CompletionProvider(BaseOpenAIProvider):
                 **kwargs
             }
 
-            # Generate response
-            raw_response = self.client.completions.create(**generation_params)
-            generated_text = raw_response.choices[0].text.strip()
+            cache_key, cached = await self._cache_lookup(generation_params)
+            if cached is not None:
+                return cached
 
-            # Calculate tokens
-            input_tokens = self._calculate_tokens(prompt)
-            output_tokens = self._calculate_tokens(generated_text)
+            async with self._reservation(
+                model,
+                lambda: self._calculate_tokens(prompt),
+                self._output_budget(generation_params),
+                admission
+            ) as reservation:
+                # Generate response
+                raw_response = await self._send(
+                    lambda: self.async_client.completions.create(**generation_params), deadline, reservation
+                )
+                generated_text = raw_response.choices[0].text.strip()
+
+                # Resolve tokens (server-reported usage unless accounting is local)
+                input_tokens, output_tokens, token_source = self._resolve_usage(
+                    raw_response,
+                    lambda: self._calculate_tokens(prompt),
+                    lambda: self._calculate_tokens(generated_text)
+                )
+                reservation.used = input_tokens + output_tokens
             total_tokens = input_tokens + output_tokens
 
             # Calculate cost
-            pricing = self.get_model_pricing(model)
-            input_cost = (input_tokens / 1000) * pricing.get("input_token_cost", 0)
-            output_cost = (output_tokens / 1000) * pricing.get("output_token_cost", 0)
-            total_cost = round(input_cost + output_cost, 4)
+            total_cost = round(self.get_model_price(model).cost(input_tokens, output_tokens), 4)
 
             # Create response object
-            return ModelResponse(
+            response = ModelResponse(
                 provider="OpenAI",
                 model=model,
                 prompt=prompt,
@@ -51,8 +66,11 @@ class CompletionProvider(BaseOpenAIProvider):
                 total_tokens=total_tokens,
                 cost=total_cost,
                 raw_response=raw_response,
-                metadata=kwargs
+                metadata={**kwargs, "token_source": token_source}
             )
+            if cache_key is not None:
+                await self.response_cache.aput(cache_key, response)
+            return response
 
         except Exception as e:
-            raise RuntimeError(f"OpenAI Completions generation error: {str(e)}")
\ No newline at end of file
+            raise classify_error(e, "OpenAI Completions generation error", "OpenAI") from e
\ No newline at end of file
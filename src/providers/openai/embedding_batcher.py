@@ -0,0 +1,164 @@
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .embeddings import EmbeddingProvider
+from src.providers.base_provider import ModelResponse
+
+# OpenAI per-request limits for the embeddings endpoint
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 300000
+
+_Item = Tuple[str, int, "asyncio.Future"]
+
+@dataclass
+class _PendingBatch:
+    kwargs: Dict[str, Any]
+    items: List[_Item] = field(default_factory=list)
+    tokens: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+class EmbeddingBatcher:
+    def __init__(self,
+                 provider: EmbeddingProvider,
+                 max_wait: float = 0.005,
+                 max_batch_size: int = MAX_BATCH_INPUTS,
+                 max_batch_tokens: int = MAX_BATCH_TOKENS):
+        """
+        Coalesce concurrent single-text embedding calls into batched requests
+
+        Texts submitted through embed() wait up to max_wait seconds for other
+        callers with the same parameters; the batch is sent early once it
+        reaches max_batch_size texts or max_batch_tokens tokens. Batches over
+        either limit are split into several requests sent concurrently.
+
+        :param provider: Embedding provider used to send the batches
+        :param max_wait: Seconds the first text in a batch waits for company
+        :param max_batch_size: Maximum texts per request
+        :param max_batch_tokens: Maximum input tokens per request
+        """
+        if max_batch_size < 1 or max_batch_tokens < 1:
+            raise ValueError("Batch limits must be positive integers")
+
+        self.provider = provider
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.requests_sent = 0
+        self.texts_submitted = 0
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str, **kwargs) -> ModelResponse:
+        """
+        Embed one text as part of the next batch
+
+        The returned response carries this text's vector and its share of
+        the batch cost, apportioned by token count.
+
+        :param text: Text to embed
+        :param kwargs: Embedding parameters (texts only batch with identical parameters)
+        :return: Embedding response for this text
+        """
+        loop = asyncio.get_running_loop()
+        key = json.dumps(kwargs, sort_keys=True, default=str)
+        tokens = self.provider._calculate_tokens(text)
+        future = loop.create_future()
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingBatch(kwargs)
+            pending.timer = loop.call_later(self.max_wait, self._flush, key)
+        pending.items.append((text, tokens, future))
+        pending.tokens += tokens
+        self.texts_submitted += 1
+
+        if len(pending.items) >= self.max_batch_size or pending.tokens >= self.max_batch_tokens:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: str):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        pending.timer.cancel()
+        for batch in self._split(pending.items):
+            task = asyncio.ensure_future(self._send(batch, pending.kwargs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _split(self, items: List[_Item]) -> List[List[_Item]]:
+        batches: List[List[_Item]] = []
+        batch: List[_Item] = []
+        batch_tokens = 0
+        for item in items:
+            if batch and (len(batch) >= self.max_batch_size
+                          or batch_tokens + item[1] > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(item)
+            batch_tokens += item[1]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _send(self, batch: List[_Item], kwargs: Dict[str, Any]):
+        self.requests_sent += 1
+        try:
+            response = await self.provider.generate([text for text, _, _ in batch], **kwargs)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        vectors = response.response if len(batch) > 1 else [response.response]
+        batch_cost = self.provider.get_model_price(response.model).cost(response.input_tokens)
+        local_tokens = sum(tokens for _, tokens, _ in batch)
+        shares = [
+            tokens / local_tokens if local_tokens else 1 / len(batch)
+            for _, tokens, _ in batch
+        ]
+        # Billed tokens (0 for a cache hit) split with the same weights as the cost
+        billed_tokens = _apportion(response.input_tokens, shares)
+        for (text, _, future), vector, share, tokens in zip(batch, vectors, shares, billed_tokens):
+            if future.done():
+                # Caller was cancelled while the batch was in flight
+                continue
+            future.set_result(ModelResponse(
+                provider=response.provider,
+                model=response.model,
+                prompt=text,
+                response=vector,
+                input_tokens=tokens,
+                output_tokens=0,
+                total_tokens=tokens,
+                cost=round(batch_cost * share, 6),
+                metadata={
+                    **response.metadata,
+                    "batch_size": len(batch)
+                }
+            ))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Batching statistics
+
+        :return: Dictionary with texts submitted, requests sent and average batch size
+        """
+        return {
+            "texts_submitted": self.texts_submitted,
+            "requests_sent": self.requests_sent,
+            "pending": sum(len(pending.items) for pending in self._pending.values()),
+            "average_batch_size": self.texts_submitted / self.requests_sent if self.requests_sent else 0.0
+        }
+
+def _apportion(total: int, shares: List[float]) -> List[int]:
+    # Largest-remainder rounding, so the integer parts add up to total exactly
+    exact = [total * share for share in shares]
+    parts = [int(value) for value in exact]
+    by_remainder = sorted(range(len(shares)), key=lambda index: exact[index] - parts[index], reverse=True)
+    for index in by_remainder[:total - sum(parts)]:
+        parts[index] += 1
+    return parts
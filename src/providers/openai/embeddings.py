@@ -1,46 +1,135 @@
+import base64
+from types import SimpleNamespace
 from .base import BaseOpenAIProvider
+from .batch_api import OpenAIBatchJob
 from src.providers.base_provider import ModelResponse
-from typing import Union, List, Optional
+from src.providers.embedding_cache import EmbeddingCache
+from src.utils.error_handler import classify_error
+from typing import Union, List, Optional, Any, Sequence, Dict, Iterable
 
 class EmbeddingProvider(BaseOpenAIProvider):
-    async def generate(self, 
-                       input: Union[str, List[str]], 
+    def __init__(self,
+                 api_key: str,
+                 *args,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 output_format: str = "list",
+                 keep_raw_response: bool = True,
+                 **kwargs):
+        """
+        Initialize OpenAI Embedding Provider
+
+        With output_format="numpy" embeddings are requested base64-encoded
+        and decoded straight into a contiguous float32 NumPy matrix (4 bytes
+        per dimension instead of a Python float object per dimension).
+
+        :param api_key: OpenAI API key
+        :param args: Positional provider options (model, request_type, ...; see BaseOpenAIProvider)
+        :param embedding_cache: Optional per-text cache consulted before calling the API
+        :param output_format: "list" for lists of floats or "numpy" for a float32 matrix
+        :param keep_raw_response: Whether to keep the SDK response on ModelResponse.raw_response
+        :param kwargs: Provider options (see BaseOpenAIProvider)
+        """
+        if output_format not in ("list", "numpy"):
+            raise ValueError(f"Unsupported output format: {output_format}")
+
+        super().__init__(api_key, *args, **kwargs)
+        self.embedding_cache = embedding_cache
+        self.output_format = output_format
+        self.keep_raw_response = keep_raw_response
+
+    async def generate(self,
+                       input: Union[str, List[str]],
                        **kwargs) -> ModelResponse:
         """
         Generate embeddings using OpenAI's Embedding API
-        
+
+        Duplicate texts are embedded once, and texts found in the embedding
+        cache are not sent at all; results are returned in input order and
+        tokens and cost cover only the texts that were billed.
+
         :param input: Text or list of texts to embed
         :param kwargs: Additional generation parameters
         :return: Comprehensive embedding response
         """
+        # Use specific embedding model
+        model = kwargs.get('model', 'text-embedding-ada-002')
         try:
-            # Use specific embedding model
-            model = kwargs.get('model', 'text-embedding-ada-002')
-            
-            # Prepare generation parameters
-            generation_params = {
-                "model": model,
-                "input": input,
-                **kwargs
-            }
-
-            # Generate embeddings
-            raw_response = self.client.embeddings.create(**generation_params)
-            
-            # Extract embeddings
-            embeddings = [data.embedding for data in raw_response.data]
-
-            # Calculate tokens
+            admission = self._pop_admission(kwargs)
+            deadline = kwargs.pop('deadline', None)
+
             if isinstance(input, str):
                 input_texts = [input]
             else:
                 input_texts = input
+            # Unique texts in first-seen order
+            unique_texts = list(dict.fromkeys(input_texts))
+
+            vectors = {}
+            namespace = None
+            if self.embedding_cache is not None:
+                extra_params = {k: v for k, v in kwargs.items() if k != 'model'}
+                namespace = self.embedding_cache.namespace(model, extra_params)
+                # float32 arrays stack straight into the numpy matrix
+                vectors = await self.embedding_cache.aget_many(
+                    namespace, unique_texts, as_arrays=self.output_format == "numpy"
+                )
+            missing_texts = [text for text in unique_texts if text not in vectors]
+
+            raw_response = None
+            input_tokens = 0
+            token_source = "cache"
+            if missing_texts:
+                # Prepare generation parameters
+                generation_params = {
+                    "model": model,
+                    "input": missing_texts,
+                    **kwargs
+                }
+                if self.output_format == "numpy":
+                    # Decoded straight into the matrix; the values match "float"
+                    generation_params["encoding_format"] = "base64"
 
-            input_tokens = sum(self._calculate_tokens(text) for text in input_texts)
+                async with self._reservation(
+                    model,
+                    lambda: sum(self.count_tokens_batch(missing_texts)),
+                    0,
+                    admission
+                ) as reservation:
+                    # Generate embeddings
+                    raw_response = await self._send(
+                        lambda: self.async_client.embeddings.create(**generation_params), deadline, reservation
+                    )
+
+                    if self.output_format == "numpy":
+                        fresh_matrix = self._decode_matrix(raw_response.data)
+                        fresh = dict(zip(missing_texts, fresh_matrix))
+                    else:
+                        fresh = {
+                            missing_texts[data.index]: data.embedding
+                            for data in raw_response.data
+                        }
+                    vectors.update(fresh)
+                    if namespace is not None:
+                        await self.embedding_cache.aput_many(namespace, fresh)
+
+                    input_tokens, _, token_source = self._resolve_usage(
+                        raw_response,
+                        lambda: sum(self.count_tokens_batch(missing_texts))
+                    )
+                    reservation.used = input_tokens
+
+            # Reassemble in input order
+            if self.output_format == "numpy":
+                if missing_texts and len(missing_texts) == len(input_texts):
+                    # Nothing cached or repeated: rows are already in input order
+                    embeddings = fresh_matrix
+                else:
+                    embeddings = self._stack([vectors[text] for text in input_texts])
+            else:
+                embeddings = [vectors[text] for text in input_texts]
 
             # Calculate cost (if applicable)
-            pricing = self.get_model_pricing(model)
-            input_cost = (input_tokens / 1000) * pricing.get("input_token_cost", 0)
+            input_cost = self.get_model_price(model).cost(input_tokens)
 
             # Create response object
             return ModelResponse(
@@ -52,9 +141,95 @@ class EmbeddingProvider(BaseOpenAIProvider):
                 output_tokens=0,
                 total_tokens=input_tokens,
                 cost=round(input_cost, 4),
-                raw_response=raw_response,
-                metadata=kwargs
+                raw_response=raw_response if self.keep_raw_response else None,
+                metadata={
+                    **kwargs,
+                    "token_source": token_source,
+                    "embedded_texts": len(missing_texts),
+                    "cached_texts": len(unique_texts) - len(missing_texts)
+                }
             )
 
         except Exception as e:
-            raise RuntimeError(f"OpenAI Embedding generation error: {str(e)}")
\ No newline at end of file
+            raise classify_error(e, "OpenAI Embedding generation error", "OpenAI") from e
+
+    async def submit_batch(self,
+                           texts: Iterable[str],
+                           poll_interval: float = 5.0,
+                           metadata: Optional[Dict[str, str]] = None,
+                           **kwargs) -> OpenAIBatchJob:
+        """
+        Submit texts as one job on the asynchronous Batch API (one request per text)
+        
+        :param texts: Texts to embed
+        :param poll_interval: Initial seconds between status checks
+        :param metadata: Optional batch metadata
+        :param kwargs: Embedding parameters applied to every request
+        :return: Submitted batch job
+        """
+        texts = list(texts)
+        model = kwargs.pop('model', 'text-embedding-ada-002')
+        bodies = [{"model": model, "input": text, **kwargs} for text in texts]
+        job = OpenAIBatchJob(
+            self, "/v1/embeddings", texts, bodies,
+            lambda text, body, batch_id: self._batch_response(model, text, body, batch_id),
+            poll_interval=poll_interval
+        )
+        await job.submit(metadata)
+        return job
+
+    def _batch_response(self, model: str, text: str, body: Dict[str, Any], batch_id: str) -> ModelResponse:
+        """
+        Build a ModelResponse from one Batch API embeddings body
+        
+        :param model: Requested embedding model
+        :param text: Embedded text
+        :param body: Embeddings JSON from the batch output file
+        :param batch_id: Batch the response belongs to
+        :return: Embedding response priced at the batch rate
+        """
+        vector = body["data"][0]["embedding"]
+        if self.output_format == "numpy":
+            vector = self._stack(vector)
+        usage = body.get("usage")
+        input_tokens, _, token_source = self._resolve_usage(
+            SimpleNamespace(usage=SimpleNamespace(**usage) if usage else None),
+            lambda: self._calculate_tokens(text)
+        )
+
+        return ModelResponse(
+            provider="OpenAI",
+            model=model,
+            prompt=text,
+            response=vector,
+            input_tokens=input_tokens,
+            output_tokens=0,
+            total_tokens=input_tokens,
+            cost=round(self.get_model_price(model).batch_cost(input_tokens), 4),
+            raw_response=body if self.keep_raw_response else None,
+            metadata={"token_source": token_source, "batch_id": batch_id}
+        )
+
+    @staticmethod
+    def _decode_matrix(data: Sequence[Any]):
+        """
+        Decode base64 embeddings into one contiguous float32 matrix
+        
+        :param data: Embedding objects from the API response
+        :return: Array of shape (len(data), dimensions), rows in request order
+        """
+        import numpy as np
+
+        ordered = sorted(data, key=lambda item: item.index)
+        # A bytearray keeps the result writable, like the _stack path
+        buffer = bytearray()
+        for item in ordered:
+            buffer += base64.b64decode(item.embedding)
+        # The API sends little-endian float32; frombuffer reuses the joined bytes
+        return np.frombuffer(buffer, dtype="<f4").reshape(len(ordered), -1)
+
+    @staticmethod
+    def _stack(rows: List[Any]):
+        import numpy as np
+
+        return np.asarray(rows, dtype=np.float32)
@@ -1,6 +1,6 @@
 from .base import BaseOpenAIProvider
 from src.providers.base_provider import ModelResponse
-from typing import Union, List, Optional
+from src.utils.error_handler import classify_error
 
 class ImageProvider(BaseOpenAIProvider):
     async def generate(self, 
@@ -14,6 +14,8 @@ class ImageProvider(BaseOpenAIProvider):
         :return: Model response with image details and cost
         """
         try:
+            deadline = kwargs.pop('deadline', None)
+
             # Default generation parameters
             model = kwargs.get('model', 'dall-e-3')
             
@@ -38,15 +40,15 @@ class ImageProvider(BaseOpenAIProvider):
             }
 
             # Generate images
-            response = self.client.images.generate(**generation_params)
+            response = await self._send(
+                lambda: self.async_client.images.generate(**generation_params), deadline
+            )
             
             # Calculate image generation cost
-            pricing = self.get_model_pricing(model)
-            resolution_pricing = pricing.get("resolution_pricing", {})
             size = generation_params["size"]
             
             # Calculate total cost based on number of images and resolution
-            image_cost = resolution_pricing.get(size, 0) * generation_params["n"]
+            image_cost = self.get_model_price(model).image_cost(size, generation_params["n"])
 
             # Extract image URLs
             image_urls = [img.url for img in response.data]
@@ -65,4 +67,4 @@ class ImageProvider(BaseOpenAIProvider):
             )
 
         except Exception as e:
-            raise RuntimeError(f"OpenAI Image generation error: {str(e)}")
\ No newline at end of file
+            raise classify_error(e, "OpenAI Image generation error", "OpenAI") from e
\ No newline at end of file
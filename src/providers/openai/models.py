@@ -1,7 +1,32 @@
-from .base import BaseOpenAIProvider
+from .base import OpenAIClientMixin
+from src.core.pricing import PricingView
 from typing import List, Dict, Any, Optional
 
-class ModelManager(BaseOpenAIProvider):
+class ModelManager(OpenAIClientMixin):
+    # Live view of the OpenAI table in the shared pricing catalog
+    PRICING = PricingView("openai")
+
+    def __init__(self,
+                 api_key: str,
+                 model: Optional[str] = None,
+                 request_type: Optional[str] = None,
+                 base_url: Optional[str] = None):
+        """
+        OpenAI model catalog helper (not a generation provider)
+
+        :param api_key: OpenAI API key
+        :param model: Specific model (defaults to latest)
+        :param request_type: Accepted for backwards compatibility
+        :param base_url: Override for the OpenAI API base URL
+        """
+        self.api_key = api_key
+        self.model = model or self.get_latest_model()
+        self.request_type = request_type
+        self.base_url = base_url
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {}
+
     @classmethod
     def list_models(cls) -> List[str]:
         """
@@ -0,0 +1,233 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Deque, Dict, Hashable, Optional, Tuple
+
+class Priority(IntEnum):
+    # Lower values are admitted first
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float = 60.0):
+        """
+        Continuously refilling token bucket
+
+        :param per_minute: Refill rate per minute
+        :param burst_seconds: Seconds of refill the bucket can hold (sets the burst size)
+        """
+        if per_minute <= 0:
+            raise ValueError("per_minute must be positive")
+
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until amount can be taken (requests above capacity wait for a full bucket)
+
+        :param amount: Amount to take
+        :return: Seconds to wait, 0 if available now
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        """
+        Take amount from the bucket (the level goes negative for requests above capacity)
+
+        :param amount: Amount to take
+        """
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float):
+        """
+        Return amount to the bucket
+
+        :param amount: Amount to give back
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+@dataclass
+class _Waiter:
+    tokens: int
+    future: "asyncio.Future"
+    enqueued: float = field(default_factory=time.monotonic)
+
+class _ModelQueue:
+    """
+    Rate limit buckets and waiting requests for one model
+    """
+    def __init__(self, rpm: Optional[float], tpm: Optional[float], burst_seconds: float):
+        self.requests = TokenBucket(rpm, burst_seconds) if rpm else None
+        self.tokens = TokenBucket(tpm, burst_seconds) if tpm else None
+        # priority -> tenant -> FIFO of waiters; tenants rotate within a priority
+        self.classes: Dict[int, "OrderedDict[Hashable, Deque[_Waiter]]"] = {}
+        self.depth = 0
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def push(self, priority: int, tenant: Hashable, waiter: _Waiter):
+        tenants = self.classes.setdefault(priority, OrderedDict())
+        tenants.setdefault(tenant, deque()).append(waiter)
+        self.depth += 1
+
+    def peek(self) -> Tuple[int, Hashable, _Waiter]:
+        priority = min(self.classes)
+        tenant, waiters = next(iter(self.classes[priority].items()))
+        return priority, tenant, waiters[0]
+
+    def pop(self, priority: int, tenant: Hashable):
+        tenants = self.classes[priority]
+        waiters = tenants.pop(tenant)
+        waiters.popleft()
+        if waiters:
+            # Back of the rotation so other tenants go next
+            tenants[tenant] = waiters
+        elif not tenants:
+            del self.classes[priority]
+        self.depth -= 1
+
+    def wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def consume(self, tokens: int):
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(tokens)
+
+class RateLimitScheduler:
+    def __init__(self,
+                 limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                 default_rpm: Optional[float] = None,
+                 default_tpm: Optional[float] = None,
+                 burst_seconds: float = 60.0):
+        """
+        Client-side requests-per-minute and tokens-per-minute scheduler
+
+        Each model gets an RPM and a TPM token bucket. Callers wait in
+        acquire() until both buckets can cover the request; waiting requests
+        are admitted by priority class, and round-robin between tenants
+        within a class so one busy tenant cannot starve the others. Admission
+        is strictly in that order, so a large request is never overtaken
+        indefinitely by smaller ones.
+
+        :param limits: Per-model (rpm, tpm) limits; None disables a limit
+        :param default_rpm: RPM for models without explicit limits
+        :param default_tpm: TPM for models without explicit limits
+        :param burst_seconds: Seconds of quota a bucket holds; lower values smooth bursts
+        """
+        self.limits = dict(limits or {})
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.burst_seconds = burst_seconds
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    def _queue(self, model: str) -> Optional[_ModelQueue]:
+        queue = self._queues.get(model)
+        if queue is None:
+            rpm, tpm = self.limits.get(model, (self.default_rpm, self.default_tpm))
+            if not rpm and not tpm:
+                return None
+            queue = self._queues[model] = _ModelQueue(rpm, tpm, self.burst_seconds)
+        return queue
+
+    async def acquire(self,
+                      model: str,
+                      tokens: int = 0,
+                      priority: int = Priority.NORMAL,
+                      tenant: Hashable = None) -> float:
+        """
+        Wait until a request for model fits under its rate limits
+
+        :param model: Model the request is for
+        :param tokens: Estimated tokens for the request (prompt plus max output)
+        :param priority: Priority class (Priority.HIGH first)
+        :param tenant: Tenant identifier used for fair queuing
+        :return: Seconds spent waiting
+        """
+        queue = self._queue(model)
+        if queue is None:
+            return 0.0
+
+        waiter = _Waiter(tokens, asyncio.get_running_loop().create_future())
+        queue.push(int(priority), tenant, waiter)
+        if queue.dispatcher is None or queue.dispatcher.done():
+            queue.dispatcher = asyncio.ensure_future(self._dispatch(queue))
+        return await waiter.future
+
+    def settle(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """
+        Correct the TPM bucket once a request's real token usage is known
+
+        :param model: Model the request was for
+        :param estimated_tokens: Tokens taken at admission
+        :param actual_tokens: Tokens actually used
+        """
+        queue = self._queues.get(model)
+        if queue is None or queue.tokens is None:
+            return
+        difference = estimated_tokens - actual_tokens
+        if difference > 0:
+            queue.tokens.refund(difference)
+        elif difference < 0:
+            queue.tokens.consume(-difference)
+
+    async def _dispatch(self, queue: _ModelQueue):
+        while queue.depth:
+            priority, tenant, waiter = queue.peek()
+            if waiter.future.done():
+                # Caller gave up while queued
+                queue.pop(priority, tenant)
+                continue
+
+            delay = queue.wait_time(waiter.tokens)
+            if delay > 0:
+                # Re-check afterwards: a higher priority request may have arrived
+                await asyncio.sleep(delay)
+                continue
+
+            queue.pop(priority, tenant)
+            queue.consume(waiter.tokens)
+            waited = time.monotonic() - waiter.enqueued
+            queue.admitted += 1
+            queue.total_wait += waited
+            queue.max_wait = max(queue.max_wait, waited)
+            waiter.future.set_result(waited)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue depth and wait time per rate-limited model
+
+        :return: Statistics keyed by model
+        """
+        return {
+            model: {
+                "queue_depth": queue.depth,
+                "admitted": queue.admitted,
+                "average_wait": queue.total_wait / queue.admitted if queue.admitted else 0.0,
+                "max_wait": queue.max_wait
+            }
+            for model, queue in self._queues.items()
+        }
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from src.providers.base_provider import ModelResponse
+
+class ResponseCache:
+    def __init__(self,
+                 max_entries: int = 1000,
+                 ttl: Optional[float] = 3600.0,
+                 disk_path: Optional[str] = None):
+        """
+        Exact-match cache of model responses keyed by a canonical request hash
+
+        Entries live in a bounded in-memory LRU and expire after ttl seconds.
+        With disk_path set, entries are also written to a SQLite file so they
+        survive restarts; a disk hit is promoted back into memory.
+
+        :param max_entries: Maximum number of responses kept in memory
+        :param ttl: Seconds a response stays valid (never expires if None)
+        :param disk_path: Optional SQLite file used as a second cache tier
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, Tuple[float, ModelResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes the SQLite connection; never held together with _lock
+        self._disk_lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        if disk_path is not None:
+            self._connection = sqlite3.connect(disk_path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY,"
+                " expires_at REAL NOT NULL,"
+                " response TEXT NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(provider: str, params: Dict[str, Any]) -> str:
+        """
+        Hash a request into a cache key
+
+        Parameters are serialized as JSON with sorted keys, so the same
+        model, messages and generation settings always map to the same key
+        regardless of argument order.
+
+        :param provider: Provider name
+        :param params: Request parameters (model, messages/prompt, sampling settings)
+        :return: Hex digest identifying the request
+        """
+        canonical = json.dumps([provider, params], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.blake2b(canonical.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        """
+        Look up a response, returning a copy flagged as a cache hit
+
+        The returned response has zero cost and token counts and
+        metadata["cache_hit"] set; metadata["cached_usage"] keeps the counts
+        and cost of the original request. Blocks on disk I/O
+        when the disk tier is consulted; async code should use aget.
+
+        :param key: Cache key from make_key
+        :return: Cached response, or None on a miss
+        """
+        now = time.time()
+        found, response = self._get_memory(key, now)
+        if not found:
+            response = self._get_disk(key, now)
+        return response
+
+    async def aget(self, key: str) -> Optional[ModelResponse]:
+        """
+        Look up a response without blocking the event loop
+
+        Memory hits are answered inline; the disk tier is read in the
+        default executor.
+
+        :param key: Cache key from make_key
+        :return: Cached response, or None on a miss
+        """
+        now = time.time()
+        found, response = self._get_memory(key, now)
+        if found:
+            return response
+        if self._connection is None:
+            return self._get_disk(key, now)
+        return await asyncio.get_running_loop().run_in_executor(None, self._get_disk, key, now)
+
+    def _get_memory(self, key: str, now: float) -> Tuple[bool, Optional[ModelResponse]]:
+        # (True, response) on a hit; (False, None) when the disk tier decides
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, self._as_hit(response)
+                del self._entries[key]
+                self._expirations += 1
+        return False, None
+
+    def _get_disk(self, key: str, now: float) -> Optional[ModelResponse]:
+        row = None
+        with self._disk_lock:
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT expires_at, response FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] < now:
+                    with self._connection:
+                        self._connection.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+        with self._lock:
+            if row is not None:
+                expires_at, payload = row
+                if expires_at >= now:
+                    response = _loads(payload)
+                    self._store(key, expires_at, response)
+                    self._hits += 1
+                    self._disk_hits += 1
+                    return self._as_hit(response)
+                self._expirations += 1
+            self._misses += 1
+            return None
+
+    def put(self, key: str, response: ModelResponse):
+        """
+        Store a response, evicting the least recently used entry when full
+
+        Blocks on the disk write when the disk tier is enabled; async code
+        should use aput.
+
+        :param key: Cache key from make_key
+        :param response: Response to cache (its raw_response is not kept)
+        """
+        expires_at, response = self._put_memory(key, response)
+        self._put_disk(key, expires_at, response)
+
+    async def aput(self, key: str, response: ModelResponse):
+        """
+        Store a response, writing the disk tier in the default executor
+
+        :param key: Cache key from make_key
+        :param response: Response to cache (its raw_response is not kept)
+        """
+        expires_at, response = self._put_memory(key, response)
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._put_disk, key, expires_at, response)
+
+    def _put_memory(self, key: str, response: ModelResponse) -> Tuple[float, ModelResponse]:
+        expires_at = time.time() + self.ttl if self.ttl is not None else float("inf")
+        response = replace(response, raw_response=None, metadata=dict(response.metadata))
+        with self._lock:
+            self._store(key, expires_at, response)
+        return expires_at, response
+
+    def _put_disk(self, key: str, expires_at: float, response: ModelResponse):
+        with self._disk_lock:
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)",
+                        (key, expires_at, _dumps(response))
+                    )
+
+    def _store(self, key: str, expires_at: float, response: ModelResponse):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    @staticmethod
+    def _as_hit(response: ModelResponse) -> ModelResponse:
+        # Zeroed like coalesced followers so trackers count the request once
+        cached_usage = {
+            "input_tokens": response.input_tokens,
+            "output_tokens": response.output_tokens,
+            "cost": response.cost
+        }
+        return replace(
+            response,
+            input_tokens=0,
+            output_tokens=0,
+            total_tokens=0,
+            cost=0.0,
+            timestamp=datetime.now(),
+            metadata={**response.metadata, "cache_hit": True, "cached_usage": cached_usage}
+        )
+
+    def clear(self):
+        """
+        Drop all cached responses (both tiers) and reset statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._disk_hits = self._misses = 0
+            self._evictions = self._expirations = 0
+        with self._disk_lock:
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM response_cache")
+
+    def close(self):
+        """
+        Close the on-disk tier
+        """
+        with self._disk_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Cache hit/miss statistics
+
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": self._hits / lookups if lookups else 0.0
+            }
+
+def _dumps(response: ModelResponse) -> str:
+    return json.dumps({
+        "provider": response.provider,
+        "model": response.model,
+        "prompt": response.prompt,
+        "response": response.response,
+        "input_tokens": response.input_tokens,
+        "output_tokens": response.output_tokens,
+        "total_tokens": response.total_tokens,
+        "cost": response.cost,
+        "timestamp": response.timestamp.isoformat(),
+        "metadata": response.metadata
+    }, default=str)
+
+def _loads(payload: str) -> ModelResponse:
+    record = json.loads(payload)
+    record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+    return ModelResponse(**record)
@@ -0,0 +1,280 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+from src.core.pricing import ModelPrice, pricing_catalog
+from src.providers.base_provider import BaseProvider, ModelResponse
+from src.providers.batch import BatchRun, ProgressCallback
+from src.utils.error_handler import (
+    BadRequestError, ContextWindowExceededError, ProviderError, classify_error
+)
+
+POLICIES = ("cheapest", "fastest", "slo")
+
+# Status codes that mean the request itself is invalid, whichever provider gets it
+REQUEST_ERROR_STATUSES = (400, 422)
+
+@dataclass
+class RouteStats:
+    """
+    Health of one routing target, smoothed with an exponentially weighted moving average
+    """
+    latency: Optional[float] = None
+    error_rate: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    cooldown_until: float = 0.0
+
+class _Target:
+    __slots__ = ("name", "provider", "stats", "_price", "_price_generation")
+
+    def __init__(self, name: str, provider: BaseProvider):
+        self.name = name
+        self.provider = provider
+        self.stats = RouteStats()
+        self._price: Optional[ModelPrice] = None
+        self._price_generation: Optional[int] = None
+
+    @property
+    def price(self) -> ModelPrice:
+        # Ranking runs on every request, so resolve once per installed catalog table
+        generation = pricing_catalog.generation
+        if self._price is None or generation != self._price_generation:
+            self._price = self.provider.get_model_price()
+            self._price_generation = generation
+        return self._price
+
+    def estimated_cost(self, input_tokens: int, output_tokens: int) -> float:
+        # Unrounded, so cheap models do not tie at zero
+        return (input_tokens * self.price.input_cost_per_token
+                + output_tokens * self.price.output_cost_per_token)
+
+class ProviderRouter:
+    def __init__(self,
+                 providers: Union[Sequence[BaseProvider], Mapping[str, BaseProvider]],
+                 policy: str = "cheapest",
+                 latency_slo: Optional[float] = None,
+                 alpha: float = 0.2,
+                 error_threshold: float = 0.5,
+                 cooldown: float = 30.0,
+                 expected_output_tokens: int = 256):
+        """
+        Route generations across providers by cost and observed latency
+
+        Every target keeps an EWMA of its latency and error rate. Requests
+        are sent to the best-ranked target whose context window fits the
+        prompt; on failure the router fails over to the next one, so callers
+        only see an error when every target has failed (or the request itself
+        was rejected as invalid with a 400 or 422). Targets whose error rate crosses
+        error_threshold are moved to the back of the ranking for cooldown
+        seconds.
+
+        Policies:
+          - "cheapest": lowest estimated cost
+          - "fastest": lowest latency EWMA (unmeasured targets first, so they get probed)
+          - "slo": cheapest target whose latency EWMA is within latency_slo,
+            then the remaining targets fastest first
+
+        :param providers: Providers to route between (a mapping gives them names)
+        :param policy: Default routing policy
+        :param latency_slo: Latency objective in seconds for the "slo" policy
+        :param alpha: EWMA smoothing factor (weight of the newest sample)
+        :param error_threshold: Error rate above which a target is cooled down
+        :param cooldown: Seconds a failing target stays at the back of the ranking
+        :param expected_output_tokens: Output estimate when the request sets no max_tokens
+        """
+        if isinstance(providers, Mapping):
+            named = list(providers.items())
+        else:
+            named = [(f"{provider.PRICING_PROVIDER}:{provider.model}", provider) for provider in providers]
+        if not named:
+            raise ValueError("At least one provider is required")
+        if len({name for name, _ in named}) != len(named):
+            raise ValueError("Provider names must be unique (pass a mapping to name them)")
+        self._check_policy(policy, latency_slo)
+
+        self.targets = [_Target(name, provider) for name, provider in named]
+        self.policy = policy
+        self.latency_slo = latency_slo
+        self.alpha = alpha
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.expected_output_tokens = expected_output_tokens
+
+    @staticmethod
+    def _check_policy(policy: str, latency_slo: Optional[float]):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy}")
+        if policy == "slo" and latency_slo is None:
+            raise ValueError("The slo policy needs a latency_slo")
+
+    @staticmethod
+    def estimate_tokens(prompt: Any) -> int:
+        """
+        Cheap prompt size estimate (about four characters per token)
+
+        Used only for ranking and context-window checks, where tokenizing
+        every prompt for every target would cost more than the decision.
+
+        :param prompt: Text or list of chat messages
+        :return: Estimated token count
+        """
+        if isinstance(prompt, str):
+            return len(prompt) // 4 + 1
+        if isinstance(prompt, dict):
+            return ProviderRouter.estimate_tokens(prompt.get("content") or "") + 4
+        if isinstance(prompt, (list, tuple)):
+            return sum(ProviderRouter.estimate_tokens(item) for item in prompt)
+        return len(str(prompt)) // 4 + 1
+
+    def rank(self,
+             input_tokens: int,
+             output_tokens: Optional[int] = None,
+             policy: Optional[str] = None,
+             latency_slo: Optional[float] = None) -> List[_Target]:
+        """
+        Order eligible targets for a request
+
+        Targets whose context window cannot hold the request are left out;
+        cooled-down targets go last, in policy order.
+
+        :param input_tokens: Estimated prompt tokens
+        :param output_tokens: Expected output tokens
+        :param policy: Routing policy (defaults to the router's)
+        :param latency_slo: Latency objective for the "slo" policy (defaults to the router's)
+        :return: Targets in the order they should be tried
+        """
+        policy = policy or self.policy
+        latency_slo = latency_slo if latency_slo is not None else self.latency_slo
+        self._check_policy(policy, latency_slo)
+        if output_tokens is None:
+            output_tokens = self.expected_output_tokens
+
+        needed = input_tokens + output_tokens
+        now = time.monotonic()
+        healthy, cooling = [], []
+        for target in self.targets:
+            window = target.price.context_window
+            # A zero context window means the catalog does not know it
+            if window and needed > window:
+                continue
+            (cooling if target.stats.cooldown_until > now else healthy).append(target)
+
+        def latency(target: _Target) -> float:
+            return target.stats.latency if target.stats.latency is not None else 0.0
+
+        def cost(target: _Target) -> float:
+            return target.estimated_cost(input_tokens, output_tokens)
+
+        if policy == "cheapest":
+            key = lambda target: (cost(target), latency(target))
+        elif policy == "fastest":
+            key = lambda target: (latency(target), cost(target))
+        else:
+            key = lambda target: (
+                (0, cost(target), latency(target)) if latency(target) <= latency_slo
+                else (1, latency(target), cost(target))
+            )
+        return sorted(healthy, key=key) + sorted(cooling, key=key)
+
+    def _observe(self, target: _Target, elapsed: Optional[float], failed: bool):
+        stats = target.stats
+        stats.requests += 1
+        stats.error_rate += self.alpha * ((1.0 if failed else 0.0) - stats.error_rate)
+        if failed:
+            stats.failures += 1
+            if stats.error_rate >= self.error_threshold:
+                stats.cooldown_until = time.monotonic() + self.cooldown
+        else:
+            stats.latency = elapsed if stats.latency is None else stats.latency + self.alpha * (elapsed - stats.latency)
+            stats.cooldown_until = 0.0
+
+    async def generate(self,
+                       prompt: Any,
+                       policy: Optional[str] = None,
+                       latency_slo: Optional[float] = None,
+                       **kwargs) -> ModelResponse:
+        """
+        Generate with the best-ranked target, failing over on errors
+
+        metadata["route"] records the chosen target and the ones that failed
+        before it. Targets that cannot take the prompt's shape (e.g. a
+        message list for a text-only provider) are skipped.
+
+        :param prompt: Input text prompt or chat messages
+        :param policy: Routing policy for this call
+        :param latency_slo: Latency objective for this call
+        :param kwargs: Generation parameters passed to the provider
+        :return: Model response from the first target that succeeds
+        """
+        output_tokens = kwargs.get("max_tokens", kwargs.get("max_completion_tokens"))
+        targets = self.rank(self.estimate_tokens(prompt), output_tokens, policy, latency_slo)
+        if not targets:
+            raise BadRequestError("No provider has a context window large enough for this request")
+        # Text-only targets would fail on a message list without being unhealthy
+        targets = [target for target in targets if target.provider.accepts_prompt(prompt)]
+        if not targets:
+            raise BadRequestError("No provider with a large enough context window accepts this prompt")
+
+        failed: List[str] = []
+        last_error: Optional[ProviderError] = None
+        for target in targets:
+            started = time.monotonic()
+            try:
+                response = await target.provider.generate(prompt, **kwargs)
+            except Exception as e:
+                error = classify_error(e, f"{target.name} error", target.provider.PRICING_PROVIDER)
+                if isinstance(error, ContextWindowExceededError):
+                    # A larger window may still fit; the target itself is healthy
+                    failed.append(target.name)
+                    last_error = error
+                    continue
+                if isinstance(error, BadRequestError) and error.status_code in (None,) + REQUEST_ERROR_STATUSES:
+                    # The request itself is at fault; another provider will not help.
+                    # Other 4xx (e.g. 404 for a model this target does not serve) fail over.
+                    raise
+                self._observe(target, None, failed=True)
+                failed.append(target.name)
+                last_error = error
+                continue
+            self._observe(target, time.monotonic() - started, failed=False)
+            response.metadata["route"] = {"target": target.name, "failed": failed}
+            return response
+
+        raise ProviderError(
+            f"All providers failed ({', '.join(failed)}); last error: {last_error}"
+        ) from last_error
+
+    def generate_many(self,
+                      prompts,
+                      concurrency: int = 8,
+                      on_progress: Optional[ProgressCallback] = None,
+                      **kwargs) -> BatchRun:
+        """
+        Route many prompts with bounded concurrency (see BaseProvider.generate_many)
+
+        :param prompts: Prompts to generate for
+        :param concurrency: Maximum prompts in flight
+        :param on_progress: Called with (summary, result) after each completion
+        :param kwargs: Generation parameters passed to every call
+        :return: Batch run
+        """
+        return BatchRun(self.generate, prompts, concurrency, on_progress, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Latency and error statistics per target
+
+        :return: Statistics keyed by target name
+        """
+        now = time.monotonic()
+        return {
+            target.name: {
+                "latency": target.stats.latency,
+                "error_rate": target.stats.error_rate,
+                "requests": target.stats.requests,
+                "failures": target.stats.failures,
+                "cooling_down": target.stats.cooldown_until > now
+            }
+            for target in self.targets
+        }
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Collapse identical concurrent calls into one in-flight request
+
+        The first caller for a key starts the work; callers arriving with the
+        same key while it is running await the same result instead of
+        issuing their own request. Nothing is remembered once the call
+        finishes (see ResponseCache for that).
+        """
+        self._calls: Dict[str, "asyncio.Future"] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run factory once per key among concurrent callers
+
+        The work runs in its own task, so a cancelled caller does not cancel
+        the request for the others waiting on it. Exceptions are raised to
+        every caller.
+
+        :param key: Request identity (e.g. from ResponseCache.make_key)
+        :param factory: Coroutine function performing the request
+        :return: Tuple of (result, shared) where shared is True for followers
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            self.followers += 1
+            return await asyncio.shield(call), True
+
+        call = asyncio.ensure_future(factory())
+        self._calls[key] = call
+        call.add_done_callback(lambda _: self._forget(key, call))
+        self.leaders += 1
+        return await asyncio.shield(call), False
+
+    def _forget(self, key: str, call: "asyncio.Future"):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Coalescing statistics
+
+        :return: Dictionary with leader/follower counts and calls in flight
+        """
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._calls)
+        }
@@ -0,0 +1,261 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional, Set, TypeVar
+
+from src.core.rollups import QuantileSketch
+
+T = TypeVar("T")
+
+class ProviderError(RuntimeError):
+    """
+    Error raised by a provider call
+
+    Subclasses RuntimeError so code catching the generic error keeps working.
+    """
+    retryable = False
+
+    def __init__(self,
+                 message: str,
+                 provider: Optional[str] = None,
+                 status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        """
+        :param message: Error message
+        :param provider: Provider name
+        :param status_code: HTTP status code, if the provider answered
+        :param retry_after: Seconds the provider asked us to wait before retrying
+        """
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class BadRequestError(ProviderError):
+    """Request rejected as invalid (400, 404, 422); retrying will not help"""
+
+class ContextWindowExceededError(BadRequestError):
+    """Prompt plus output budget does not fit the model's context window (raised before sending)"""
+
+class AuthenticationError(ProviderError):
+    """Missing or invalid credentials (401, 403)"""
+
+class RateLimitError(ProviderError):
+    """Provider rate limit hit (429)"""
+    retryable = True
+
+class ProviderServerError(ProviderError):
+    """Provider-side failure (5xx, including 529 overloaded)"""
+    retryable = True
+
+class ProviderTimeoutError(ProviderError):
+    """Request timed out before the provider answered"""
+    retryable = True
+
+class ProviderConnectionError(ProviderError):
+    """Network failure reaching the provider"""
+    retryable = True
+
+class DeadlineExceededError(ProviderTimeoutError):
+    """The call's overall deadline ran out (no further retries)"""
+    retryable = False
+
+def parse_retry_after(headers: Any) -> Optional[float]:
+    """
+    Read the wait time from Retry-After style response headers
+
+    :param headers: Response headers (any mapping with .get)
+    :return: Seconds to wait, or None if absent or unparseable
+    """
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(error: Exception, context: str, provider: Optional[str] = None) -> ProviderError:
+    """
+    Map an SDK or network exception onto the typed error hierarchy
+
+    Works with the OpenAI and Anthropic SDK exceptions (both expose
+    status_code and the HTTP response) without importing either SDK.
+
+    :param error: Exception raised by the provider call
+    :param context: Message prefix, e.g. "OpenAI generation error"
+    :param provider: Provider name
+    :return: Typed provider error (the error itself if already typed)
+    """
+    if isinstance(error, ProviderError):
+        return error
+
+    message = f"{context}: {str(error)}"
+    status_code = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    retry_after = parse_retry_after(getattr(response, "headers", None))
+
+    if isinstance(status_code, int):
+        if status_code == 429:
+            error_type = RateLimitError
+        elif status_code in (401, 403):
+            error_type = AuthenticationError
+        elif status_code in (408, 409) or status_code >= 500:
+            error_type = ProviderServerError
+        else:
+            error_type = BadRequestError
+        return error_type(message, provider, status_code, retry_after)
+
+    name = type(error).__name__
+    if isinstance(error, asyncio.TimeoutError) or "Timeout" in name:
+        return ProviderTimeoutError(message, provider)
+    if isinstance(error, ConnectionError) or "Connection" in name:
+        return ProviderConnectionError(message, provider)
+    return ProviderError(message, provider)
+
+class RetryPolicy:
+    def __init__(self,
+                 max_attempts: int = 3,
+                 base_delay: float = 0.5,
+                 max_delay: float = 30.0,
+                 deadline: Optional[float] = None,
+                 hedge_after: Optional[float] = None,
+                 hedge_quantile: Optional[float] = None,
+                 hedge_min_samples: int = 20):
+        """
+        Retry engine with exponential backoff, deadlines and hedged requests
+
+        Retryable errors (429, 5xx, timeouts, connection failures) are retried
+        after a full-jitter exponential backoff, waiting at least as long as
+        the provider's Retry-After header asks. No attempt or backoff runs
+        past the deadline.
+
+        With hedging enabled, an attempt still running after the hedge delay
+        gets a duplicate request; the first success wins and the other is
+        cancelled. The delay is hedge_after seconds, or the observed
+        hedge_quantile latency (e.g. 0.95) once hedge_min_samples calls have
+        completed.
+
+        :param max_attempts: Attempts per call, including the first
+        :param base_delay: Backoff before the first retry, doubled per attempt
+        :param max_delay: Backoff cap in seconds
+        :param deadline: Default per-call time budget in seconds (None for no limit)
+        :param hedge_after: Fixed hedge delay in seconds
+        :param hedge_quantile: Latency quantile used as an adaptive hedge delay
+        :param hedge_min_samples: Completed calls needed before the quantile is trusted
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be a positive integer")
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = QuantileSketch()
+        self.retries = 0
+        self.hedges = 0
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before the next attempt
+
+        :param attempt: Number of attempts made so far (1 after the first failure)
+        :param retry_after: Provider-requested wait, if any
+        :return: Seconds to sleep
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait before sending a hedged duplicate
+
+        :return: Hedge delay, or None when hedging is off or not yet calibrated
+        """
+        if self.hedge_quantile is not None and self.latency.count >= self.hedge_min_samples:
+            return self.latency.quantile(self.hedge_quantile)
+        return self.hedge_after
+
+    async def run(self,
+                  operation: Callable[[], Awaitable[T]],
+                  deadline: Optional[float] = None,
+                  provider: Optional[str] = None) -> T:
+        """
+        Run operation under this policy
+
+        :param operation: Coroutine function performing one attempt
+        :param deadline: Time budget in seconds for this call (defaults to the policy's)
+        :param provider: Provider name used when classifying errors
+        :return: Result of the first successful attempt
+        """
+        budget = deadline if deadline is not None else self.deadline
+        expires = time.monotonic() + budget if budget is not None else None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = expires - time.monotonic() if expires is not None else None
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceededError("Deadline exceeded", provider)
+            try:
+                started = time.monotonic()
+                result = await asyncio.wait_for(self._attempt(operation), remaining)
+                self.latency.add(time.monotonic() - started)
+                return result
+            except Exception as e:
+                if expires is not None and time.monotonic() >= expires:
+                    raise DeadlineExceededError(f"Deadline of {budget}s exceeded", provider) from e
+                # The caller re-raises with its own context, so keep the original
+                error = classify_error(e, "Request failed", provider)
+                if not error.retryable or attempt >= self.max_attempts:
+                    raise
+
+                delay = self.backoff(attempt, error.retry_after)
+                if expires is not None and time.monotonic() + delay >= expires:
+                    # Waiting would overrun the deadline
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, operation: Callable[[], Awaitable[T]]) -> T:
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is None:
+            return await operation()
+
+        tasks: Set["asyncio.Future"] = {asyncio.ensure_future(operation())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(operation()))
+
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the losing (or abandoned) request
+            for task in tasks:
+                task.cancel()
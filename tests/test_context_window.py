@@ -0,0 +1,130 @@
+import pytest
+import tiktoken
+
+from src.core.tokenizer_registry import TokenizerRegistry
+from src.providers.context_window import TRUNCATION_MARKER, ContextFitter
+from src.utils.error_handler import ContextWindowExceededError
+
+
+# One token per byte keeps the arithmetic readable
+BYTES = tiktoken.Encoding(
+    name="test_context_bytes",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    TokenizerRegistry.clear()
+    yield
+    TokenizerRegistry.clear()
+
+
+def conversation():
+    return [
+        {"role": "system", "content": "s" * 10},
+        {"role": "user", "content": "a" * 100},
+        {"role": "assistant", "content": "b" * 100},
+        {"role": "user", "content": "c" * 50}
+    ]
+
+
+def test_fit_passes_through_and_rejects():
+    fitter = ContextFitter(BYTES, 300, "tiny")
+    messages = conversation()
+    # 260 content tokens + 4 * 3 per message + 3 for the reply
+    assert fitter.count(messages) == 275
+    assert fitter.fit(messages) == [messages]
+    with pytest.raises(ContextWindowExceededError, match="275 tokens"):
+        fitter.fit(messages, output_tokens=50)
+    # Unknown window: no check
+    assert ContextFitter(BYTES, 0).fit(messages, 10 ** 6) == [messages]
+
+
+def test_fit_skips_tokenizing_prompts_that_clearly_fit(monkeypatch):
+    def fail(*args):
+        raise AssertionError("prompt was tokenized")
+
+    monkeypatch.setattr(TokenizerRegistry, "count_tokens_batch", fail)
+    messages = conversation()
+    # 260 bytes + 15 overhead is within 300 - 20, so no tokens need counting
+    assert ContextFitter(BYTES, 300).fit(messages, output_tokens=20) == [messages]
+    with pytest.raises(AssertionError, match="tokenized"):
+        ContextFitter(BYTES, 300).fit(messages, output_tokens=30)
+
+
+def test_drop_oldest_keeps_system_and_latest_turn():
+    fitter = ContextFitter(BYTES, 300)
+    fitted = fitter.fit(conversation(), output_tokens=100, policy="drop_oldest")[0]
+
+    # The first user message goes together with the assistant reply to it
+    assert [msg["content"][0] for msg in fitted] == ["s", "c"]
+    with pytest.raises(ContextWindowExceededError):
+        fitter.fit(conversation(), output_tokens=250, policy="drop_oldest")
+
+
+def test_drop_oldest_keeps_tool_calls_with_their_replies():
+    call = {"id": "call_1", "type": "function", "function": {"name": "lookup", "arguments": "{}"}}
+    messages = [
+        {"role": "system", "content": "s" * 10},
+        {"role": "user", "content": "a" * 50},
+        {"role": "assistant", "content": None, "tool_calls": [call]},
+        {"role": "tool", "tool_call_id": "call_1", "content": "t" * 100},
+        {"role": "assistant", "content": None, "tool_calls": [{**call, "id": "call_2"}]},
+        {"role": "tool", "tool_call_id": "call_2", "content": "u" * 100},
+        {"role": "assistant", "content": "b" * 20},
+        {"role": "user", "content": "c" * 20}
+    ]
+    fitter = ContextFitter(BYTES, 300)
+    # 327 prompt tokens against 272: dropping the first two messages would be enough
+    fitted = fitter.fit(messages, output_tokens=28, policy="drop_oldest")[0]
+
+    # ...but would leave the first tool reply without its assistant call
+    assert fitted == [messages[0]] + messages[4:]
+    roles = [msg["role"] for msg in fitted]
+    assert all(roles[i - 1] == "assistant" or roles[i - 1] == "tool"
+               for i, role in enumerate(roles) if role == "tool")
+
+
+def test_truncate_middle_keeps_head_and_tail():
+    fitter = ContextFitter(BYTES, 200)
+    messages = [{"role": "user", "content": "h" * 200 + "m" * 200 + "t" * 200}]
+    fitted = fitter.fit(messages, output_tokens=50, policy="truncate_middle")[0]
+
+    content = fitted[0]["content"]
+    assert fitter.count(fitted) <= 150
+    assert content.startswith("h") and content.endswith("t") and TRUNCATION_MARKER in content
+    assert "m" not in content
+
+
+def test_chunk_splits_longest_message():
+    fitter = ContextFitter(BYTES, 200)
+    messages = [{"role": "system", "content": "s" * 20}, {"role": "user", "content": "x" * 500}]
+    chunks = fitter.fit(messages, output_tokens=50, policy="chunk")
+
+    # 150 - (20 + 2 * 3 + 3) leaves 121 tokens per chunk
+    assert len(chunks) == 5
+    assert all(chunk[0] == messages[0] and fitter.count(chunk) <= 150 for chunk in chunks)
+    assert "".join(chunk[1]["content"] for chunk in chunks) == messages[1]["content"]
+
+
+def test_count_handles_tool_calls_and_multipart_content():
+    fitter = ContextFitter(BYTES, 300)
+    messages = [
+        {"role": "user", "content": [
+            {"type": "text", "text": "a" * 10},
+            {"type": "image_url", "image_url": {"url": "https://example.com/cat.png"}},
+            {"type": "text", "text": "b" * 5}
+        ]},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "call_1", "type": "function"}]},
+        {"role": "tool", "tool_call_id": "call_1", "content": "c" * 20}
+    ]
+
+    # 35 text tokens + 3 * 3 per message + 3 for the reply
+    assert fitter.count(messages) == 47
+    assert fitter.fit(messages, output_tokens=100) == [messages]
+    chunks = fitter.fit(messages, output_tokens=260, policy="chunk")
+    # Only the plain-text tool result is split
+    assert len(chunks) == 2 and all(chunk[:2] == messages[:2] for chunk in chunks)
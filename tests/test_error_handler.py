@@ -0,0 +1,51 @@
+import asyncio
+from email.utils import formatdate
+from types import SimpleNamespace
+import time
+
+from src.utils.error_handler import (
+    AuthenticationError, ProviderConnectionError, ProviderServerError, ProviderTimeoutError,
+    RetryPolicy, classify_error, parse_retry_after
+)
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+def status_error(status, headers=None):
+    error = Exception("failed")
+    error.status_code = status
+    error.response = SimpleNamespace(headers=headers or {})
+    return error
+
+
+def test_classify_error_maps_status_and_transport_failures():
+    assert isinstance(classify_error(status_error(401), "ctx"), AuthenticationError)
+    server = classify_error(status_error(529, {"retry-after": "2"}), "ctx", "Anthropic")
+    assert isinstance(server, ProviderServerError) and server.retryable
+    assert server.retry_after == 2.0 and server.provider == "Anthropic"
+    assert isinstance(classify_error(APITimeoutError("slow"), "ctx"), ProviderTimeoutError)
+    assert isinstance(classify_error(ConnectionResetError("reset"), "ctx"), ProviderConnectionError)
+    # Already typed errors pass through untouched
+    assert classify_error(server, "other") is server
+
+
+def test_parse_retry_after_accepts_http_dates():
+    retry_after = parse_retry_after({"retry-after": formatdate(time.time() + 30, usegmt=True)})
+    assert 28 <= retry_after <= 31
+    assert parse_retry_after({"retry-after": "soon"}) is None
+
+
+def test_retry_policy_backoff_and_adaptive_hedge_delay():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0, hedge_quantile=0.95, hedge_min_samples=10)
+    assert all(0 <= policy.backoff(attempt) <= 4.0 for attempt in range(1, 10))
+    assert policy.backoff(1, retry_after=7.0) == 7.0
+    assert policy.hedge_delay() is None
+
+    async def call():
+        return "ok"
+
+    for _ in range(10):
+        assert asyncio.run(policy.run(call)) == "ok"
+    assert policy.hedge_delay() is not None and policy.hedge_delay() < 0.1
@@ -0,0 +1,148 @@
+import json
+import threading
+
+import pytest
+
+from src.core.cost_calculator import CostCalculator
+from src.core.pricing import PricingCatalog, PricingView, pricing_catalog
+
+
+def test_catalog_compiles_per_token_rates():
+    price = pricing_catalog.get("gpt-4o")
+
+    assert price.input_cost_per_token == pytest.approx(0.0025 / 1000)
+    assert price.cost(1000, 1000) == pytest.approx(0.0125)
+    assert pricing_catalog.get("dall-e-3").image_cost("1024x1792", 2) == pytest.approx(0.16)
+    with pytest.raises(AttributeError):
+        price.input_cost_per_token = 0
+
+
+def test_catalog_swaps_versions_from_json(tmp_path):
+    catalog = PricingCatalog()
+    view = PricingView("openai", catalog=catalog)
+    table = catalog.to_dict()
+    table["version"] = "2025-01-01"
+    table["providers"]["openai"]["models"]["gpt-4o"]["input_token_cost"] = 0.001
+    path = tmp_path / "pricing.json"
+    path.write_text(json.dumps(table))
+
+    assert catalog.load(str(path)) == "2025-01-01"
+    assert catalog.get("gpt-4o").cost(1000) == pytest.approx(0.001)
+    # Legacy dict-style views read the swapped table
+    assert view["gpt-4o"]["input_token_cost"] == 0.001
+    # The process-wide catalog is untouched
+    assert pricing_catalog.get("gpt-4o").cost(1000) == pytest.approx(0.0025)
+
+
+def test_catalog_swap_waits_for_provider_default_update():
+    catalog = PricingCatalog()
+    table = catalog.to_dict()
+    table["version"] = "2025-01-01"
+
+    # Simulate set_provider_default mid read-modify-write
+    with catalog._write_lock:
+        swapper = threading.Thread(target=catalog.swap, args=(table,))
+        swapper.start()
+        swapper.join(0.1)
+        assert swapper.is_alive()
+        assert catalog.version != "2025-01-01"
+    swapper.join()
+    assert catalog.version == "2025-01-01"
+
+    catalog.set_provider_default("acme", 1.0, 2.0)
+    assert catalog.version == "2025-01-01"
+    assert catalog.provider_default("acme").cost(1000, 1000) == pytest.approx(3.0)
+
+
+def test_catalog_compiles_batch_rates():
+    assert pricing_catalog.get("gpt-4o").batch_cost(1000, 1000) == pytest.approx(0.0125 / 2)
+
+    catalog = PricingCatalog({
+        "version": "test",
+        "providers": {"acme": {
+            "batch_discount": 0.25,
+            "models": {
+                "discounted": {"input_token_cost": 1.0, "output_token_cost": 2.0},
+                "explicit": {"input_token_cost": 1.0, "batch_input_token_cost": 0.1}
+            }
+        }}
+    })
+    assert catalog.get("discounted").batch_cost(1000, 1000) == pytest.approx(2.25)
+    assert catalog.get("explicit").batch_cost(1000) == pytest.approx(0.1)
+
+
+def test_catalog_rejects_unversioned_tables():
+    with pytest.raises(ValueError):
+        PricingCatalog({"providers": {}})
+
+
+def test_cost_calculator_resolves_against_catalog():
+    assert CostCalculator.calculate_cost("openai", 1000, 1000) == 0.0035
+    assert CostCalculator.calculate_cost("OpenAI", 1000, 1000, model="gpt-4o") == 0.0125
+    with pytest.raises(ValueError):
+        CostCalculator.calculate_cost("unknown", 1, 1)
+
+
+def test_add_provider_pricing_updates_views():
+    original = pricing_catalog.to_dict()
+    try:
+        CostCalculator.add_provider_pricing("Cohere", 0.001, 0.002)
+        assert CostCalculator.PROVIDER_PRICING["cohere"]["output_token_cost"] == 0.002
+        assert CostCalculator.calculate_cost("cohere", 1000, 1000) == 0.003
+    finally:
+        pricing_catalog.swap(original)
+
+
+def test_bulk_engine_matches_per_row_pricing():
+    np = pytest.importorskip("numpy")
+    from src.core.bulk_pricing import BulkCostEngine
+
+    names = ["gpt-4o", "gpt-4o-mini", "unknown-model"]
+    input_tokens = np.array([1000, 2000, 500, 10])
+    output_tokens = np.array([100, 0, 50, 10])
+    model_ids = np.array([0, 1, 0, 2])
+    engine = BulkCostEngine()
+
+    costs = engine.price(input_tokens, output_tokens, model_ids, names)
+
+    expected = [
+        pricing_catalog.resolve(names[m]).cost(int(i), int(o))
+        for i, o, m in zip(input_tokens, output_tokens, model_ids)
+    ]
+    assert costs == pytest.approx(expected)
+    totals = engine.group_totals(costs, model_ids, names)
+    assert totals["gpt-4o"] == pytest.approx(expected[0] + expected[2])
+    assert totals["unknown-model"] == 0
+
+
+def test_bulk_engine_what_if_pricing_for_tracker():
+    pytest.importorskip("numpy")
+    from src.core.bulk_pricing import BulkCostEngine
+    from src.core.token_tracker import ConcurrentTokenTracker
+
+    tracker = ConcurrentTokenTracker(num_shards=2)
+    tracker.track_tokens("OpenAI", 1000, 1000, model="gpt-4o")
+    tracker.track_tokens("OpenAI", 1000, 0, model="gpt-4")
+
+    actual = BulkCostEngine().price_tracker(tracker)
+    assert actual == pytest.approx({"gpt-4o": 0.0125, "gpt-4": 0.03})
+
+    on_mini = BulkCostEngine().price_tracker(tracker, as_model="gpt-4o-mini")
+    assert on_mini == pytest.approx({"gpt-4o": 0.00075, "gpt-4": 0.00015})
+
+    cheaper = BulkCostEngine(overrides={"gpt-4o": (0.001, 0.002)}).price_tracker(tracker)
+    assert cheaper["gpt-4o"] == pytest.approx(0.003)
+
+
+def test_bulk_engine_views_do_not_pin_tracker_columns():
+    pytest.importorskip("numpy")
+    from src.core.bulk_pricing import _as_numpy
+    from src.core.token_tracker import TokenTracker
+
+    tracker = TokenTracker()
+    tracker.track_tokens("OpenAI", 1000, 0, model="gpt-4o")
+    view = _as_numpy(tracker.usage_columns()[0]["input_tokens"])
+
+    # Growing the live column must not raise BufferError while the view is alive
+    tracker.track_tokens("OpenAI", 5, 0, model="gpt-4o")
+    assert list(view) == [1000]
@@ -0,0 +1,1425 @@
+import asyncio
+import base64
+import json
+import struct
+import threading
+import time
+
+# Providers import the SDKs on first use; load them up front so timing
+# assertions measure requests rather than a cold import
+import anthropic
+import openai
+import pytest
+import tiktoken
+
+from src.batch_runner import BatchRunner, Checkpoint
+from src.core.pricing import pricing_catalog
+from src.core.tokenizer_registry import TokenizerRegistry
+from src.providers.anthropic_provider import AnthropicProvider
+from src.providers.base_provider import BaseProvider, ModelResponse
+from src.providers.batch import BatchRun
+from src.providers.openai.chat import ChatProvider
+from src.providers.openai.embedding_batcher import EmbeddingBatcher
+from src.providers.openai.embeddings import EmbeddingProvider
+from src.providers.openai.models import ModelManager
+from src.providers.openai.openai_provider import OpenAIProvider
+from src.providers.embedding_cache import EmbeddingCache
+from src.providers.rate_limiter import Priority, RateLimitScheduler
+from src.providers.response_cache import ResponseCache
+from src.providers.router import ProviderRouter
+from src.utils.error_handler import (
+    BadRequestError, ContextWindowExceededError, DeadlineExceededError, RateLimitError, RetryPolicy
+)
+
+
+# Byte-level encoding so the tests never need to download BPE files
+TEST_ENCODING = tiktoken.Encoding(
+    name="test_bytes",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: TEST_ENCODING)
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: TEST_ENCODING)
+    TokenizerRegistry.clear()
+    yield
+    TokenizerRegistry.clear()
+
+
+def chat_completion_payload(body):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "pong"},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 7, "completion_tokens": 1, "total_tokens": 8}
+    }
+
+
+def embedding_payload(body):
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+
+    def encode(vector):
+        if body.get("encoding_format") == "base64":
+            return base64.b64encode(struct.pack("<%df" % len(vector), *vector)).decode()
+        return vector
+
+    return {
+        "object": "list",
+        "model": body["model"],
+        "data": [
+            {"object": "embedding", "index": i, "embedding": encode([float(len(text)), 0.5])}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+    }
+
+
+def anthropic_message_payload(body):
+    return {
+        "id": "msg_test",
+        "type": "message",
+        "role": "assistant",
+        "model": body["model"],
+        "content": [{"type": "text", "text": "pong"}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 12, "output_tokens": 3}
+    }
+
+
+class EventStream:
+    """
+    Server-sent event response, written as one HTTP chunk per event
+    """
+
+    def __init__(self, events, interval: float = 0.0):
+        self.events = events
+        self.interval = interval
+
+    async def write(self, writer):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        for name, data in self.events:
+            await asyncio.sleep(self.interval)
+            frame = f"event: {name}\n" if name else ""
+            frame += f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+            encoded = frame.encode()
+            writer.write(b"%x\r\n%s\r\n" % (len(encoded), encoded))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class Reply:
+    """
+    Explicit HTTP reply for a MockServer route (status, headers, extra delay)
+    """
+
+    def __init__(self, payload, status: int = 200, headers=None, delay: float = 0.0):
+        self.payload = payload
+        self.status = status
+        self.headers = headers or {}
+        self.delay = delay
+
+
+class MockServer:
+    """
+    Minimal HTTP/1.1 stand-in for a provider REST API
+
+    Each route maps a request path to a callable taking the decoded JSON body
+    (raw bytes for non-JSON uploads) and returning the JSON payload, a Reply
+    or an EventStream to send back after ``delay`` seconds. Routes ending in
+    "/" match by prefix and their callables also receive the request path.
+    """
+
+    def __init__(self, routes, delay: float = 0.0):
+        self.routes = routes
+        self.delay = delay
+        self.requests = []
+        self.bodies = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.root_url = f"http://127.0.0.1:{port}"
+        self.base_url = f"{self.root_url}/v1"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    key, value = line.decode().split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests.append((method, path))
+                try:
+                    body = json.loads(body or b"{}")
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    pass
+                self.bodies.append(body)
+
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                await asyncio.sleep(self.delay)
+                self.in_flight -= 1
+                if path in self.routes:
+                    result = self.routes[path](body)
+                else:
+                    prefix = max((key for key in self.routes if key.endswith("/") and path.startswith(key)), key=len)
+                    result = self.routes[prefix](body, path)
+                if isinstance(result, EventStream):
+                    await result.write(writer)
+                    continue
+                reply = result if isinstance(result, Reply) else Reply(result)
+                await asyncio.sleep(reply.delay)
+                payload = reply.payload if isinstance(reply.payload, bytes) else json.dumps(reply.payload).encode()
+                extra_headers = "".join(f"{k}: {v}\r\n" for k, v in reply.headers.items()).encode()
+                writer.write(
+                    b"HTTP/1.1 %d X\r\nContent-Type: application/json\r\n" % reply.status
+                    + extra_headers
+                    + b"Content-Length: %d\r\n\r\n" % len(payload) + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def test_chat_generate_runs_concurrently():
+    concurrency = 20
+    delay = 0.2
+
+    async def run():
+        routes = {"/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes, delay=delay) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o-mini", base_url=server.base_url)
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                provider.generate(f"ping {i}") for i in range(concurrency)
+            ))
+            return responses, time.perf_counter() - started
+
+    responses, elapsed = asyncio.run(run())
+
+    assert [r.response for r in responses] == ["pong"] * concurrency
+    # Serialised calls would take concurrency * delay (4s)
+    assert elapsed < delay * 4
+
+
+def test_openai_provider_runs_concurrently():
+    concurrency = 10
+    delay = 0.2
+
+    async def run():
+        routes = {"/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes, delay=delay) as server:
+            provider = OpenAIProvider(api_key="test", model="gpt-4o", base_url=server.base_url)
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                provider.generate("ping") for _ in range(concurrency)
+            ))
+            return responses, time.perf_counter() - started
+
+    responses, elapsed = asyncio.run(run())
+
+    assert all(r.provider == "OpenAI" for r in responses)
+    assert elapsed < delay * 4
+
+
+def test_chat_response_cache_serves_repeats_without_network(tmp_path):
+    cache_path = str(tmp_path / "responses.db")
+
+    async def run():
+        routes = {"/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            cache = ResponseCache(max_entries=10, disk_path=cache_path)
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    response_cache=cache)
+            first = await provider.generate("ping", temperature=0)
+            second = await provider.generate("ping", temperature=0)
+            other = await provider.generate("ping", temperature=1)
+            cache.close()
+
+            # A fresh process reading the same disk tier
+            restarted = ResponseCache(disk_path=cache_path)
+            provider.response_cache = restarted
+            third = await provider.generate("ping", temperature=0)
+            restarted.close()
+            return first, second, other, third, cache, restarted, len(server.requests)
+
+    first, second, other, third, cache, restarted, network_calls = asyncio.run(run())
+
+    assert network_calls == 2
+    assert "cache_hit" not in first.metadata
+    assert second.response == "pong" and second.cost == 0.0 and second.metadata["cache_hit"]
+    # Not billed again, so a tracker fed from responses counts the request once
+    assert (second.input_tokens, second.output_tokens, second.total_tokens) == (0, 0, 0)
+    assert second.metadata["cached_usage"] == {
+        "input_tokens": first.input_tokens, "output_tokens": first.output_tokens, "cost": first.cost
+    }
+    assert "cache_hit" not in other.metadata
+    assert third.metadata["cache_hit"] and third.cost == 0.0
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def record_disk_threads(cache, threads):
+    for name in ("_get_disk", "_put_disk"):
+        method = getattr(cache, name)
+
+        def wrapper(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+        setattr(cache, name, wrapper)
+
+
+def test_response_cache_disk_tier_runs_off_the_event_loop(tmp_path):
+    disk_threads = []
+
+    async def run():
+        cache = ResponseCache(disk_path=str(tmp_path / "responses.db"))
+        record_disk_threads(cache, disk_threads)
+        await cache.aput("k", ModelResponse(provider="OpenAI", model="gpt-4o", prompt="p", response="r"))
+        # A restarted cache only has the disk tier
+        restarted = ResponseCache(disk_path=str(tmp_path / "responses.db"))
+        record_disk_threads(restarted, disk_threads)
+        return threading.get_ident(), await restarted.aget("k")
+
+    loop_thread, hit = asyncio.run(run())
+
+    assert hit.response == "r" and hit.metadata["cache_hit"]
+    assert len(disk_threads) == 2 and loop_thread not in disk_threads
+
+
+def test_embedding_cache_store_runs_off_the_event_loop(tmp_path):
+    disk_threads = []
+
+    async def run():
+        cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+        record_disk_threads(cache, disk_threads)
+        await cache.aput_many("m", {"text": [1.0, 2.0]})
+        restarted = EmbeddingCache(str(tmp_path / "embeddings.db"))
+        record_disk_threads(restarted, disk_threads)
+        return threading.get_ident(), await restarted.aget_many("m", ["text", "other"])
+
+    loop_thread, vectors = asyncio.run(run())
+
+    assert vectors == {"text": [1.0, 2.0]}
+    assert len(disk_threads) == 2 and loop_thread not in disk_threads
+
+
+def test_chat_single_flight_shares_identical_in_flight_calls():
+    async def run():
+        routes = {"/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes, delay=0.1) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4", base_url=server.base_url,
+                                    single_flight=True)
+            shared = await asyncio.gather(*(provider.generate("popular") for _ in range(10)))
+            sampled = await asyncio.gather(*(
+                provider.generate("popular", temperature=1, single_flight=False) for _ in range(3)
+            ))
+            return shared, sampled, server.bodies
+
+    shared, sampled, bodies = asyncio.run(run())
+
+    assert len(bodies) == 1 + 3
+    assert all("single_flight" not in body for body in bodies)
+    leaders = [r for r in shared if not r.metadata.get("coalesced")]
+    assert len(leaders) == 1 and leaders[0].cost > 0
+    assert sum(r.cost for r in shared) == leaders[0].cost
+    assert sum(r.total_tokens for r in shared) == leaders[0].total_tokens > 0
+    assert all(r.response == "pong" for r in shared + sampled)
+
+
+def test_chat_provider_keeps_positional_model():
+    provider = ChatProvider("test", "gpt-4", single_flight=True)
+
+    assert provider.model == "gpt-4" and provider.single_flight is not None
+
+
+def test_embedding_provider_keeps_positional_model():
+    provider = EmbeddingProvider("test", "text-embedding-3-small", output_format="list")
+
+    assert provider.model == "text-embedding-3-small" and provider.embedding_cache is None
+
+
+def test_model_manager_instantiates_without_generate():
+    manager = ModelManager("test")
+
+    assert manager.model == ChatProvider.get_latest_model()
+    assert manager.get_model_pricing("gpt-4o")["type"] == "chat"
+    assert "gpt-4o" in ModelManager.filter_models(status="active", model_type="chat")
+    assert not isinstance(manager, BaseProvider)
+
+def test_chat_generate_waits_for_rate_limiter():
+    async def run():
+        routes = {"/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            limiter = RateLimitScheduler({"gpt-4o": (600, 100000)}, burst_seconds=0.1)
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    rate_limiter=limiter)
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                provider.generate(f"ping {i}", max_tokens=5, priority=Priority.HIGH, tenant="t")
+                for i in range(4)
+            ))
+            return time.perf_counter() - started, limiter.stats()["gpt-4o"], server.bodies
+
+    elapsed, stats, bodies = asyncio.run(run())
+
+    assert elapsed >= 0.3
+    assert stats["admitted"] == 4
+    assert all("priority" not in body and "tenant" not in body for body in bodies)
+
+
+def test_failed_request_refunds_rate_limit_reservation():
+    def reject(body):
+        return Reply({"error": {"message": "nope", "type": "x"}}, status=400)
+
+    async def run():
+        routes = {"/v1/chat/completions": reject}
+        async with MockServer(routes) as server:
+            limiter = RateLimitScheduler({"gpt-4o": (None, 1000)})
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    rate_limiter=limiter)
+            with pytest.raises(BadRequestError):
+                await provider.generate("ping", max_tokens=500)
+            return limiter._queues["gpt-4o"].tokens.level
+
+    # The 500+ token reservation went back to the bucket
+    assert asyncio.run(run()) > 990
+
+
+def test_retries_and_timeouts_are_charged_to_the_rate_limiter():
+    async def run(replies, **options):
+        routes = {"/v1/chat/completions": lambda body: replies.pop(0) if replies else chat_completion_payload(body)}
+        async with MockServer(routes) as server:
+            # 1000 token bucket refilling at one token per second
+            limiter = RateLimitScheduler({"gpt-4o": (None, 60)}, burst_seconds=1000)
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    rate_limiter=limiter,
+                                    retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01))
+            try:
+                await provider.generate("ping", max_tokens=100, **options)
+            except DeadlineExceededError:
+                pass
+            queue = limiter._queues["gpt-4o"]
+            return queue.admitted, queue.tokens.level
+
+    rejected = Reply({"error": {"message": "slow down", "type": "x"}}, status=429)
+    admitted, level = asyncio.run(run([rejected]))
+    # The retry took its own admission; the 429 consumed nothing, the success 7 + 1 tokens
+    assert admitted == 2
+    assert 991 <= level < 993
+
+    slow = Reply(chat_completion_payload({"model": "gpt-4o"}), delay=1.0)
+    admitted, level = asyncio.run(run([slow], deadline=0.2))
+    # The server had the 4 token prompt when the deadline ran out
+    assert admitted == 1
+    assert 995 <= level < 997
+
+
+def test_anthropic_generate_waits_for_rate_limiter():
+    async def run():
+        routes = {"/v1/messages": anthropic_message_payload}
+        async with MockServer(routes) as server:
+            # 1000 token bucket refilling at one token per second
+            limiter = RateLimitScheduler({"claude-3-5-sonnet-20241022": (None, 60)}, burst_seconds=1000)
+            provider = AnthropicProvider(api_key="test", model="claude-3-5-sonnet-20241022",
+                                         base_url=server.root_url, rate_limiter=limiter)
+            await provider.generate("ping", max_tokens=500, priority=Priority.HIGH, tenant="t")
+            queue = limiter._queues["claude-3-5-sonnet-20241022"]
+            return queue.admitted, queue.tokens.level, server.bodies
+
+    admitted, level, bodies = asyncio.run(run())
+
+    assert admitted == 1
+    # Settled to the 12 + 3 tokens reported in the usage block
+    assert 985 <= level < 990
+    assert "priority" not in bodies[0] and "tenant" not in bodies[0]
+
+
+def test_chat_retries_rate_limits_and_types_errors():
+    def flaky(replies):
+        def route(body):
+            return replies.pop(0) if replies else chat_completion_payload(body)
+        return route
+
+    def error_reply(status, **headers):
+        return Reply({"error": {"message": "nope", "type": "x"}}, status=status, headers=headers)
+
+    async def run(replies, **options):
+        routes = {"/v1/chat/completions": flaky(replies)}
+        async with MockServer(routes) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01))
+            started = time.perf_counter()
+            try:
+                result = await provider.generate("ping", **options)
+            except Exception as e:
+                result = e
+            return result, len(server.requests), time.perf_counter() - started
+
+    response, calls, elapsed = asyncio.run(run([error_reply(429, **{"retry-after": "0.3"}),
+                                                error_reply(503)]))
+    assert response.response == "pong" and calls == 3
+    assert elapsed >= 0.3  # honoured Retry-After
+
+    error, calls, _ = asyncio.run(run([error_reply(400)]))
+    assert isinstance(error, BadRequestError) and isinstance(error, RuntimeError)
+    assert error.status_code == 400 and calls == 1
+    assert str(error).startswith("OpenAI generation error")
+
+    error, calls, _ = asyncio.run(run([error_reply(429, **{"retry-after-ms": "50"})] * 3))
+    assert isinstance(error, RateLimitError) and error.retry_after == 0.05 and calls == 3
+
+    slow = Reply(chat_completion_payload({"model": "gpt-4o"}), delay=1.0)
+    error, _, elapsed = asyncio.run(run([slow], deadline=0.2))
+    assert isinstance(error, DeadlineExceededError) and elapsed < 0.8
+
+
+def test_chat_hedges_slow_requests():
+    async def run():
+        replies = [Reply(chat_completion_payload({"model": "gpt-4o"}), delay=1.0)]
+        routes = {"/v1/chat/completions": lambda body: replies.pop(0) if replies else chat_completion_payload(body)}
+        async with MockServer(routes) as server:
+            policy = RetryPolicy(hedge_after=0.1)
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    retry_policy=policy)
+            started = time.perf_counter()
+            response = await provider.generate("ping")
+            return response, time.perf_counter() - started, policy.hedges, len(server.requests)
+
+    response, elapsed, hedges, calls = asyncio.run(run())
+
+    assert response.response == "pong"
+    assert elapsed < 0.6 and hedges == 1 and calls == 2
+
+
+def test_generate_many_streams_results_and_isolates_failures():
+    def route(body):
+        if body["messages"][0]["content"].endswith("7"):
+            return Reply({"error": {"message": "bad prompt", "type": "x"}}, status=400)
+        return chat_completion_payload(body)
+
+    async def run():
+        async with MockServer({"/v1/chat/completions": route}, delay=0.02) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4", base_url=server.base_url)
+            progress = []
+            batch = provider.generate_many(
+                [f"prompt {i}" for i in range(30)],
+                concurrency=5,
+                on_progress=lambda summary, result: progress.append(summary.completed)
+            )
+            results = [result async for result in batch]
+            return results, batch.summary, progress, server.peak_in_flight
+
+    results, summary, progress, peak = asyncio.run(run())
+
+    assert sorted(r.index for r in results) == list(range(30))
+    failed = [r for r in results if not r.ok]
+    assert [r.index for r in failed] == [7, 17, 27]
+    assert all(isinstance(r.error, BadRequestError) for r in failed)
+    assert progress == list(range(1, 31))
+    assert peak <= 5
+    assert summary.succeeded == 27 and summary.failed == 3 and summary.total == 30
+    assert summary.total_tokens == 27 * 8
+    assert summary.cost == pytest.approx(sum(r.response.cost for r in results if r.ok))
+
+
+def test_generate_many_applies_backpressure_to_slow_consumers():
+    started = []
+
+    async def generate(prompt):
+        started.append(prompt)
+        return ModelResponse(provider="test", model="test", prompt=prompt, response=prompt)
+
+    async def run():
+        ahead = []
+        async for result in BatchRun(generate, range(100), concurrency=4):
+            # Let the workers run as far as they can before taking the next result
+            await asyncio.sleep(0.001)
+            ahead.append(len(started) - (len(ahead) + 1))
+        return ahead
+
+    ahead = asyncio.run(run())
+
+    assert len(started) == 100
+    # At most the queue (4) plus one result held by each blocked worker (4)
+    assert max(ahead) <= 8
+
+
+def test_batch_runner_resumes_from_checkpoint(tmp_path):
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    lines = [json.dumps({"id": f"req-{i}", "prompt": f"line {i}"}) for i in range(12)]
+    lines[3] = ""
+    lines[4] = "{not json"
+    input_path.write_text("\n".join(lines) + "\n")
+
+    # A previous run finished lines 0-5, 8 and 10 before crashing
+    checkpoint = Checkpoint(str(output_path) + ".checkpoint")
+    for line in [0, 1, 2, 3, 4, 5, 8, 10]:
+        checkpoint.mark(line)
+    checkpoint.save()
+
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_completion_payload}) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url)
+            runner = BatchRunner(provider, concurrency=3, checkpoint_every=2)
+            summary = await runner.run(str(input_path), str(output_path))
+            # Nothing left to do on a second invocation
+            again = await runner.run(str(input_path), str(output_path))
+            return summary, again, [body["messages"][0]["content"] for body in server.bodies]
+
+    summary, again, sent = asyncio.run(run())
+
+    assert sorted(sent) == ["line 11", "line 6", "line 7", "line 9"]
+    assert summary.succeeded == 4 and again.completed == 0
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert sorted(r["id"] for r in records) == ["req-11", "req-6", "req-7", "req-9"]
+    assert all(r["response"] == "pong" for r in records)
+    assert Checkpoint(str(output_path) + ".checkpoint").watermark == 12
+
+
+def test_batch_runner_recovers_lines_written_after_last_checkpoint(tmp_path):
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text("".join(json.dumps({"prompt": f"line {i}"}) + "\n" for i in range(4)))
+    # Lines 0 and 2 were written but the run crashed before saving the
+    # checkpoint, mid-way through the record for line 3
+    output_path.write_text(json.dumps({"id": 0, "line": 0, "response": "pong"}) + "\n"
+                           + json.dumps({"id": 2, "line": 2, "response": "pong"}) + "\n"
+                           + '{"id": 3, "li')
+
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_completion_payload}) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url)
+            await BatchRunner(provider).run(str(input_path), str(output_path))
+            return [body["messages"][0]["content"] for body in server.bodies]
+
+    sent = asyncio.run(run())
+
+    assert sorted(sent) == ["line 1", "line 3"]
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert sorted(r["line"] for r in records) == [0, 1, 2, 3]
+
+
+def test_checkpoint_recovers_only_records_after_the_saved_offset(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    covered = json.dumps({"id": 0, "line": 0, "response": "pong"}) + "\n"
+    output_path.write_text(covered)
+    checkpoint = Checkpoint(str(output_path) + ".checkpoint")
+    checkpoint.mark(0)
+    checkpoint.save(len(covered))
+    # Written after the save, then the run crashed mid-record
+    with open(output_path, "a") as output_file:
+        output_file.write(json.dumps({"id": 2, "line": 2, "response": "pong"}) + "\n" + '{"id": 3, "li')
+
+    resumed = Checkpoint(str(output_path) + ".checkpoint")
+    # Stand-in for a record the saved checkpoint already covers: never re-read
+    with open(output_path, "r+b") as output_file:
+        output_file.write(json.dumps({"id": 1, "line": 1}).encode().ljust(len(covered) - 1))
+    resumed.recover(str(output_path))
+
+    assert resumed.is_done(0) and resumed.is_done(2)
+    assert not resumed.is_done(1) and not resumed.is_done(3)
+    assert output_path.read_text().endswith('"response": "pong"}\n')
+    assert resumed.output_offset == output_path.stat().st_size
+
+
+def test_batch_runner_records_invalid_lines(tmp_path):
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text('{not json\n{"id": "x"}\n"abc"\n[1]\n')
+
+    async def run():
+        provider = ChatProvider(api_key="test", model="gpt-4o", base_url="http://127.0.0.1:9/v1")
+        return await BatchRunner(provider).run(str(input_path), str(output_path))
+
+    summary = asyncio.run(run())
+
+    assert summary.failed == 4
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert {r["line"] for r in records} == {0, 1, 2, 3}
+    assert all(r["error"]["type"] == "ValueError" for r in records)
+
+
+def test_batch_runner_retries_failed_lines_on_resume(tmp_path):
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text("".join(json.dumps({"prompt": f"line {i}"}) + "\n" for i in range(4)))
+    # Line 3 failed in a run that crashed before saving the checkpoint
+    output_path.write_text(json.dumps({"id": 3, "line": 3, "error": {"type": "X", "message": "x"}}) + "\n")
+    failing = {"line 1"}
+
+    def route(body):
+        if body["messages"][0]["content"] in failing:
+            return Reply({"error": {"message": "nope", "type": "x"}}, status=400)
+        return chat_completion_payload(body)
+
+    async def run():
+        async with MockServer({"/v1/chat/completions": route}) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url)
+            first = await BatchRunner(provider).run(str(input_path), str(output_path))
+            checkpoint = Checkpoint(str(output_path) + ".checkpoint")
+            failing.clear()
+            second = await BatchRunner(provider).run(str(input_path), str(output_path))
+            return first, checkpoint, second, [body["messages"][0]["content"] for body in server.bodies]
+
+    first, checkpoint, second, sent = asyncio.run(run())
+
+    # The recovered failure is retried straight away; the new one stays failed
+    assert sorted(sent[:first.completed]) == ["line 0", "line 1", "line 2", "line 3"]
+    assert first.failed == 1 and checkpoint.watermark == 4 and checkpoint.failed == {1}
+    assert second.succeeded == 1 and sent[first.completed:] == ["line 1"]
+    final = Checkpoint(str(output_path) + ".checkpoint")
+    assert final.watermark == 4 and not final.failed and not final.done
+
+
+class BatchAPIStandIn:
+    """
+    Local stand-in for the Files and Batches endpoints
+
+    Each uploaded request line is answered by ``respond(body)`` (a payload, or
+    a Reply with an error status). Batches report in_progress until they have
+    been polled ``polls_until_done`` times, and output lines come back in
+    reverse order, as the real API does not preserve input order.
+    """
+
+    def __init__(self, respond, polls_until_done: int = 2):
+        self.respond = respond
+        self.polls_until_done = polls_until_done
+        self.files = {}
+        self.batches = {}
+        self.uploaded = []
+
+    def routes(self):
+        return {
+            "/v1/files": self.upload,
+            "/v1/files/": self.content,
+            "/v1/batches": self.create,
+            "/v1/batches/": self.retrieve
+        }
+
+    def _store(self, lines):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        return file_id
+
+    def upload(self, body):
+        start = body.index(b"\r\n\r\n", body.index(b"filename=")) + 4
+        content = body[start:body.index(b"\r\n--", start)]
+        self.uploaded = [json.loads(line) for line in content.splitlines()]
+        file_id = self._store(self.uploaded)
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+
+    def create(self, body):
+        outputs, errors = [], []
+        for line in reversed(self.uploaded):
+            reply = self.respond(line["body"])
+            status, payload = (reply.status, reply.payload) if isinstance(reply, Reply) else (200, reply)
+            record = {"id": "r", "custom_id": line["custom_id"],
+                      "response": {"status_code": status, "body": payload}, "error": None}
+            (outputs if status < 400 else errors).append(record)
+        batch = {
+            "id": f"batch-{len(self.batches)}", "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "validating", "created_at": 0, "polls": 0,
+            "results": (self._store(outputs), self._store(errors) if errors else None)
+        }
+        self.batches[batch["id"]] = batch
+        return self._public(batch)
+
+    def retrieve(self, body, path):
+        batch = self.batches[path.rsplit("/", 1)[1]]
+        batch["polls"] += 1
+        if batch["polls"] >= self.polls_until_done:
+            batch["status"] = "completed"
+            batch["output_file_id"], batch["error_file_id"] = batch["results"]
+        else:
+            batch["status"] = "in_progress"
+        return self._public(batch)
+
+    def content(self, body, path):
+        return Reply(self.files[path.split("/")[3]])
+
+    @staticmethod
+    def _public(batch):
+        return {key: value for key, value in batch.items() if key not in ("polls", "results")}
+
+
+def test_chat_batch_api_round_trip_priced_at_batch_rate():
+    def respond(body):
+        if body["messages"][0]["content"] == "bad":
+            return Reply({"error": {"message": "invalid prompt", "type": "invalid_request_error"}}, status=400)
+        return chat_completion_payload(body)
+
+    async def run():
+        stand_in = BatchAPIStandIn(respond)
+        async with MockServer(stand_in.routes()) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4", base_url=server.base_url)
+            job = await provider.submit_batch(["a", "bad", "c", "d"], poll_interval=0.01, temperature=0)
+            results = [result async for result in job.run(timeout=5)]
+            return job, results, stand_in.uploaded, server.requests
+
+    job, results, uploaded, requests = asyncio.run(run())
+
+    assert job.status == "completed"
+    assert [line["url"] for line in uploaded] == ["/v1/chat/completions"] * 4
+    assert [line["custom_id"] for line in uploaded] == [f"request-{i}" for i in range(4)]
+    assert uploaded[0]["body"] == {"model": "gpt-4", "messages": [{"role": "user", "content": "a"}],
+                                   "temperature": 0}
+    # Polled with backoff until completion
+    assert requests.count(("GET", f"/v1/batches/{job.id}")) == 2
+
+    by_index = {result.index: result for result in results}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert isinstance(by_index[1].error, BadRequestError) and by_index[1].error.status_code == 400
+    price = pricing_catalog.resolve("gpt-4", "openai")
+    assert price.batch_cost(7, 1) == pytest.approx(price.cost(7, 1) / 2)
+    for index in (0, 2, 3):
+        response = by_index[index].response
+        assert response.response == "pong" and response.input_tokens == 7
+        assert response.cost == round(price.batch_cost(7, 1), 4)
+        assert response.metadata["batch_id"] == job.id
+
+
+def test_chat_batch_api_honours_model_override():
+    async def run():
+        stand_in = BatchAPIStandIn(chat_completion_payload)
+        async with MockServer(stand_in.routes()) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o-mini", base_url=server.base_url)
+            job = await provider.submit_batch(["a"], poll_interval=0.01, model="gpt-4")
+            results = [result async for result in job.run(timeout=5)]
+            return results, stand_in.uploaded
+
+    results, uploaded = asyncio.run(run())
+
+    assert uploaded[0]["body"]["model"] == "gpt-4"
+    response = results[0].response
+    assert response.model == "gpt-4"
+    expected = round(pricing_catalog.resolve("gpt-4", "openai").batch_cost(7, 1), 4)
+    assert response.cost == expected and expected > 0
+
+
+def test_embedding_batch_api_round_trip():
+    async def run():
+        stand_in = BatchAPIStandIn(embedding_payload, polls_until_done=1)
+        async with MockServer(stand_in.routes()) as server:
+            provider = EmbeddingProvider(api_key="test", base_url=server.base_url)
+            job = await provider.submit_batch(["a", "bbb"], poll_interval=0.01,
+                                              model="text-embedding-3-small")
+            return sorted([r async for r in job.run()], key=lambda r: r.index), stand_in.uploaded
+
+    results, uploaded = asyncio.run(run())
+
+    assert [line["body"]["model"] for line in uploaded] == ["text-embedding-3-small"] * 2
+    assert [r.response.response for r in results] == [[1.0, 0.5], [3.0, 0.5]]
+    assert all(r.response.model == "text-embedding-3-small" for r in results)
+
+
+def test_response_cache_expires_and_evicts(monkeypatch):
+    from src.providers import response_cache as module
+    from src.providers.base_provider import ModelResponse
+
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "time", lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=60)
+    keys = [cache.make_key("openai", {"model": "gpt-4o", "prompt": str(i)}) for i in range(3)]
+    for key in keys[:2]:
+        cache.put(key, ModelResponse(provider="OpenAI", model="gpt-4o", prompt="p", response="r", cost=1.0))
+
+    assert cache.make_key("openai", {"prompt": "0", "model": "gpt-4o"}) == keys[0]
+    assert cache.get(keys[0]).cost == 0.0
+    cache.put(keys[2], ModelResponse(provider="OpenAI", model="gpt-4o", prompt="p", response="r"))
+    # keys[1] was least recently used
+    assert cache.get(keys[1]) is None
+    now[0] += 61
+    assert cache.get(keys[0]) is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["expirations"] == 1 and stats["hits"] == 1
+
+
+def test_embedding_generate_uses_async_client():
+    async def run():
+        routes = {"/v1/embeddings": embedding_payload}
+        async with MockServer(routes) as server:
+            provider = EmbeddingProvider(api_key="test", base_url=server.base_url)
+            return await provider.generate(["a", "bb"])
+
+    response = asyncio.run(run())
+
+    assert response.response == [[1.0, 0.5], [2.0, 0.5]]
+
+
+def test_embedding_generate_dedupes_and_reuses_cached_texts(tmp_path):
+    cache_path = str(tmp_path / "embeddings.db")
+
+    async def run():
+        routes = {"/v1/embeddings": embedding_payload}
+        async with MockServer(routes) as server:
+            provider = EmbeddingProvider(api_key="test", base_url=server.base_url,
+                                         embedding_cache=EmbeddingCache(cache_path))
+            first = await provider.generate(["a", "bb", "a"])
+            provider.embedding_cache.close()
+
+            # New process, same corpus plus one new text
+            provider.embedding_cache = EmbeddingCache(cache_path)
+            second = await provider.generate(["bb", "ccc", "a"])
+            third = await provider.generate(["a", "bb"])
+            return first, second, third, [body["input"] for body in server.bodies]
+
+    first, second, third, sent = asyncio.run(run())
+
+    assert sent == [["a", "bb"], ["ccc"]]
+    assert first.response == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert first.input_tokens == 2
+    assert second.response == [[2.0, 0.5], [3.0, 0.5], [1.0, 0.5]]
+    assert second.input_tokens == 1 and second.metadata["cached_texts"] == 2
+    assert third.raw_response is None and third.input_tokens == 0 and third.cost == 0.0
+    assert third.metadata["token_source"] == "cache"
+
+
+def test_embedding_numpy_output_decodes_base64_matrix(tmp_path):
+    np = pytest.importorskip("numpy")
+
+    async def run():
+        routes = {"/v1/embeddings": embedding_payload}
+        async with MockServer(routes) as server:
+            provider = EmbeddingProvider(api_key="test", base_url=server.base_url,
+                                         output_format="numpy", keep_raw_response=False,
+                                         embedding_cache=EmbeddingCache(str(tmp_path / "e.db")))
+            fresh = await provider.generate(["a", "bb", "ccc"])
+            mixed = await provider.generate(["dddd", "a", "a"])
+            explicit = await provider.generate(["eeeee"], encoding_format="float")
+            lookups = []
+            get_memory = provider.embedding_cache._get_memory
+
+            def record(namespace, texts, as_arrays):
+                found, missing = get_memory(namespace, texts, as_arrays)
+                lookups.append(found)
+                return found, missing
+            provider.embedding_cache._get_memory = record
+            warm = await provider.generate(["a", "bb"])
+            return fresh, mixed, explicit, warm, lookups, server.bodies
+
+    fresh, mixed, explicit, warm, lookups, bodies = asyncio.run(run())
+
+    assert all(body["encoding_format"] == "base64" for body in bodies)
+    assert fresh.raw_response is None
+    assert fresh.response.dtype == np.float32 and fresh.response.flags["C_CONTIGUOUS"]
+    assert fresh.response.tolist() == [[1.0, 0.5], [2.0, 0.5], [3.0, 0.5]]
+    assert mixed.response.tolist() == [[4.0, 0.5], [1.0, 0.5], [1.0, 0.5]]
+    # numpy output always asks for base64, even over an explicit "float"
+    assert len(bodies) == 3 and explicit.response.tolist() == [5.0, 0.5]
+    # Warm calls stack the cached float32 rows without a float-list detour
+    assert warm.response.tolist() == [[1.0, 0.5], [2.0, 0.5]]
+    assert all(not isinstance(vector, list) for vector in lookups[0].values())
+    # Both the decoded and the stacked paths can be normalized in place
+    assert fresh.response.flags["WRITEABLE"] and mixed.response.flags["WRITEABLE"]
+
+
+def test_embedding_batcher_coalesces_concurrent_calls():
+    async def run(**limits):
+        routes = {"/v1/embeddings": embedding_payload}
+        async with MockServer(routes, delay=0.05) as server:
+            provider = EmbeddingProvider(api_key="test", base_url=server.base_url)
+            batcher = EmbeddingBatcher(provider, max_wait=0.02, **limits)
+            texts = ["x" * (i % 5 + 1) for i in range(20)]
+            responses = await asyncio.gather(*(batcher.embed(text) for text in texts))
+            return texts, responses, [len(body["input"]) for body in server.bodies], batcher
+
+    texts, responses, sizes, batcher = asyncio.run(run())
+    assert sizes == [5]  # 20 calls, 5 distinct texts, one request
+    assert [r.response for r in responses] == [[float(len(t)), 0.5] for t in texts]
+    assert batcher.stats()["requests_sent"] == 1
+    # Callers share the 5 billed tokens the server reported, not their local counts
+    assert sum(r.input_tokens for r in responses) == 5
+
+    # Split by input count and by token budget
+    _, responses, sizes, _ = asyncio.run(run(max_batch_size=8))
+    assert len(sizes) == 3 and all(r.metadata["batch_size"] <= 8 for r in responses)
+    _, _, sizes, _ = asyncio.run(run(max_batch_tokens=12))
+    assert len(sizes) > 1
+
+
+def test_embedding_batcher_reports_no_billed_tokens_for_cache_hits():
+    async def run():
+        async with MockServer({"/v1/embeddings": embedding_payload}) as server:
+            provider = EmbeddingProvider(api_key="test", base_url=server.base_url,
+                                         embedding_cache=EmbeddingCache())
+            batcher = EmbeddingBatcher(provider, max_wait=0.01)
+            texts = ["alpha", "beta", "gamma"]
+            await asyncio.gather(*(batcher.embed(text) for text in texts))
+            return await asyncio.gather(*(batcher.embed(text) for text in texts))
+
+    cached = asyncio.run(run())
+
+    assert all(r.input_tokens == 0 and r.total_tokens == 0 and r.cost == 0 for r in cached)
+
+
+def test_anthropic_generate_uses_messages_usage():
+    async def run():
+        routes = {"/v1/messages": anthropic_message_payload}
+        async with MockServer(routes) as server:
+            provider = AnthropicProvider(
+                api_key="test",
+                model="claude-3-5-sonnet-20241022",
+                base_url=server.root_url
+            )
+            return await provider.generate("ping")
+
+    response = asyncio.run(run())
+
+    assert response.response == "pong"
+    assert (response.input_tokens, response.output_tokens) == (12, 3)
+    assert response.cost == round(12 / 1000 * 0.003 + 3 / 1000 * 0.015, 4)
+
+
+def test_mixed_fan_out_respects_max_concurrency():
+    delay = 0.1
+
+    async def run():
+        routes = {
+            "/v1/messages": anthropic_message_payload,
+            "/v1/chat/completions": chat_completion_payload
+        }
+        async with MockServer(routes, delay=delay) as server:
+            anthropic_provider = AnthropicProvider(
+                api_key="test", base_url=server.root_url, max_concurrency=3
+            )
+            openai_provider = ChatProvider(
+                api_key="test", model="gpt-4o", base_url=server.base_url, max_concurrency=3
+            )
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                provider.generate("ping")
+                for provider in (anthropic_provider, openai_provider)
+                for _ in range(12)
+            ))
+            return server.peak_in_flight, time.perf_counter() - started
+
+    peak, elapsed = asyncio.run(run())
+
+    # Three slots per provider, so at most six requests in flight
+    assert peak == 6
+    assert elapsed < delay * 24 / 2
+
+
+def test_chat_token_source_follows_accounting_mode():
+    def without_usage(body):
+        payload = chat_completion_payload(body)
+        del payload["usage"]
+        return payload
+
+    async def run(route, token_accounting):
+        async with MockServer({"/v1/chat/completions": route}) as server:
+            provider = ChatProvider(
+                api_key="test",
+                model="gpt-4o",
+                base_url=server.base_url,
+                token_accounting=token_accounting
+            )
+            return await provider.generate("ping")
+
+    reported = asyncio.run(run(chat_completion_payload, "usage"))
+    assert (reported.input_tokens, reported.output_tokens) == (7, 1)
+    assert reported.metadata["token_source"] == "usage"
+
+    # "ping" and "pong" are four tokens each under the byte-level test encoding
+    fallback = asyncio.run(run(without_usage, "usage"))
+    assert (fallback.input_tokens, fallback.output_tokens) == (4, 4)
+    assert fallback.metadata["token_source"] == "local"
+
+    local = asyncio.run(run(chat_completion_payload, "local"))
+    assert (local.input_tokens, local.output_tokens) == (4, 4)
+    assert local.metadata["token_source"] == "local"
+
+
+def chat_stream_payload(body):
+    assert body["stream"] is True
+
+    def chunk(delta, usage=None):
+        return {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": body["model"],
+            "choices": [] if delta is None else [
+                {"index": 0, "delta": {"content": delta}, "finish_reason": None}
+            ],
+            "usage": usage
+        }
+
+    return EventStream([
+        (None, chunk("po")),
+        (None, chunk("ng")),
+        (None, chunk(None, {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9})),
+        (None, "[DONE]")
+    ], interval=0.05)
+
+
+def anthropic_stream_payload(body):
+    assert body["stream"] is True
+    return EventStream([
+        ("message_start", {"type": "message_start", "message": {
+            "id": "msg_test", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": 12, "output_tokens": 1}
+        }}),
+        ("content_block_start", {"type": "content_block_start", "index": 0,
+                                 "content_block": {"type": "text", "text": ""}}),
+        ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                 "delta": {"type": "text_delta", "text": "po"}}),
+        ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                 "delta": {"type": "text_delta", "text": "ng"}}),
+        ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        ("message_delta", {"type": "message_delta",
+                           "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                           "usage": {"output_tokens": 3}}),
+        ("message_stop", {"type": "message_stop"})
+    ], interval=0.05)
+
+
+def test_chat_generate_stream_yields_deltas_and_final_response():
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_stream_payload}) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url)
+            return [chunk async for chunk in provider.generate_stream("ping")]
+
+    chunks = asyncio.run(run())
+
+    assert [c.delta for c in chunks] == ["po", "ng", ""]
+    assert [c.output_tokens for c in chunks[:2]] == [2, 4]
+    final = chunks[-1].response
+    assert final.response == "pong"
+    assert (final.input_tokens, final.output_tokens) == (7, 2)
+    assert final.metadata["token_source"] == "usage"
+    assert 0 < final.metadata["time_to_first_token"] < final.metadata["latency"]
+
+
+def test_abandoned_stream_settles_at_streamed_usage():
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_stream_payload}) as server:
+            limiter = RateLimitScheduler({"gpt-4o": (None, 60)}, burst_seconds=1000)
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    rate_limiter=limiter)
+            stream = provider.generate_stream("ping", max_tokens=500)
+            assert (await stream.__anext__()).delta == "po"
+            reserved = limiter._queues["gpt-4o"].tokens.level
+            await stream.aclose()
+            return reserved, limiter._queues["gpt-4o"].tokens.level
+
+    reserved, level = asyncio.run(run())
+
+    # Held while streaming, then settled at the 4 prompt tokens plus 2 streamed
+    assert reserved < 500
+    assert 994 <= level < 995
+
+
+def test_anthropic_generate_stream_reads_event_usage():
+    async def run():
+        async with MockServer({"/v1/messages": anthropic_stream_payload}) as server:
+            provider = AnthropicProvider(
+                api_key="test",
+                model="claude-3-5-haiku-20241022",
+                base_url=server.root_url
+            )
+            return [chunk async for chunk in provider.generate_stream("ping")]
+
+    chunks = asyncio.run(run())
+
+    assert "".join(c.delta for c in chunks) == "pong"
+    final = chunks[-1].response
+    assert (final.input_tokens, final.output_tokens) == (12, 3)
+    assert final.cost == round(12 / 1000 * 0.0008 + 3 / 1000 * 0.004, 4)
+    assert final.metadata["time_to_first_token"] < final.metadata["latency"]
+
+
+@pytest.mark.parametrize("provider_type", ["openai", "anthropic"])
+def test_generate_stream_applies_deadline_to_setup(provider_type):
+    if provider_type == "openai":
+        routes = {"/v1/chat/completions": chat_stream_payload}
+        make = lambda server: ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url)
+    else:
+        routes = {"/v1/messages": anthropic_stream_payload}
+        make = lambda server: AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022",
+                                                base_url=server.root_url)
+
+    async def run(delay, deadline):
+        async with MockServer(routes, delay=delay) as server:
+            started = time.perf_counter()
+            try:
+                result = [chunk async for chunk in make(server).generate_stream("ping", deadline=deadline)]
+            except Exception as e:
+                result = e
+            return result, server.bodies, time.perf_counter() - started
+
+    # The deadline bounds setup only, so a stream that outlasts it still completes
+    chunks, bodies, _ = asyncio.run(run(0.0, 0.1))
+    assert "".join(c.delta for c in chunks) == "pong"
+    assert "deadline" not in bodies[0]
+
+    error, _, elapsed = asyncio.run(run(1.0, 0.2))
+    assert isinstance(error, DeadlineExceededError) and elapsed < 0.8
+
+
+def test_router_prefers_cheapest_and_fails_over():
+    anthropic_up = [False]
+
+    def messages(body):
+        if not anthropic_up[0]:
+            return Reply({"type": "error", "error": {"type": "api_error", "message": "down"}}, status=500)
+        return anthropic_message_payload(body)
+
+    async def run():
+        routes = {"/v1/messages": messages, "/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            no_retries = RetryPolicy(max_attempts=1)
+            router = ProviderRouter([
+                ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url, retry_policy=no_retries),
+                AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022",
+                                  base_url=server.root_url, retry_policy=no_retries)
+            ], error_threshold=0.2)
+            failed_over = await router.generate("ping", max_tokens=16)
+            # The failing target is cooled down and no longer tried first
+            anthropic_up[0] = True
+            cooled = await router.generate("ping", max_tokens=16)
+            return router, failed_over, cooled
+
+    router, failed_over, cooled = asyncio.run(run())
+
+    assert failed_over.metadata["route"] == {
+        "target": "openai:gpt-4o", "failed": ["anthropic:claude-3-5-haiku-20241022"]
+    }
+    assert cooled.metadata["route"] == {"target": "openai:gpt-4o", "failed": []}
+    stats = router.stats()
+    assert stats["anthropic:claude-3-5-haiku-20241022"]["cooling_down"]
+    assert stats["openai:gpt-4o"]["requests"] == 2 and stats["openai:gpt-4o"]["latency"] > 0
+
+
+def test_router_latency_policies_and_context_windows():
+    def slow_messages(body):
+        return Reply(anthropic_message_payload(body), delay=0.2)
+
+    async def run():
+        routes = {"/v1/messages": slow_messages, "/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            router = ProviderRouter({
+                "gpt": ChatProvider(api_key="test", model="gpt-4", base_url=server.base_url),
+                "haiku": AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022",
+                                           base_url=server.root_url)
+            }, policy="slo", latency_slo=0.1)
+            # Unmeasured targets count as meeting the SLO, so the cheaper one is probed first
+            probe = await router.generate("ping", max_tokens=16)
+            within_slo = await router.generate("ping", max_tokens=16)
+            fastest = await router.generate("ping", max_tokens=16, policy="fastest")
+            return router, probe, within_slo, fastest
+
+    router, probe, within_slo, fastest = asyncio.run(run())
+
+    assert probe.metadata["route"]["target"] == "haiku"
+    assert within_slo.metadata["route"]["target"] == "gpt"
+    assert fastest.metadata["route"]["target"] == "gpt"
+    # Only the 200k-token model can hold a 10k-token prompt
+    assert [target.name for target in router.rank(10000, 256, "cheapest")] == ["haiku"]
+    assert router.rank(10 ** 6, 256) == []
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        router.rank(500, 256)
+    assert (time.perf_counter() - started) / 1000 < 0.001
+
+
+def test_router_fails_over_on_not_found_but_not_on_invalid_request():
+    status = [404]
+
+    def messages(body):
+        return Reply({"type": "error", "error": {"type": "x", "message": "nope"}}, status=status[0])
+
+    async def run():
+        routes = {"/v1/messages": messages, "/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            router = ProviderRouter([
+                ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url),
+                AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022", base_url=server.root_url)
+            ], error_threshold=1.0)
+            not_found = await router.generate("ping", max_tokens=16)
+            status[0] = 400
+            with pytest.raises(BadRequestError):
+                await router.generate("ping", max_tokens=16)
+            return not_found
+
+    not_found = asyncio.run(run())
+
+    assert not_found.metadata["route"] == {
+        "target": "openai:gpt-4o", "failed": ["anthropic:claude-3-5-haiku-20241022"]
+    }
+
+
+def test_router_skips_text_only_targets_for_message_lists():
+    async def run():
+        routes = {"/v1/messages": anthropic_message_payload, "/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            router = ProviderRouter({
+                # Cheapest, but only takes a text prompt
+                "mini": OpenAIProvider(api_key="test", model="gpt-4o-mini", base_url=server.base_url),
+                "haiku": AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022",
+                                           base_url=server.root_url)
+            })
+            messages = [{"role": "user", "content": "ping"}]
+            routed = await router.generate(messages, max_tokens=16)
+            text = await router.generate("ping", max_tokens=16)
+            return router, routed, text, server.requests
+
+    router, routed, text, requests = asyncio.run(run())
+
+    assert routed.metadata["route"] == {"target": "haiku", "failed": []}
+    assert text.metadata["route"] == {"target": "mini", "failed": []}
+    assert len(requests) == 2
+    assert router.stats()["mini"]["failures"] == 0
+
+
+def test_router_sends_system_messages_to_anthropic_as_system_prompt():
+    def messages_route(body):
+        if any(msg["role"] not in ("user", "assistant") for msg in body["messages"]):
+            return Reply({"type": "error", "error": {"type": "invalid_request_error", "message": "role"}},
+                         status=400)
+        return anthropic_message_payload(body)
+
+    async def run():
+        routes = {"/v1/messages": messages_route, "/v1/chat/completions": chat_completion_payload}
+        async with MockServer(routes) as server:
+            router = ProviderRouter({
+                "gpt": ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url),
+                # Cheaper, so ranked first
+                "haiku": AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022",
+                                           base_url=server.root_url)
+            })
+            conversation = [
+                {"role": "system", "content": "Be brief."},
+                {"role": "user", "content": "ping"}
+            ]
+            with_system = await router.generate(conversation, max_tokens=16)
+            call = {"id": "call_1", "type": "function", "function": {"name": "lookup", "arguments": "{}"}}
+            with_tools = await router.generate(conversation + [
+                {"role": "assistant", "content": None, "tool_calls": [call]},
+                {"role": "tool", "tool_call_id": "call_1", "content": "found"}
+            ], max_tokens=16)
+            return with_system, with_tools, server.bodies
+
+    with_system, with_tools, bodies = asyncio.run(run())
+
+    assert with_system.metadata["route"] == {"target": "haiku", "failed": []}
+    assert bodies[0]["system"] == "Be brief."
+    assert bodies[0]["messages"] == [{"role": "user", "content": "ping"}]
+    # Tool turns cannot be sent to the Messages API as-is, so the OpenAI target takes them
+    assert with_tools.metadata["route"] == {"target": "gpt", "failed": []}
+
+
+def test_router_reprices_targets_when_the_catalog_changes():
+    router = ProviderRouter([
+        ChatProvider(api_key="test", model="gpt-4o"),
+        AnthropicProvider(api_key="test", model="claude-3-5-haiku-20241022")
+    ])
+    assert router.rank(100, 100)[0].name == "anthropic:claude-3-5-haiku-20241022"
+
+    original = pricing_catalog.to_dict()
+    # Same version string, so only the swap itself signals the change
+    table = pricing_catalog.to_dict()
+    table["providers"]["anthropic"]["models"]["claude-3-5-haiku-20241022"]["input_token_cost"] = 1.0
+    pricing_catalog.swap(table)
+    try:
+        assert router.rank(100, 100)[0].name == "openai:gpt-4o"
+    finally:
+        pricing_catalog.swap(original)
+    assert router.rank(100, 100)[0].name == "anthropic:claude-3-5-haiku-20241022"
+
+
+def test_chat_preflight_rejects_oversized_prompt_without_sending():
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_completion_payload}) as server:
+            # gpt-4 has an 8192-token window; the test encoding is one token per byte
+            provider = ChatProvider(api_key="test", model="gpt-4", base_url=server.base_url)
+            with pytest.raises(ContextWindowExceededError):
+                await provider.generate("x" * 8000, max_tokens=500)
+            dropped = await provider.generate([
+                {"role": "user", "content": "x" * 8000},
+                {"role": "assistant", "content": "ok"},
+                {"role": "user", "content": "ping"}
+            ], max_tokens=500, context_policy="drop_oldest")
+            return server, dropped
+
+    server, dropped = asyncio.run(run())
+
+    assert len(server.requests) == 1
+    assert [msg["content"] for msg in server.bodies[0]["messages"]] == ["ping"]
+    assert dropped.response == "pong"
+
+
+def test_chat_preflight_accepts_tool_calls_and_multipart_content():
+    messages = [
+        {"role": "user", "content": [{"type": "text", "text": "weather?"},
+                                     {"type": "image_url", "image_url": {"url": "https://example.com/a.png"}}]},
+        {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_1", "type": "function", "function": {"name": "weather", "arguments": "{}"}
+        }]},
+        {"role": "tool", "tool_call_id": "call_1", "content": "sunny"}
+    ]
+
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_completion_payload}) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4o", base_url=server.base_url,
+                                    rate_limiter=RateLimitScheduler())
+            return server, await provider.generate(messages, max_tokens=16)
+
+    server, response = asyncio.run(run())
+
+    assert response.response == "pong"
+    assert server.bodies[0]["messages"] == messages
+
+
+def test_chat_chunk_policy_maps_over_chunks():
+    async def run():
+        async with MockServer({"/v1/chat/completions": chat_completion_payload}) as server:
+            provider = ChatProvider(api_key="test", model="gpt-4", base_url=server.base_url,
+                                    context_policy="chunk")
+            return server, await provider.generate("x" * 20000, max_tokens=100)
+
+    server, response = asyncio.run(run())
+
+    assert len(server.requests) == 3
+    assert all(len(body["messages"][0]["content"]) <= 8092 for body in server.bodies)
+    assert response.response == "pong\n\npong\n\npong"
+    assert (response.input_tokens, response.output_tokens) == (21, 3)
+    assert response.metadata["chunks"] == 3 and len(response.metadata["chunk_responses"]) == 3
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import src.providers.openai as openai_providers
+from src.providers.openai.chat import ChatProvider
+from src.providers.openai.openai_provider import OpenAIProvider
+from src.utils.error_handler import RetryPolicy
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code):
+    # A fresh interpreter, since this process has already imported everything
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def test_imports_and_construction_do_not_load_sdks():
+    loaded = run_python(
+        "import sys\n"
+        "from src.providers.openai import ChatProvider, EmbeddingProvider, OpenAIProvider\n"
+        "from src.providers.anthropic_provider import AnthropicProvider\n"
+        "from src.providers.router import ProviderRouter\n"
+        "ProviderRouter([ChatProvider(api_key='test', model='gpt-4o'),\n"
+        "                AnthropicProvider(api_key='test', model='claude-3-5-haiku-20241022')])\n"
+        "EmbeddingProvider(api_key='test')\n"
+        "OpenAIProvider(api_key='test', model='gpt-4o')\n"
+        "print(','.join(m for m in ('openai', 'anthropic', 'tiktoken') if m in sys.modules))"
+    )
+
+    assert loaded == ""
+
+
+def test_package_exports_resolve_lazily():
+    assert openai_providers.ChatProvider is ChatProvider
+    assert "EmbeddingProvider" in dir(openai_providers)
+    with pytest.raises(AttributeError):
+        openai_providers.MissingProvider
+
+
+@pytest.mark.parametrize("provider_class", [ChatProvider, OpenAIProvider])
+def test_client_is_built_once_on_first_use(provider_class):
+    provider = provider_class(api_key="test", model="gpt-4o", base_url="http://localhost:1/v1",
+                              retry_policy=RetryPolicy())
+    assert provider._async_client is None
+
+    client = provider.async_client
+
+    assert provider.async_client is client
+    assert str(client.base_url).startswith("http://localhost:1/v1")
+    # The retry policy owns retries, so the lazily built client must not add its own
+    assert client.max_retries == 0
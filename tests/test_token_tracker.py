@@ -0,0 +1,300 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from src.core.rollups import QuantileSketch, TimeRollups
+from src.core.token_tracker import ConcurrentTokenTracker, TokenTracker, TokenUsageEntry
+from src.core.usage_store import UsageLogStore
+from src.models.user_log import JSONLUsageSink, SQLiteUsageSink
+
+
+def test_track_tokens_updates_aggregates():
+    tracker = TokenTracker()
+
+    tracker.track_tokens("OpenAI", 10, 5, model="gpt-4o")
+    tracker.track_tokens("OpenAI", 3, 2, model="gpt-4o-mini")
+    tracker.track_tokens("Anthropic", 1, 1)
+
+    assert tracker.get_total_tokens() == 22
+    assert tracker.get_provider_tokens("OpenAI") == 20
+    assert tracker.get_provider_tokens() == {"OpenAI": 20, "Anthropic": 2}
+    assert tracker.get_model_tokens("gpt-4o") == 15
+    assert tracker.get_model_tokens() == {"gpt-4o": 15, "gpt-4o-mini": 5}
+
+
+def test_usage_log_keeps_simultaneous_entries():
+    tracker = TokenTracker()
+
+    for _ in range(100):
+        tracker.track_tokens("OpenAI", 1, 1, model="gpt-4o")
+
+    entries = tracker.get_usage_rows()
+    assert len(entries) == 100
+    assert all(isinstance(entry, TokenUsageEntry) for entry in entries)
+    assert entries[0].model == "gpt-4o"
+
+    # The dict-shaped log keeps every entry under a distinct timestamp key
+    log = tracker.get_usage_log()
+    assert len(log) == 100
+    assert list(log.values()) == entries
+    assert str(entries[0].timestamp) in log
+
+
+def test_usage_log_is_bounded_but_aggregates_are_not():
+    tracker = TokenTracker(max_entries=3)
+
+    for i in range(5):
+        tracker.track_tokens("OpenAI", i, 0)
+
+    assert [entry.input_tokens for entry in tracker.iter_usage()] == [2, 3, 4]
+    assert tracker.get_total_tokens() == 10
+
+
+def test_usage_store_interns_names():
+    store = UsageLogStore(max_entries=4)
+
+    store.append(1.0, "OpenAI", "gpt-4o", 1, 2)
+    store.append(2.0, "OpenAI", None, 3, 4)
+
+    assert list(store) == [(1.0, "OpenAI", "gpt-4o", 1, 2), (2.0, "OpenAI", None, 3, 4)]
+    assert store.intern("OpenAI") == 1
+
+
+def test_concurrent_tracker_loses_no_counts():
+    tracker = ConcurrentTokenTracker(num_shards=4)
+    workers, calls = 8, 2000
+
+    def work():
+        for _ in range(calls):
+            tracker.track_tokens("OpenAI", 2, 1, model="gpt-4o")
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    # Reads racing the writers must always see provider and total agree
+    while any(thread.is_alive() for thread in threads):
+        snapshot = tracker.snapshot()
+        assert snapshot.total_tokens == sum(snapshot.provider_tokens.values())
+    for thread in threads:
+        thread.join()
+
+    assert tracker.get_total_tokens() == workers * calls * 3
+    assert tracker.get_model_tokens("gpt-4o") == workers * calls * 3
+    assert len(tracker.get_usage_rows()) == workers * calls
+
+
+def test_concurrent_tracker_usage_log_is_ordered_and_bounded():
+    tracker = ConcurrentTokenTracker(max_entries=5, num_shards=2)
+
+    def work(offset):
+        for i in range(5):
+            tracker.track_tokens("OpenAI", offset + i, 0)
+
+    for offset in (0, 100):
+        thread = threading.Thread(target=work, args=(offset,))
+        thread.start()
+        thread.join()
+
+    # Each of the two shards keeps ceil(5 / 2) = 3 entries; the merge keeps the newest 5
+    entries = tracker.get_usage_rows()
+    assert [entry.input_tokens for entry in entries] == [3, 4, 102, 103, 104]
+    timestamps = [entry.timestamp for entry in entries]
+    assert timestamps == sorted(timestamps)
+    assert sum(shard._usage_log.max_entries for shard in tracker._shards) <= 6
+
+
+@pytest.mark.parametrize("sink_class, filename", [
+    (JSONLUsageSink, "usage.jsonl"),
+    (SQLiteUsageSink, "usage.db")
+])
+def test_sink_persists_and_rehydrates(tmp_path, sink_class, filename):
+    sink = sink_class(str(tmp_path / filename), batch_size=3, flush_interval=60)
+    tracker = TokenTracker(sink=sink)
+    tracker.track_tokens("OpenAI", 10, 5, model="gpt-4o", cost=0.25)
+    tracker.track_tokens("OpenAI", 1, 1, model="gpt-4o-mini", cost=0.5)
+    tracker.track_tokens("Anthropic", 2, 2, cost=0.125)
+    tracker.track_tokens("Anthropic", 4, 0)
+    sink.close()
+
+    restored = TokenTracker()
+    sink_class(str(tmp_path / filename)).rehydrate(restored)
+
+    # Cost comes back as charged, whatever the catalog says now
+    assert restored.snapshot() == tracker.snapshot()
+    assert restored.get_total_cost() == 0.875
+    assert restored.get_provider_cost("Anthropic") == 0.125
+    assert restored.get_model_cost("gpt-4o") == 0.25
+    assert len(list(sink.iter_rows())) == 4
+
+
+def test_sink_flushes_on_interval(tmp_path):
+    sink = JSONLUsageSink(str(tmp_path / "usage.jsonl"), batch_size=1000, flush_interval=0.05)
+    try:
+        sink.submit((1.0, "OpenAI", "gpt-4o", 1, 2, 0.0))
+        deadline = time.monotonic() + 2
+        while not list(sink.iter_rows()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert list(sink.iter_rows()) == [(1.0, "OpenAI", "gpt-4o", 1, 2, 0.0)]
+    finally:
+        sink.close()
+
+
+def test_jsonl_sink_skips_torn_line(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    path.write_text('{"timestamp": 1.0, "provider": "OpenAI", "model": null, '
+                    '"input_tokens": 1, "output_tokens": 1}\n{"timestamp": 2.0, "prov')
+    sink = JSONLUsageSink(str(path))
+    sink.close()
+
+    assert sink.load_aggregates().total_tokens == 2
+
+
+def test_jsonl_sink_appends_after_torn_line(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    path.write_text('{"timestamp": 1.0, "provider": "OpenAI", "model": null, '
+                    '"input_tokens": 1, "output_tokens": 1}\n{"timestamp": 2.0, "prov')
+    sink = JSONLUsageSink(str(path), batch_size=1)
+    sink.submit((3.0, "OpenAI", None, 1, 1, 0.0))
+    sink.submit((4.0, "OpenAI", None, 1, 1, 0.0))
+    sink.close()
+
+    assert [row[0] for row in sink.iter_rows()] == [1.0, 3.0, 4.0]
+
+
+def test_sink_survives_failed_write(tmp_path):
+    class FlakySink(JSONLUsageSink):
+        failures = 1
+
+        def _write_batch(self, batch):
+            if self.failures:
+                self.failures -= 1
+                raise OSError("disk full")
+            super()._write_batch(batch)
+
+    sink = FlakySink(str(tmp_path / "usage.jsonl"), batch_size=1, max_queue=2)
+    sink.submit((1.0, "OpenAI", None, 1, 1, 0.0))
+    assert sink.flush(timeout=2)
+    sink.submit((2.0, "OpenAI", None, 1, 1, 0.0))
+    sink.close(timeout=2)
+
+    assert not sink._thread.is_alive()
+    assert (sink.write_errors, sink.dropped) == (1, 1)
+    assert [row[0] for row in sink.iter_rows()] == [2.0]
+
+
+def test_sink_bounds_unwritten_rows_to_one_batch(tmp_path):
+    release = threading.Event()
+
+    class StalledSink(JSONLUsageSink):
+        def _write_batch(self, batch):
+            release.wait(5)
+            super()._write_batch(batch)
+
+    sink = StalledSink(str(tmp_path / "usage.jsonl"), batch_size=2, flush_interval=60, block=False)
+    for i in range(5):
+        sink.submit((float(i), "OpenAI", None, 1, 1, 0.0))
+    assert sink.dropped == 3
+
+    release.set()
+    sink.close(timeout=2)
+    assert [row[0] for row in sink.iter_rows()] == [0.0, 1.0]
+
+
+def test_sink_blocks_submit_until_the_writer_catches_up(tmp_path):
+    sink = JSONLUsageSink(str(tmp_path / "usage.jsonl"), batch_size=2, flush_interval=0.05)
+    for i in range(5):
+        sink.submit((float(i), "OpenAI", None, 1, 1, 0.0))
+    sink.close(timeout=2)
+
+    assert sink.dropped == 0
+    assert [row[0] for row in sink.iter_rows()] == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+@pytest.mark.parametrize("sink_class", [JSONLUsageSink, SQLiteUsageSink])
+def test_sink_fails_fast_when_the_log_cannot_be_opened(tmp_path, sink_class):
+    with pytest.raises((OSError, sqlite3.Error)):
+        sink_class(str(tmp_path / "missing" / "usage.log"))
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_sink_does_not_hang_after_the_writer_stops(tmp_path):
+    class DyingSink(JSONLUsageSink):
+        def _write_batch(self, batch):
+            # Escapes the writer's error handling and ends the thread
+            raise SystemExit
+
+    sink = DyingSink(str(tmp_path / "usage.jsonl"), batch_size=1)
+    sink.submit((1.0, "OpenAI", None, 1, 1, 0.0))
+    sink._thread.join(2)
+
+    started = time.monotonic()
+    assert not sink.flush()
+    assert time.monotonic() - started < 1
+    sink.submit((2.0, "OpenAI", None, 1, 1, 0.0))
+    assert sink.dropped == 1
+    sink.close()
+
+def test_rollups_answer_windowed_queries():
+    rollups = TimeRollups()
+    now = 1_700_000_000.0
+    rollups.record(now - 7200, "OpenAI", "gpt-4o", 100, 0, 0.5)
+    rollups.record(now - 30, "OpenAI", "gpt-4o", 10, 5, 0.1)
+    rollups.record(now, "OpenAI", "gpt-4o-mini", 1, 1, 0.01)
+
+    last_hour = rollups.totals(now - 3600, "minute")
+    assert last_hour[("OpenAI", "gpt-4o")].total_tokens == 15
+    assert last_hour[("OpenAI", "gpt-4o-mini")].requests == 1
+
+    by_day = rollups.totals(now - 86400, "day")
+    assert by_day[("OpenAI", "gpt-4o")].requests == 2
+
+    series = rollups.series("hour", model="gpt-4o")
+    assert [totals.total_tokens for _, totals in series] == [100, 15]
+
+
+def test_rollups_keep_a_bounded_number_of_buckets():
+    rollups = TimeRollups()
+    for minute in range(2 * 24 * 60):
+        rollups.record(minute * 60.0, "OpenAI", "gpt-4o", 1, 0)
+
+    assert len(rollups.series("minute")) == 24 * 60
+
+
+def test_quantile_sketch_is_within_relative_accuracy():
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in range(1, 10001):
+        sketch.add(value)
+
+    for q, expected in [(0.5, 5000), (0.9, 9000), (0.99, 9900)]:
+        assert abs(sketch.quantile(q) - expected) <= expected * 0.011
+
+
+def test_tracker_exposes_rollups_and_percentiles():
+    tracker = ConcurrentTokenTracker(num_shards=2)
+    for tokens in range(1, 101):
+        tracker.track_tokens("OpenAI", tokens, 0, model="gpt-4o", cost=tokens / 100)
+
+    assert tracker.get_usage_since(3600)[("OpenAI", "gpt-4o")].total_tokens == 5050
+    percentiles = tracker.get_percentiles((0.5,))
+    assert abs(percentiles["tokens_per_request"][0.5] - 50) <= 1
+    assert abs(percentiles["cost_per_request"][0.5] - 0.5) <= 0.01
+
+
+def test_concurrent_rollup_view_does_not_alias_shards():
+    tracker = ConcurrentTokenTracker(num_shards=2)
+
+    def work():
+        tracker.track_tokens("OpenAI", 10, 0, model="gpt-4o", cost=0.1)
+
+    for _ in range(2):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    rollups, tokens_sketch, _ = tracker._rollup_view()
+    assert rollups.totals(0)[("OpenAI", "gpt-4o")].requests == 2
+    assert tokens_sketch.count == 2
+    # Merging must not have folded one shard into another's live state
+    assert [shard._tokens_sketch.count for shard in tracker._shards] == [1, 1]
+    assert tracker.get_usage_since(3600)[("OpenAI", "gpt-4o")].requests == 2
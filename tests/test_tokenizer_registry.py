@@ -0,0 +1,110 @@
+import threading
+
+import tiktoken
+
+from src.core.tokenizer_registry import TokenCountCache, TokenizerRegistry
+
+
+TEST_ENCODING = tiktoken.Encoding(
+    name="test_bytes",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+
+def test_registry_resolves_each_model_once(monkeypatch):
+    calls = []
+
+    def encoding_for_model(model):
+        calls.append(model)
+        return TEST_ENCODING
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", encoding_for_model)
+    TokenizerRegistry.clear()
+    try:
+        threads = [
+            threading.Thread(target=TokenizerRegistry.get_encoding, args=("gpt-4o",))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert TokenizerRegistry.get_encoding("gpt-4o") is TEST_ENCODING
+        assert calls == ["gpt-4o"]
+    finally:
+        TokenizerRegistry.clear()
+
+
+def test_registry_falls_back_to_default_encoding(monkeypatch):
+    def unknown_model(model):
+        raise KeyError(model)
+
+    def get_encoding(name):
+        if name != "cl100k_base":
+            raise ValueError(name)
+        return TEST_ENCODING
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", unknown_model)
+    monkeypatch.setattr(tiktoken, "get_encoding", get_encoding)
+    TokenizerRegistry.clear()
+    try:
+        assert TokenizerRegistry.get_encoding("not-a-model") is TEST_ENCODING
+    finally:
+        TokenizerRegistry.clear()
+
+
+def test_token_count_cache_hits_and_evicts():
+    cache = TokenCountCache(max_entries=2)
+
+    assert cache.count(TEST_ENCODING, "system prompt") == 13
+    assert cache.count(TEST_ENCODING, "system prompt") == 13
+    cache.count(TEST_ENCODING, "a")
+    cache.count(TEST_ENCODING, "b")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    # The oldest entry was evicted, so counting it again is a miss
+    cache.count(TEST_ENCODING, "system prompt")
+    assert cache.stats()["misses"] == 4
+
+
+def test_count_tokens_batch_matches_serial_counts():
+    TokenizerRegistry.clear()
+    texts = [f"message number {i}" for i in range(40)] + ["message number 3"]
+
+    counts = TokenizerRegistry.count_tokens_batch(TEST_ENCODING, texts, num_threads=4)
+
+    assert counts == [len(TEST_ENCODING.encode(text)) for text in texts]
+    stats = TokenizerRegistry.token_cache.stats()
+    # The trailing duplicate is encoded once and cached once
+    assert stats["size"] == 40
+
+    # A second pass is served entirely from the cache
+    assert TokenizerRegistry.count_tokens_batch(TEST_ENCODING, texts, num_threads=4) == counts
+    assert TokenizerRegistry.token_cache.stats()["hits"] == len(texts)
+    TokenizerRegistry.clear()
+
+
+def test_special_token_text_counts_the_same_on_every_path():
+    encoding = tiktoken.Encoding(
+        name="test_bytes_special",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={"<|endoftext|>": 256}
+    )
+    text = "user says <|endoftext|>"
+
+    TokenizerRegistry.clear()
+    try:
+        # User text is counted as plain text, never rejected as a special token
+        assert TokenizerRegistry.count_tokens(encoding, text) == len(text)
+        TokenizerRegistry.clear()
+        assert TokenizerRegistry.count_tokens_batch(encoding, [text]) == [len(text)]
+        assert TokenizerRegistry.count_tokens(encoding, text) == len(text)
+    finally:
+        TokenizerRegistry.clear()